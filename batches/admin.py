@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import HarvestBatch, Activity, Commodity
+from .models import HarvestBatch, Activity, Commodity, HarvestRollup, RiskRuleSet
 
 # Register your models here.
 admin.site.register(HarvestBatch)
 admin.site.register(Activity)
-admin.site.register(Commodity)
\ No newline at end of file
+admin.site.register(Commodity)
+admin.site.register(RiskRuleSet)
+admin.site.register(HarvestRollup)
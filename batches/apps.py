@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BatchesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'batches'
+
+    def ready(self):
+        import batches.checks
+        import batches.signals
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# backend cache yang isinya hanya terlihat oleh proses yang menulisnya
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def check_trace_cache(app_configs, **kwargs):
+    """
+    Versi snapshot trace (batches/trace.py) dan versi rule set aktif
+    (batches/rules.py) diganti oleh proses yang menulis data: gunicorn worker
+    lain, process_labtest_queue, lab_feed_listener, import_data. Dengan cache
+    per proses invalidasi itu tidak pernah sampai ke proses web, jadi
+    production wajib memakai cache bersama.
+    """
+    if not getattr(settings, "PRODUCTION", False):
+        return []
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"Cache default ({backend}) tidak dibagi antar proses: invalidasi trace "
+        "dari worker / management command tidak terlihat oleh proses web.",
+        hint="Isi REDIS_URL (lihat CACHES di jejak_air/settings.py) atau pakai cache bersama lain.",
+        id="batches.E001",
+    )]
@@ -1,6 +1,6 @@
 # batches/forms.py
 from django import forms
-from .models import HarvestBatch, Activity
+from .models import HarvestBatch, Activity, Commodity
 from farms.models import Farm
 
 
@@ -39,3 +39,72 @@ class ActivityManualForm(forms.ModelForm):
         widgets = {
             "tanggal": forms.DateInput(attrs={"type": "date"}),
         }
+
+
+class BatchFilterForm(forms.Form):
+    """Filter + urutan halaman daftar batch (GET). Semua field opsional."""
+
+    SORT_CHOICES = [
+        ("terbaru", "Terbaru dibuat"),
+        ("terlama", "Terlama dibuat"),
+        ("panen", "Tanggal panen terbaru"),
+    ]
+
+    farm = forms.ModelChoiceField(
+        queryset=Farm.objects.none(), required=False, label="Tambak", empty_label="Semua tambak"
+    )
+    commodity = forms.ModelChoiceField(
+        queryset=Commodity.objects.order_by("name"),
+        required=False,
+        label="Komoditas",
+        empty_label="Semua komoditas",
+    )
+    quality_status = forms.ChoiceField(
+        choices=[("", "Semua status mutu")] + HarvestBatch.QUALITY_CHOICES,
+        required=False,
+        label="Status mutu",
+    )
+    status = forms.ChoiceField(
+        choices=[("", "Semua status kirim")] + HarvestBatch.SHIPMENT_STATUS_CHOICES,
+        required=False,
+        label="Status kirim",
+    )
+    panen_dari = forms.DateField(
+        required=False, label="Panen dari", widget=forms.DateInput(attrs={"type": "date"})
+    )
+    panen_sampai = forms.DateField(
+        required=False, label="Panen sampai", widget=forms.DateInput(attrs={"type": "date"})
+    )
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False, label="Urutkan")
+
+    def __init__(self, *args, **kwargs):
+        profile = kwargs.pop("profile", None)
+        super().__init__(*args, **kwargs)
+        if profile is not None:
+            self.fields["farm"].queryset = Farm.objects.filter(owner=profile).order_by("name")
+
+    def filter(self, queryset, ignore=()):
+        """
+        Terapkan filter yang valid ke queryset batch; field yang tidak valid
+        diabaikan, begitu juga field di `ignore`.
+        """
+        self.is_valid()
+        data = {name: value for name, value in self.cleaned_data.items() if name not in ignore}
+        if data.get("farm"):
+            queryset = queryset.filter(farm=data["farm"])
+        if data.get("commodity"):
+            queryset = queryset.filter(commodity=data["commodity"])
+        if data.get("quality_status"):
+            queryset = queryset.filter(quality_status=data["quality_status"])
+        if data.get("status"):
+            queryset = queryset.filter(shipment_status=data["status"])
+        if data.get("panen_dari"):
+            queryset = queryset.filter(tanggal_panen__gte=data["panen_dari"])
+        if data.get("panen_sampai"):
+            queryset = queryset.filter(tanggal_panen__lte=data["panen_sampai"])
+        return queryset
+
+    @property
+    def sort_key(self) -> str:
+        self.is_valid()
+        return self.cleaned_data.get("sort") or "terbaru"
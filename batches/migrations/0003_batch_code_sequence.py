@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    """Isi BatchCodeSequence dari suffix terbesar kode_batch yang sudah ada."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    BatchCodeSequence = apps.get_model("batches", "BatchCodeSequence")
+
+    last = {}
+    for kode in HarvestBatch.objects.values_list("kode_batch", flat=True).iterator():
+        prefix, _, suffix = kode.rpartition("-")
+        try:
+            last[prefix] = max(last.get(prefix, 0), int(suffix))
+        except ValueError:
+            continue
+
+    BatchCodeSequence.objects.bulk_create(
+        [BatchCodeSequence(prefix=prefix, last_value=value) for prefix, value in last.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchCodeSequence',
+            fields=[
+                ('prefix', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+    ]
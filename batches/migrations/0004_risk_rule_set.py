@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0003_batch_code_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskRuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('catatan', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ratio_low', models.FloatField(default=0.5)),
+                ('ratio_mid', models.FloatField(default=0.8)),
+                ('base_low', models.PositiveIntegerField(default=30)),
+                ('base_mid', models.PositiveIntegerField(default=50)),
+                ('base_high', models.PositiveIntegerField(default=75)),
+                ('base_masalah', models.PositiveIntegerField(default=90)),
+                ('farm_low_max', models.PositiveIntegerField(default=40)),
+                ('farm_mid_max', models.PositiveIntegerField(default=70)),
+                ('penalty_mid', models.PositiveIntegerField(default=10)),
+                ('penalty_high', models.PositiveIntegerField(default=20)),
+                ('max_risk', models.PositiveIntegerField(default=100)),
+                ('shipment_risk_cutoff', models.PositiveIntegerField(default=70)),
+                ('farm_ratio_low', models.FloatField(default=0.1)),
+                ('farm_ratio_mid', models.FloatField(default=0.3)),
+                ('farm_score_empty', models.PositiveIntegerField(default=30)),
+                ('farm_score_low', models.PositiveIntegerField(default=30)),
+                ('farm_score_mid', models.PositiveIntegerField(default=60)),
+                ('farm_score_high', models.PositiveIntegerField(default=85)),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:14
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def backfill_shipment_status(apps, schema_editor):
+    """Isi shipment_status dari is_shipped + risk_score dan cutoff rule set aktif."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    RiskRuleSet = apps.get_model("batches", "RiskRuleSet")
+
+    rules = RiskRuleSet.objects.filter(is_active=True).order_by("-version").first()
+    cutoff = rules.shipment_risk_cutoff if rules is not None else 70
+    HarvestBatch.objects.update(
+        shipment_status=Case(
+            When(is_shipped=True, then=Value("SUDAH_DIKIRIM")),
+            When(risk_score__isnull=True, then=Value("BELUM_DITINJAU")),
+            When(risk_score__lt=cutoff, then=Value("LAYAK_KIRIM")),
+            default=Value("DITAHAN"),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0004_risk_rule_set'),
+        ('farms', '0003_farm_risk_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvestbatch',
+            name='shipment_status',
+            field=models.CharField(choices=[('BELUM_DITINJAU', 'Belum ditinjau'), ('LAYAK_KIRIM', 'Layak kirim'), ('DITAHAN', 'Ditahan'), ('SUDAH_DIKIRIM', 'Sudah dikirim')], db_index=True, default='BELUM_DITINJAU', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['farm', 'shipment_status'], name='batch_farm_shipment_idx'),
+        ),
+        migrations.RunPython(backfill_shipment_status, migrations.RunPython.noop),
+    ]
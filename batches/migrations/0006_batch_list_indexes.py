@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0005_shipment_status_field'),
+        ('farms', '0003_farm_risk_bucket'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['created_at', 'kode_batch'], name='batch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['tanggal_panen', 'kode_batch'], name='batch_panen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['farm', 'created_at', 'kode_batch'], name='batch_farm_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['commodity', 'created_at', 'kode_batch'], name='batch_commodity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['quality_status', 'created_at', 'kode_batch'], name='batch_quality_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvestbatch',
+            index=models.Index(fields=['shipment_status', 'created_at', 'kode_batch'], name='batch_shipment_created_idx'),
+        ),
+    ]
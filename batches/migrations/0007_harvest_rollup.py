@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_batch_list_indexes'),
+        ('farms', '0004_farm_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HarvestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('province', models.CharField(blank=True, max_length=100)),
+                ('month', models.DateField(blank=True, help_text='Tanggal 1 bulan panen', null=True)),
+                ('jumlah_batch', models.IntegerField(default=0)),
+                ('volume_kg', models.FloatField(default=0)),
+                ('ditahan', models.IntegerField(default=0)),
+                ('dikirim', models.IntegerField(default=0)),
+                ('volume_dikirim_kg', models.FloatField(default=0)),
+                ('diuji', models.IntegerField(default=0)),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='farms.city')),
+                ('commodity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='batches.commodity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['province', 'city', 'commodity', 'month'], name='harvest_rollup_level_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,11 @@
-from datetime import timezone
 from django.db import models
-from batches.utils import generate_batch_code
-from farms.models import Farm
+from django.db.models import Case, ExpressionWrapper, Value, When
+from django.db.models.functions import Cast, Least
+from django.db.models.lookups import Exact, IsNull, LessThan, LessThanOrEqual
+from batches.rules import get_active_rule_set
+from batches.utils import create_default_activities, generate_batch_code
+from farms.models import City, Farm
+from batches.state import BATCH_STATE_FIELDS, batch_state, combine_side_effects
 
 # Create your models here.
 
@@ -11,6 +15,12 @@ class HarvestBatch(models.Model):
         ("PENDING", "Dalam Pengecekan"),
         ("MASALAH", "Bermasalah"),
     ]
+    SHIPMENT_STATUS_CHOICES = [
+        ("BELUM_DITINJAU", "Belum ditinjau"),
+        ("LAYAK_KIRIM", "Layak kirim"),
+        ("DITAHAN", "Ditahan"),
+        ("SUDAH_DIKIRIM", "Sudah dikirim"),
+    ]
 
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name="batches")
     kode_batch = models.CharField(max_length=50, unique=True, blank=True, primary_key=True)
@@ -40,32 +50,73 @@ class HarvestBatch(models.Model):
     # menandai apakah batch ini sudah benar-benar dikirim
     is_shipped = models.BooleanField(default=False)
 
+    # turunan is_shipped + risk_score + cutoff rule set, disimpan supaya bisa
+    # difilter / dihitung di SQL; diisi ulang setiap save() dan di jalur bulk
+    shipment_status = models.CharField(
+        max_length=20,
+        choices=SHIPMENT_STATUS_CHOICES,
+        default="BELUM_DITINJAU",
+        editable=False,
+        db_index=True,
+    )
+
     class Meta:
         ordering = ["-created_at"]
+        # batch_list: setiap filter + urutan keyset (..., kode_batch) punya index
+        # sendiri, jadi halaman dibaca berurutan dari index tanpa sort
+        indexes = [
+            models.Index(fields=["created_at", "kode_batch"], name="batch_created_idx"),
+            models.Index(fields=["tanggal_panen", "kode_batch"], name="batch_panen_idx"),
+            models.Index(fields=["farm", "created_at", "kode_batch"], name="batch_farm_created_idx"),
+            models.Index(fields=["commodity", "created_at", "kode_batch"], name="batch_commodity_created_idx"),
+            models.Index(fields=["quality_status", "created_at", "kode_batch"], name="batch_quality_created_idx"),
+            models.Index(fields=["shipment_status", "created_at", "kode_batch"], name="batch_shipment_created_idx"),
+            models.Index(fields=["farm", "shipment_status"], name="batch_farm_shipment_idx"),
+        ]
 
     def __str__(self):
         return self.kode_batch
 
-    @property
-    def shipment_status(self) -> str:
+    # field yang menentukan posisi batch di FarmRiskBucket
+    RISK_BUCKET_FIELDS = {"farm", "farm_id", "tanggal_panen", "quality_status"}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # state saat dibaca (batches.state), pembanding bersama untuk
+        # FarmRiskBucket / FarmSummary / HarvestRollup di signal dan jalur bulk
+        if BATCH_STATE_FIELDS <= instance.__dict__.keys():
+            instance._batch_state = batch_state(instance)
+        return instance
+
+    # field yang menentukan kontribusi batch ke FarmSummary
+    FARM_SUMMARY_FIELDS = {"farm", "farm_id", "quality_status", "is_shipped", "volume_kg", "risk_score"}
+
+    # field yang menentukan kontribusi batch ke HarvestRollup
+    HARVEST_ROLLUP_FIELDS = {
+        "farm", "farm_id", "commodity", "commodity_id", "tanggal_panen",
+        "volume_kg", "is_shipped", "risk_score", "shipment_status",
+    }
+
+    # field yang menentukan shipment_status
+    SHIPMENT_FIELDS = {"is_shipped", "risk_score"}
+
+    def compute_shipment_status(self, rules=None) -> str:
         """
         - jika is_shipped = True -> SUDAH_DIKIRIM
         - jika risk_score belum ada -> BELUM_DITINJAU
-        - jika risk_score < 70  -> LAYAK_KIRIM
-        - jika risk_score >= 70 -> DITAHAN
+        - jika risk_score < cutoff rule set (default 70)  -> LAYAK_KIRIM
+        - jika risk_score >= cutoff                       -> DITAHAN
         """
-        if self.is_shipped:
-            return "SUDAH_DIKIRIM"
-
-        if self.risk_score is None:
-            return "BELUM_DITINJAU"
+        return (rules or get_active_rule_set()).shipment_status(self.is_shipped, self.risk_score)
 
-        if self.risk_score < 70:
-            return "LAYAK_KIRIM"
-        return "DITAHAN"
-    
     def save(self, *args, **kwargs):
         is_new = self._state.adding # True kalau ini pertama kali disimpan
+
+        self.shipment_status = self.compute_shipment_status()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.SHIPMENT_FIELDS & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "shipment_status"}
         
         # Auto-generate kode_batch kalau belum diisi
         if is_new and not self.kode_batch:
@@ -74,48 +125,12 @@ class HarvestBatch(models.Model):
                 self.tanggal_panen,
             )
 
-        super().save(*args, **kwargs)
-
-        if is_new:
-            farm = self.farm
-            pelaku = farm.name
-
-            owner_profile = getattr(farm, "owner", None) # ini UserProfile atau None
-            if owner_profile is not None:
-                user = getattr(owner_profile, "user", None)
-                if user is not None:
-                    pelaku = user.get_full_name() or user.username
-
-            # PENEBARAN (kalau tanggal_tebar ada)
-            if self.tanggal_tebar:
-                Activity.objects.create(
-                    batch=self,
-                    tanggal=self.tanggal_tebar,
-                    jenis="PENEBARAN",
-                    lokasi=farm.location,
-                    pelaku=pelaku,
-                    keterangan="Penebaran benur awal siklus",
-                )
-
-            # PANEN
-            Activity.objects.create(
-                batch=self,
-                tanggal=self.tanggal_panen,
-                jenis="PANEN",
-                lokasi=farm.location,
-                pelaku=pelaku,
-                keterangan="Panen utama",
-            )
+        with combine_side_effects():
+            super().save(*args, **kwargs)
 
-            # DARI_TAMBAK
-            Activity.objects.create(
-                batch=self,
-                tanggal=self.created_at.date() if self.created_at else timezone.now().date(),
-                jenis="DARI_TAMBAK",
-                lokasi=farm.location,
-                pelaku=pelaku,
-                keterangan="Batch didaftarkan ke sistem oleh farm owner",
-            )
+            if is_new:
+                # PENEBARAN / PANEN / DARI_TAMBAK dalam satu bulk_create
+                create_default_activities([self])
 
 class Activity(models.Model):
     ACTIVITY_CHOICES = [
@@ -160,3 +175,219 @@ class Commodity(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class BatchCodeSequence(models.Model):
+    """
+    Nomor urut terakhir kode_batch per prefix (KOTA-FARM-TANGGAL).
+    Dinaikkan secara atomik oleh batches.utils.reserve_batch_codes,
+    pengganti scan `kode_batch__startswith` setiap batch baru.
+    """
+
+    prefix = models.CharField(max_length=50, primary_key=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix} ({self.last_value})"
+
+
+class RiskRuleSet(models.Model):
+    """
+    Aturan skor risiko yang bisa dikonfigurasi dan berversi.
+
+    Rule set yang berlaku = versi tertinggi dengan is_active=True
+    (lihat batches.rules.get_active_rule_set); kalau belum ada sama sekali
+    dipakai nilai default di bawah (aturan lama yang dulu di-hardcode).
+    Untuk mengubah aturan, buat versi baru, jangan edit versi lama, supaya
+    skor lama tetap bisa dijelaskan.
+
+    Satu rule set dipakai di tiga tempat dengan hasil yang sama:
+    - score_batch / score_farm           → update per objek (Python)
+    - batch_risk_sql / farm_risk_sql ... → re-scoring massal, satu UPDATE di DB
+    - batches.risk (NumPy)               → re-scoring massal di memori
+    """
+
+    version = models.PositiveIntegerField(unique=True)
+    is_active = models.BooleanField(default=False)
+    catatan = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # risk dasar batch dari rasio nilai Cs-137 / batas aman
+    ratio_low = models.FloatField(default=0.5)
+    ratio_mid = models.FloatField(default=0.8)
+    base_low = models.PositiveIntegerField(default=30)
+    base_mid = models.PositiveIntegerField(default=50)
+    base_high = models.PositiveIntegerField(default=75)
+    base_masalah = models.PositiveIntegerField(default=90)  # kesimpulan BERMASALAH
+
+    # penalti dari Farm.risk_score
+    farm_low_max = models.PositiveIntegerField(default=40)
+    farm_mid_max = models.PositiveIntegerField(default=70)
+    penalty_mid = models.PositiveIntegerField(default=10)
+    penalty_high = models.PositiveIntegerField(default=20)
+    max_risk = models.PositiveIntegerField(default=100)
+
+    # batch dengan risk_score < cutoff layak kirim / siap ekspor
+    shipment_risk_cutoff = models.PositiveIntegerField(default=70)
+
+    # Farm Risk Score dari rasio batch MASALAH di window 180 hari
+    farm_ratio_low = models.FloatField(default=0.10)
+    farm_ratio_mid = models.FloatField(default=0.30)
+    farm_score_empty = models.PositiveIntegerField(default=30)
+    farm_score_low = models.PositiveIntegerField(default=30)
+    farm_score_mid = models.PositiveIntegerField(default=60)
+    farm_score_high = models.PositiveIntegerField(default=85)
+
+    class Meta:
+        ordering = ["-version"]
+
+    def __str__(self):
+        return f"Rule set v{self.version}" + (" (aktif)" if self.is_active else "")
+
+    # === Python: update per objek ===
+
+    def farm_penalty(self, farm_risk) -> int:
+        if farm_risk <= self.farm_low_max:
+            return 0
+        elif farm_risk <= self.farm_mid_max:
+            return self.penalty_mid
+        return self.penalty_high
+
+    def score_batch(self, kesimpulan, nilai_cs137, batas, farm_risk):
+        """Return (quality_status, risk_score); lihat batches.utils.score_batch."""
+        if kesimpulan is None:
+            return "PENDING", None
+
+        if kesimpulan == "BERMASALAH":
+            return "MASALAH", min(self.max_risk, self.base_masalah + self.farm_penalty(farm_risk))
+
+        # batas 0 / tidak terdefinisi → anggap dekat limit
+        worst_ratio = nilai_cs137 / batas if batas else 1.0
+        if worst_ratio <= self.ratio_low:
+            base_risk = self.base_low
+        elif worst_ratio <= self.ratio_mid:
+            base_risk = self.base_mid
+        else:
+            base_risk = self.base_high
+        return "AMAN", min(self.max_risk, base_risk + self.farm_penalty(farm_risk))
+
+    def score_farm(self, total_batch, jumlah_masalah) -> int:
+        if total_batch == 0:
+            return self.farm_score_empty
+
+        ratio = jumlah_masalah / total_batch
+        if ratio <= self.farm_ratio_low:
+            return self.farm_score_low
+        elif ratio <= self.farm_ratio_mid:
+            return self.farm_score_mid
+        return self.farm_score_high
+
+    def is_layak_kirim(self, risk_score) -> bool:
+        return risk_score is not None and risk_score < self.shipment_risk_cutoff
+
+    def shipment_status(self, is_shipped, risk_score) -> str:
+        """Lihat HarvestBatch.shipment_status."""
+        if is_shipped:
+            return "SUDAH_DIKIRIM"
+        if risk_score is None:
+            return "BELUM_DITINJAU"
+        if self.is_layak_kirim(risk_score):
+            return "LAYAK_KIRIM"
+        return "DITAHAN"
+
+    # === SQL: ekspresi CASE untuk QuerySet.update() ===
+
+    def quality_status_sql(self, kesimpulan):
+        return Case(
+            When(IsNull(kesimpulan, True), then=Value("PENDING")),
+            When(Exact(kesimpulan, "BERMASALAH"), then=Value("MASALAH")),
+            default=Value("AMAN"),
+            output_field=models.CharField(),
+        )
+
+    def batch_risk_sql(self, kesimpulan, nilai_cs137, batas, farm_risk):
+        ratio = Case(
+            When(Exact(batas, 0), then=Value(1.0)),
+            default=ExpressionWrapper(nilai_cs137 / batas, output_field=models.FloatField()),
+            output_field=models.FloatField(),
+        )
+        base_risk = Case(
+            When(Exact(kesimpulan, "BERMASALAH"), then=Value(self.base_masalah)),
+            When(LessThanOrEqual(ratio, self.ratio_low), then=Value(self.base_low)),
+            When(LessThanOrEqual(ratio, self.ratio_mid), then=Value(self.base_mid)),
+            default=Value(self.base_high),
+        )
+        penalty = Case(
+            When(LessThanOrEqual(farm_risk, self.farm_low_max), then=Value(0)),
+            When(LessThanOrEqual(farm_risk, self.farm_mid_max), then=Value(self.penalty_mid)),
+            default=Value(self.penalty_high),
+        )
+        return Case(
+            When(IsNull(kesimpulan, True), then=Value(None)),
+            default=Least(Value(self.max_risk), base_risk + penalty),
+            output_field=models.IntegerField(),
+        )
+
+    def farm_risk_sql(self, total, masalah):
+        ratio = ExpressionWrapper(
+            Cast(masalah, models.FloatField()) / Cast(total, models.FloatField()),
+            output_field=models.FloatField(),
+        )
+        return Case(
+            When(Exact(total, 0), then=Value(self.farm_score_empty)),
+            When(LessThanOrEqual(ratio, self.farm_ratio_low), then=Value(self.farm_score_low)),
+            When(LessThanOrEqual(ratio, self.farm_ratio_mid), then=Value(self.farm_score_mid)),
+            default=Value(self.farm_score_high),
+            output_field=models.IntegerField(),
+        )
+
+    def shipment_status_sql(self, is_shipped, risk_score):
+        return Case(
+            When(Exact(is_shipped, True), then=Value("SUDAH_DIKIRIM")),
+            When(IsNull(risk_score, True), then=Value("BELUM_DITINJAU")),
+            When(LessThan(risk_score, self.shipment_risk_cutoff), then=Value("LAYAK_KIRIM")),
+            default=Value("DITAHAN"),
+            output_field=models.CharField(),
+        )
+
+
+class HarvestRollup(models.Model):
+    """
+    Rollup nasional batch per (provinsi, kota, komoditas, bulan panen),
+    termasuk level "semua" di setiap dimensi: province "" = nasional,
+    city / commodity / month kosong = semua. Satu batch ikut dijumlah di
+    12 baris (nasional / provinsi / kota × komoditas / semua × bulan / semua),
+    jadi angka di level mana pun cukup dibaca dari satu baris berindeks
+    (lihat batches.rollup). Dijaga incremental saat batch, uji lab, farm
+    dan kota ditulis.
+    """
+
+    # province|city|commodity|month, "*" = semua; unik walau kolom dimensinya NULL
+    key = models.CharField(max_length=200, unique=True)
+    province = models.CharField(max_length=100, blank=True)
+    city = models.ForeignKey(City, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    commodity = models.ForeignKey(Commodity, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    month = models.DateField(null=True, blank=True, help_text="Tanggal 1 bulan panen")
+
+    jumlah_batch = models.IntegerField(default=0)
+    volume_kg = models.FloatField(default=0)
+    ditahan = models.IntegerField(default=0)
+    dikirim = models.IntegerField(default=0)
+    volume_dikirim_kg = models.FloatField(default=0)
+    diuji = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["province", "city", "commodity", "month"], name="harvest_rollup_level_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.jumlah_batch} batch"
+
+    @property
+    def belum_diuji(self) -> int:
+        return self.jumlah_batch - self.diuji
+
+    @property
+    def tonase_dikirim(self) -> float:
+        return self.volume_dikirim_kg / 1000
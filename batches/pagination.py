@@ -0,0 +1,121 @@
+"""
+Keyset (cursor) pagination untuk QuerySet yang urutannya unik.
+
+    page = keyset_page(qs, ["-created_at", "-kode_batch"], cursor, 50)
+    page.items, page.next_cursor, page.prev_cursor
+
+Halaman berikutnya dicari dengan WHERE (created_at, kode_batch) < nilai
+baris terakhir, bukan OFFSET, jadi halaman ke-N sama murahnya dengan
+halaman pertama selama ada index yang cocok dengan urutannya. Cursor
+berisi nilai kunci baris batas dan arahnya, di-encode base64 supaya aman
+di query string. Field urutan tidak boleh nullable dan field terakhir
+harus unik (pemecah seri).
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+
+NEXT, PREV = "n", "p"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _parse_ordering(ordering):
+    """["-created_at", "kode_batch"] → [("created_at", True), ("kode_batch", False)]."""
+    return [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+
+def encode_cursor(values, direction: str) -> str:
+    raw = json.dumps([direction, values], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, model, ordering):
+    """Return (direction, [nilai per field urutan]); InvalidCursor kalau rusak."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Cursor tidak valid")
+    keys = _parse_ordering(ordering)
+    if direction not in (NEXT, PREV) or not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor("Cursor tidak valid")
+    try:
+        values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(keys, values)]
+    except Exception:
+        raise InvalidCursor("Cursor tidak valid")
+    return direction, values
+
+
+def _after(keys, values) -> Q:
+    """Baris yang datang sesudah `values` menurut urutan keys (perbandingan tuple)."""
+    condition = Q()
+    for i in range(len(keys) - 1, -1, -1):
+        name, desc = keys[i]
+        step = Q(**{f"{name}__{'lt' if desc else 'gt'}": values[i]})
+        if i < len(keys) - 1:
+            step |= Q(**{name: values[i]}) & condition
+        condition = step
+    # batas rentang field pertama (redundan) supaya planner memakai range scan index
+    name, desc = keys[0]
+    return Q(**{f"{name}__{'lte' if desc else 'gte'}": values[0]}) & condition
+
+
+def keyset_page(queryset, ordering, cursor=None, size: int = 50) -> KeysetPage:
+    """
+    Satu halaman queryset menurut ordering (list nama field, "-" = menurun).
+    cursor dari KeysetPage.next_cursor / prev_cursor halaman sebelumnya.
+    """
+    keys = _parse_ordering(ordering)
+    direction, values = NEXT, None
+    if cursor:
+        direction, values = decode_cursor(cursor, queryset.model, ordering)
+
+    if direction == PREV:
+        # baca mundur dari batas, lalu balik lagi
+        scan_keys = [(name, not desc) for name, desc in keys]
+    else:
+        scan_keys = keys
+    qs = queryset.order_by(*[f"-{name}" if desc else name for name, desc in scan_keys])
+    if values is not None:
+        qs = qs.filter(_after(scan_keys, values))
+
+    rows = list(qs[: size + 1])
+    more = len(rows) > size
+    rows = rows[:size]
+    if direction == PREV:
+        rows.reverse()
+
+    page = KeysetPage(items=rows)
+    if not rows:
+        return page
+
+    def key_of(obj):
+        return [getattr(obj, name) for name, _ in keys]
+
+    if direction == PREV:
+        page.next_cursor = encode_cursor(key_of(rows[-1]), NEXT)
+        page.prev_cursor = encode_cursor(key_of(rows[0]), PREV) if more else None
+    else:
+        page.next_cursor = encode_cursor(key_of(rows[-1]), NEXT) if more else None
+        page.prev_cursor = encode_cursor(key_of(rows[0]), PREV) if values is not None else None
+    return page
@@ -0,0 +1,380 @@
+"""
+Hitung ulang risk semua batch dan farm sekaligus dengan NumPy.
+
+Aturan yang dipakai sama dengan jalur per objek:
+- LabTest.save()            → kesimpulan (batas komoditas, tanpa fallback)
+- batches.utils.score_batch → quality_status + risk_score batch
+- farms.utils.score_farm    → risk_score farm dari rasio MASALAH 180 hari
+- HarvestBatch.save()        → shipment_status dari is_shipped + risk_score
+
+Berguna setelah batas Cs-137 komoditas diubah: semua kesimpulan, status,
+risk farm dan risk batch dihitung dalam satu pass vektor, lalu hanya baris
+yang berubah yang ditulis (bulk_update).
+
+Urutannya dibuat konsisten (bukan bergantung urutan save): status batch
+dulu, lalu risk farm dari status baru, lalu risk batch dari risk farm baru.
+
+recompute_risk_sql menjalankan hal yang sama seluruhnya di database
+(ekspresi CASE dari RiskRuleSet), tanpa memuat baris ke memori.
+"""
+from dataclasses import dataclass
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from farms.models import Farm, FarmRiskBucket
+from farms.summary import batch_farm_ids, refresh_farm_summaries
+from farms.utils import (
+    add_risk_bucket_delta,
+    apply_risk_bucket_deltas,
+    farm_risk_window_start,
+)
+from labs.models import LabTest
+from .models import Commodity, HarvestBatch
+from .rollup import apply_harvest_rollup_deltas, shipment_rollup_deltas
+from .rules import get_active_rule_set
+from .trace import invalidate_trace
+from .utils import DEFAULT_BATAS_AMAN_CS137
+
+# kode numerik quality_status di array
+PENDING, AMAN, MASALAH = 0, 1, 2
+QUALITY_STATUS = np.array(["PENDING", "AMAN", "MASALAH"], dtype=object)
+
+
+@dataclass
+class RiskRecomputeResult:
+    batches: int = 0      # jumlah batch yang status / risk / shipment_status-nya berubah
+    farms: int = 0        # jumlah farm yang risk-nya berubah
+    lab_tests: int = 0    # jumlah LabTest yang kesimpulannya berubah
+    total_batches: int = 0
+
+
+def score_farms(farm_index, in_window, masalah, n_farms, rules):
+    """Versi vektor RiskRuleSet.score_farm: risk per farm dari batch di window."""
+    total = np.bincount(farm_index[in_window], minlength=n_farms)
+    jumlah_masalah = np.bincount(farm_index[in_window & masalah], minlength=n_farms)
+    ratio = np.divide(jumlah_masalah, total, out=np.zeros(n_farms), where=total > 0)
+    return np.select(
+        [total == 0, ratio <= rules.farm_ratio_low, ratio <= rules.farm_ratio_mid],
+        [rules.farm_score_empty, rules.farm_score_low, rules.farm_score_mid],
+        default=rules.farm_score_high,
+    )
+
+
+def score_batches(status, nilai, batas, farm_risk, rules):
+    """
+    Versi vektor RiskRuleSet.score_batch. nilai / batas float (NaN kalau tidak
+    ada LabTest), farm_risk = risk farm per batch. Return risk_score float, NaN = None.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # batas 0 dianggap dekat limit, sama seperti score_batch
+        ratio = np.where(batas != 0, nilai / batas, 1.0)
+    base = np.select(
+        [status == MASALAH, ratio <= rules.ratio_low, ratio <= rules.ratio_mid],
+        [rules.base_masalah, rules.base_low, rules.base_mid],
+        default=rules.base_high,
+    )
+    extra = np.select(
+        [farm_risk <= rules.farm_low_max, farm_risk <= rules.farm_mid_max],
+        [0, rules.penalty_mid],
+        default=rules.penalty_high,
+    )
+    risk = np.minimum(rules.max_risk, base + extra).astype(float)
+    risk[status == PENDING] = np.nan
+    return risk
+
+
+def shipment_statuses(is_shipped, risk, rules):
+    """Versi vektor RiskRuleSet.shipment_status. risk float, NaN = belum ada risk_score."""
+    return np.select(
+        [is_shipped, np.isnan(risk), risk < rules.shipment_risk_cutoff],
+        ["SUDAH_DIKIRIM", "BELUM_DITINJAU", "LAYAK_KIRIM"],
+        default="DITAHAN",
+    ).astype(object)
+
+
+def recompute_risk(
+    batch_size: int = 5000, dry_run: bool = False, rules=None, farm_ids=None, skip_shipped: bool = False
+) -> RiskRecomputeResult:
+    """
+    Hitung ulang kesimpulan LabTest, quality_status + risk_score batch,
+    dan risk_score farm untuk seluruh database, atau hanya farm `farm_ids`
+    (risk farm hanya bergantung pada batch farm itu sendiri).
+    skip_shipped: batch yang sudah dikirim tetap memakai risk / status saat
+    dikirim (tetap ikut dihitung di risk farm). Return jumlah yang berubah.
+    """
+    rules = rules or get_active_rule_set()
+    batches, farms = HarvestBatch.objects.order_by(), Farm.objects.order_by()
+    if farm_ids is not None:
+        batches, farms = batches.filter(farm_id__in=farm_ids), farms.filter(pk__in=farm_ids)
+    farms = dict(farms.values_list("pk", "risk_score"))
+    farm_ids = np.array(list(farms), dtype=object)
+    farm_position = {farm_id: i for i, farm_id in enumerate(farm_ids)}
+
+    # baris dibaca lewat iterator langsung ke array kolom yang sudah
+    # dialokasikan, tanpa list tuple seluruh tabel di memori. Batch yang
+    # dibuat setelah count() sudah dinilai save()-nya sendiri dan dilewati;
+    # kalau ada yang terhapus, array dipotong.
+    n = batches.count()
+    pks = np.empty(n, dtype=object)
+    farm_index = np.empty(n, dtype=np.int64)
+    tanggal_panen = np.empty(n, dtype="datetime64[D]")
+    old_status = np.empty(n, dtype=object)
+    old_risk = np.empty(n, dtype=float)
+    batas_komoditas = np.empty(n, dtype=float)
+    lab_test_pks = np.empty(n, dtype=object)
+    has_test = np.empty(n, dtype=bool)
+    nilai = np.empty(n, dtype=float)
+    old_kesimpulan = np.empty(n, dtype=object)
+    is_shipped = np.empty(n, dtype=bool)
+    old_shipment = np.empty(n, dtype=object)
+    rows = batches.values_list(
+        "pk",
+        "farm_id",
+        "tanggal_panen",
+        "quality_status",
+        "risk_score",
+        "commodity__default_batas_aman_cs137",
+        "lab_test__pk",
+        "lab_test__nilai_cs137",
+        "lab_test__kesimpulan",
+        "is_shipped",
+        "shipment_status",
+    ).iterator(chunk_size=batch_size)
+    loaded = 0
+    for i, row in enumerate(islice(rows, n)):
+        (pks[i], farm_id, tanggal_panen[i], old_status[i], risk_score, batas_aman,
+         lab_test_pks[i], nilai_cs137, old_kesimpulan[i], is_shipped[i], old_shipment[i]) = row
+        farm_index[i] = farm_position[farm_id]
+        has_test[i] = lab_test_pks[i] is not None
+        old_risk[i] = np.nan if risk_score is None else risk_score
+        batas_komoditas[i] = np.nan if batas_aman is None else batas_aman
+        nilai[i] = np.nan if nilai_cs137 is None else nilai_cs137
+        loaded = i + 1
+    if loaded < n:
+        n = loaded
+        (pks, farm_index, tanggal_panen, old_status, old_risk, batas_komoditas, lab_test_pks,
+         has_test, nilai, old_kesimpulan, is_shipped, old_shipment) = (
+            column[:n] for column in (
+                pks, farm_index, tanggal_panen, old_status, old_risk, batas_komoditas, lab_test_pks,
+                has_test, nilai, old_kesimpulan, is_shipped, old_shipment,
+            )
+        )
+    result = RiskRecomputeResult(total_batches=n)
+
+    in_window = tanggal_panen >= np.datetime64(farm_risk_window_start(), "D")
+
+    # kesimpulan versi LabTest.save(): batas komoditas saja, None → AMAN
+    bermasalah = has_test & ~np.isnan(batas_komoditas) & (nilai > batas_komoditas)
+    kesimpulan = np.where(bermasalah, "BERMASALAH", "AMAN").astype(object)
+    kesimpulan[~has_test] = None
+
+    status = np.where(has_test, np.where(bermasalah, MASALAH, AMAN), PENDING)
+
+    farm_risk = score_farms(farm_index, in_window, status == MASALAH, len(farm_ids), rules)
+
+    # skor batch pakai batas dengan fallback global (get_batas_aman_cs137)
+    batas = np.where(np.isnan(batas_komoditas), DEFAULT_BATAS_AMAN_CS137, batas_komoditas)
+    risk = score_batches(status, nilai, batas, farm_risk[farm_index], rules)
+
+    new_status = QUALITY_STATUS[status]
+    new_shipment = shipment_statuses(is_shipped, risk, rules)
+    if skip_shipped:
+        new_status = np.where(is_shipped, old_status, new_status)
+        risk = np.where(is_shipped, old_risk, risk)
+        new_shipment = np.where(is_shipped, old_shipment, new_shipment)
+        kesimpulan = np.where(is_shipped, old_kesimpulan, kesimpulan)
+    same_risk = (risk == old_risk) | (np.isnan(risk) & np.isnan(old_risk))
+    batch_changed = np.flatnonzero(
+        (new_status != old_status) | ~same_risk | (new_shipment != old_shipment)
+    )
+    test_changed = np.flatnonzero(has_test & (kesimpulan != old_kesimpulan))
+    old_farm_risk = np.array([farms[farm_id] for farm_id in farm_ids], dtype=float)
+    farm_changed = np.flatnonzero(farm_risk != old_farm_risk)
+
+    result.batches = len(batch_changed)
+    result.lab_tests = len(test_changed)
+    result.farms = len(farm_changed)
+    if dry_run:
+        return result
+
+    now = timezone.now()
+    with transaction.atomic():
+        LabTest.objects.bulk_update(
+            [
+                LabTest(pk=lab_test_pks[i], kesimpulan=kesimpulan[i], updated_at=now)
+                for i in test_changed
+            ],
+            ["kesimpulan", "updated_at"],
+            batch_size=batch_size,
+        )
+        HarvestBatch.objects.bulk_update(
+            [
+                HarvestBatch(
+                    pk=pks[i],
+                    quality_status=new_status[i],
+                    risk_score=None if np.isnan(risk[i]) else int(risk[i]),
+                    shipment_status=new_shipment[i],
+                    updated_at=now,
+                )
+                for i in batch_changed
+            ],
+            ["quality_status", "risk_score", "shipment_status", "updated_at"],
+            batch_size=batch_size,
+        )
+        Farm.objects.bulk_update(
+            [Farm(pk=farm_ids[i], risk_score=int(farm_risk[i])) for i in farm_changed],
+            ["risk_score"],
+            batch_size=batch_size,
+        )
+
+        bucket_deltas = {}
+        for i in np.flatnonzero(new_status != old_status):
+            farm_id, day = farm_ids[farm_index[i]], tanggal_panen[i].item()
+            add_risk_bucket_delta(
+                bucket_deltas,
+                (farm_id, day, old_status[i] == "MASALAH"),
+                (farm_id, day, new_status[i] == "MASALAH"),
+            )
+        apply_risk_bucket_deltas(bucket_deltas)
+        # status / risk batch ikut dijumlah di FarmSummary: hitung ulang farm-nya
+        summary_changed = np.flatnonzero((new_status != old_status) | ~same_risk)
+        if len(summary_changed):
+            refresh_farm_summaries({farm_ids[farm_index[i]] for i in summary_changed})
+        apply_harvest_rollup_deltas(shipment_rollup_deltas(
+            {pks[i]: old_shipment[i] for i in np.flatnonzero(new_shipment != old_shipment)}
+        ))
+        invalidate_trace({pks[i] for i in batch_changed} | {pks[i] for i in test_changed})
+
+    return result
+
+
+def recompute_risk_sql(rules=None) -> RiskRecomputeResult:
+    """
+    Sama dengan recompute_risk, tapi seluruhnya di database: rule set
+    di-compile jadi ekspresi CASE dan setiap tabel di-update dengan satu
+    UPDATE (hanya baris yang nilainya berubah). Yang dibaca ke Python
+    hanya batch yang berubah: kode batch untuk invalidasi snapshot trace,
+    farm + tanggal panen batch yang status-nya berubah untuk delta
+    FarmRiskBucket.
+    """
+    rules = rules or get_active_rule_set()
+    now = timezone.now()
+    result = RiskRecomputeResult(total_batches=HarvestBatch.objects.count())
+
+    lab_test = LabTest.objects.filter(batch_id=OuterRef("pk"))
+    batch_kesimpulan = Subquery(lab_test.values("kesimpulan")[:1])
+
+    with transaction.atomic():
+        # 1. kesimpulan LabTest, aturan LabTest.save(): batas komoditas saja, None → AMAN
+        batas_komoditas = Subquery(
+            Commodity.objects.filter(batches__pk=OuterRef("batch_id"))
+            .values("default_batas_aman_cs137")[:1]
+        )
+        lab_tests = LabTest.objects.alias(
+            new_kesimpulan=Case(
+                When(GreaterThan(F("nilai_cs137"), batas_komoditas), then=Value("BERMASALAH")),
+                default=Value("AMAN"),
+            )
+        ).exclude(kesimpulan=F("new_kesimpulan"))
+        changed = set(lab_tests.values_list("batch_id", flat=True))
+        result.lab_tests = lab_tests.update(kesimpulan=F("new_kesimpulan"), updated_at=now)
+
+        # 2. quality_status batch
+        batches = HarvestBatch.objects.alias(
+            new_status=rules.quality_status_sql(batch_kesimpulan)
+        ).exclude(quality_status=F("new_status"))
+        bucket_deltas = {}
+        status_changed = set()
+        for pk, farm_id, day, old_status, new_status in batches.annotate(
+            status_baru=F("new_status")
+        ).values_list("pk", "farm_id", "tanggal_panen", "quality_status", "status_baru"):
+            status_changed.add(pk)
+            add_risk_bucket_delta(
+                bucket_deltas,
+                (farm_id, day, old_status == "MASALAH"),
+                (farm_id, day, new_status == "MASALAH"),
+            )
+        batches.update(quality_status=F("new_status"), updated_at=now)
+
+        # 3. bucket batch yang berubah + risk farm dari bucket di window
+        apply_risk_bucket_deltas(bucket_deltas)
+
+        def window_sum(field):
+            return Coalesce(
+                Subquery(
+                    FarmRiskBucket.objects.filter(
+                        farm_id=OuterRef("pk"),
+                        day__gte=farm_risk_window_start(),
+                    )
+                    .order_by()
+                    .values("farm_id")
+                    .annotate(jumlah=Sum(field))
+                    .values("jumlah")
+                ),
+                0,
+            )
+
+        farms = Farm.objects.alias(
+            new_risk=rules.farm_risk_sql(window_sum("total"), window_sum("masalah"))
+        ).exclude(risk_score=F("new_risk"))
+        result.farms = farms.update(risk_score=F("new_risk"))
+
+        # 4. risk_score batch, batas dengan fallback global (get_batas_aman_cs137)
+        batas = Coalesce(
+            Subquery(
+                Commodity.objects.filter(pk=OuterRef("commodity_id"))
+                .values("default_batas_aman_cs137")[:1]
+            ),
+            Value(float(DEFAULT_BATAS_AMAN_CS137)),
+        )
+        farm_risk = Subquery(Farm.objects.filter(pk=OuterRef("farm_id")).values("risk_score")[:1])
+        new_risk = rules.batch_risk_sql(
+            batch_kesimpulan,
+            Subquery(lab_test.values("nilai_cs137")[:1]),
+            batas,
+            farm_risk,
+        )
+        batches = HarvestBatch.objects.alias(new_risk=new_risk).filter(
+            Q(risk_score__isnull=False, new_risk__isnull=False) & ~Q(risk_score=F("new_risk"))
+            | Q(risk_score__isnull=True, new_risk__isnull=False)
+            | Q(risk_score__isnull=False, new_risk__isnull=True)
+        )
+        risk_changed = set(batches.values_list("pk", flat=True))
+        batches.update(risk_score=F("new_risk"), updated_at=now)
+
+        # 5. shipment_status dari risk_score baru (dan cutoff rule set)
+        shipment_changed = refresh_shipment_status(rules)
+
+        # 6. FarmSummary farm yang status / risk batch-nya berubah
+        if status_changed | risk_changed:
+            refresh_farm_summaries(batch_farm_ids(status_changed | risk_changed))
+
+        result.batches = len(status_changed | risk_changed | shipment_changed)
+        invalidate_trace(changed | status_changed | risk_changed | shipment_changed)
+
+    return result
+
+
+def refresh_shipment_status(rules=None) -> set:
+    """
+    Samakan HarvestBatch.shipment_status dengan rule set (misal setelah
+    shipment_risk_cutoff diganti) dengan satu UPDATE. Return kode batch yang berubah.
+    """
+    rules = rules or get_active_rule_set()
+    batches = HarvestBatch.objects.alias(
+        new_shipment=rules.shipment_status_sql(F("is_shipped"), F("risk_score"))
+    ).exclude(shipment_status=F("new_shipment"))
+    with transaction.atomic():
+        old_shipment = dict(batches.values_list("pk", "shipment_status"))
+        changed = set(old_shipment)
+        if changed:
+            batches.update(shipment_status=F("new_shipment"), updated_at=timezone.now())
+            apply_harvest_rollup_deltas(shipment_rollup_deltas(old_shipment))
+            invalidate_trace(changed)
+    return changed
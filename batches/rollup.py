@@ -0,0 +1,458 @@
+"""
+Rollup nasional batch panen (HarvestRollup) untuk dashboard admin.
+
+Kunci hierarkisnya (provinsi, kota, komoditas, bulan panen). Setiap batch
+dijumlahkan ke 12 baris sekaligus, yaitu kombinasi dari
+
+    wilayah   : nasional / provinsi / kota
+    komoditas : semua / komoditas batch
+    bulan     : semua / bulan panen batch
+
+jadi angka di level mana pun (misal "Jawa Barat, semua komoditas, Maret
+2025") cukup dibaca dari satu baris lewat index unik:
+
+    harvest_rollup(province="Jawa Barat", month=date(2025, 3, 1))
+    harvest_rollups(by="province", commodity=udang)   # rincian satu level
+
+Ukurannya aditif (jumlah batch, volume, ditahan, dikirim, sudah diuji).
+Setiap tulis HarvestBatch / LabTest menghasilkan delta per (farm,
+komoditas, bulan) yang digabung ke baris-barisnya:
+
+    deltas = harvest_batch_deltas([(kode_batch, old_state, new_state)])
+    apply_harvest_rollup_deltas(deltas)
+
+Penambahan ke HarvestRollup ditulis dengan F() di transaksi yang sama
+dengan tulis batch-nya, jadi rollup ikut commit / rollback bersama
+datanya. Semua key ditambah dengan satu UPDATE (CASE per key), dan di
+dalam combine_harvest_rollup_deltas() delta beberapa tulis (misal batch +
+hasil ujinya) digabung dulu, jadi baris nasional / provinsi hanya
+dikunci sekali per save.
+
+Signal (batches/signals.py) menangani save per baris; jalur bulk
+(import_data, labs.ingest, apply_labtest_events, recompute_risk)
+memanggil fungsi yang sama. Farm pindah kota / kota pindah provinsi
+menggeser seluruh batch-nya (move_harvest_rollups).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from itertools import product
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+# dimensi rincian → kolom HarvestRollup
+HARVEST_ROLLUP_LEVELS = ("province", "city", "commodity", "month")
+
+# key diproses per potongan supaya jumlah parameter query tetap kecil
+ROLLUP_KEY_CHUNK = 500
+
+
+@dataclass
+class HarvestRollupDelta:
+    jumlah_batch: int = 0
+    volume_kg: float = 0.0
+    ditahan: int = 0
+    dikirim: int = 0
+    volume_dikirim_kg: float = 0.0
+    diuji: int = 0
+
+    def add(self, other, sign: int = 1):
+        for name in HARVEST_ROLLUP_MEASURES:
+            setattr(self, name, getattr(self, name) + sign * getattr(other, name))
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, name) for name in HARVEST_ROLLUP_MEASURES)
+
+
+HARVEST_ROLLUP_MEASURES = [f.name for f in fields(HarvestRollupDelta)]
+
+# delta yang ditahan combine_harvest_rollup_deltas(); None = langsung diterapkan
+_pending: ContextVar[dict | None] = ContextVar("harvest_rollup_pending", default=None)
+
+
+@contextmanager
+def combine_harvest_rollup_deltas():
+    """
+    Di dalam blok ini apply_harvest_rollup_deltas() hanya mengumpulkan
+    delta; gabungannya diterapkan sekali saat blok selesai tanpa error.
+    Blok bersarang ikut blok terluar.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    apply_harvest_rollup_deltas(pending)
+
+
+def rollup_month(tanggal):
+    return tanggal.replace(day=1)
+
+
+def harvest_rollup_state(batch):
+    """Kontribusi satu batch: (farm_id, commodity_id, bulan panen, volume_kg, shipment_status)."""
+    # nilai bisa masih berupa string (misal dari import_data) sebelum dibaca ulang
+    opts = batch._meta
+    return (
+        batch.farm_id,
+        batch.commodity_id,
+        rollup_month(opts.get_field("tanggal_panen").to_python(batch.tanggal_panen)),
+        float(opts.get_field("volume_kg").to_python(batch.volume_kg) or 0),
+        batch.shipment_status,
+    )
+
+
+def _batch_delta(volume_kg, shipment_status, sign: int) -> HarvestRollupDelta:
+    dikirim = shipment_status == "SUDAH_DIKIRIM"
+    return HarvestRollupDelta(
+        jumlah_batch=sign,
+        volume_kg=sign * volume_kg,
+        ditahan=sign * (shipment_status == "DITAHAN"),
+        dikirim=sign * dikirim,
+        volume_dikirim_kg=sign * volume_kg if dikirim else 0.0,
+    )
+
+
+def add_harvest_rollup_delta(deltas: dict, old_state, new_state):
+    """Catat perpindahan satu batch dari old_state ke new_state (None = belum ada / dihapus)."""
+    if old_state == new_state:
+        return
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        farm_id, commodity_id, month, volume_kg, shipment_status = state
+        deltas.setdefault((farm_id, commodity_id, month), HarvestRollupDelta()).add(
+            _batch_delta(volume_kg, shipment_status, sign)
+        )
+
+
+def add_harvest_test_delta(deltas: dict, state, sign: int = 1):
+    """LabTest batch dengan state ini dibuat (sign 1) / dihapus (sign -1)."""
+    farm_id, commodity_id, month, _, _ = state
+    deltas.setdefault((farm_id, commodity_id, month), HarvestRollupDelta()).diuji += sign
+
+
+def harvest_batch_deltas(changes) -> dict:
+    """
+    changes: list (kode_batch, old_state, new_state) dari harvest_rollup_state.
+    Batch yang sudah diuji dan pindah farm / komoditas / bulan ikut
+    memindahkan hitungan diuji-nya (dicek dengan satu query).
+    """
+    LabTest = apps.get_model("labs", "LabTest")
+
+    deltas = {}
+    moved = {}
+    for kode_batch, old_state, new_state in changes:
+        add_harvest_rollup_delta(deltas, old_state, new_state)
+        if old_state is not None and new_state is not None and old_state[:3] != new_state[:3]:
+            moved[kode_batch] = (old_state, new_state)
+    if moved:
+        for kode_batch in LabTest.objects.filter(batch_id__in=moved).values_list("batch_id", flat=True):
+            old_state, new_state = moved[kode_batch]
+            add_harvest_test_delta(deltas, old_state, -1)
+            add_harvest_test_delta(deltas, new_state, 1)
+    return deltas
+
+
+def harvest_test_deltas(batch_ids, sign: int = 1) -> dict:
+    """Delta diuji untuk LabTest baru / terhapus milik batch_ids (satu query)."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    deltas = {}
+    for farm_id, commodity_id, tanggal_panen in HarvestBatch.objects.filter(pk__in=batch_ids).values_list(
+        "farm_id", "commodity_id", "tanggal_panen"
+    ):
+        add_harvest_test_delta(deltas, (farm_id, commodity_id, rollup_month(tanggal_panen), 0.0, None), sign)
+    return deltas
+
+
+def shipment_rollup_deltas(old_shipment: dict) -> dict:
+    """
+    Delta untuk batch yang shipment_status-nya baru diganti lewat UPDATE /
+    bulk_update. old_shipment: {kode_batch: shipment_status lama}; state
+    barunya dibaca ulang dengan satu query.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    deltas = {}
+    for batch in HarvestBatch.objects.filter(pk__in=old_shipment).only(
+        "farm_id", "commodity_id", "tanggal_panen", "volume_kg", "shipment_status"
+    ):
+        new_state = harvest_rollup_state(batch)
+        add_harvest_rollup_delta(deltas, (*new_state[:4], old_shipment[batch.pk]), new_state)
+    return deltas
+
+
+# --- wilayah dan level hierarki ---------------------------------------------
+
+def farm_regions(farm_ids) -> dict:
+    """{farm_id: (provinsi, city_id)}; farm tanpa kota → (None, None)."""
+    Farm = apps.get_model("farms", "Farm")
+    return {
+        pk: (province, city_id) if city_id is not None else (None, None)
+        for pk, city_id, province in Farm.objects.filter(pk__in=farm_ids).values_list(
+            "pk", "city_id", "city__province"
+        )
+    }
+
+
+def rollup_levels(province, city_id, commodity_id, month):
+    """12 key level (province, city_id, commodity_id, month) tempat satu batch dijumlahkan; None = semua."""
+    regions = [(None, None)]
+    if city_id is not None:
+        # farm tanpa kota hanya ikut angka nasional
+        regions += [(province, None), (province, city_id)]
+    for (p, c), k, m in product(regions, (None, commodity_id), (None, month)):
+        yield p, c, k, m
+
+
+def rollup_key(province=None, city_id=None, commodity_id=None, month=None) -> str:
+    """Kunci unik HarvestRollup.key, "*" = semua."""
+    return "|".join([
+        province or "*",
+        "*" if city_id is None else str(city_id),
+        "*" if commodity_id is None else str(commodity_id),
+        "*" if month is None else f"{month:%Y-%m}",
+    ])
+
+
+def _level_deltas(region_deltas: dict) -> dict:
+    """{(province, city_id, commodity_id, month): delta} dasar → semua level hierarkinya."""
+    levels = {}
+    for base, delta in region_deltas.items():
+        for level in rollup_levels(*base):
+            levels.setdefault(level, HarvestRollupDelta()).add(delta)
+    return levels
+
+
+def apply_harvest_rollup_deltas(deltas: dict):
+    """
+    Tambahkan deltas {(farm_id, commodity_id, bulan): HarvestRollupDelta}
+    ke HarvestRollup. Wilayah farm dibaca dengan satu query; delta untuk
+    farm yang sudah tidak ada diabaikan (rollup-nya ikut terhapus lewat cascade).
+    Di dalam combine_harvest_rollup_deltas() delta hanya dikumpulkan.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if not delta.is_empty()}
+    if not deltas:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        for key, delta in deltas.items():
+            pending.setdefault(key, HarvestRollupDelta()).add(delta)
+        return
+    regions = farm_regions({farm_id for farm_id, _, _ in deltas})
+    region_deltas = {}
+    for (farm_id, commodity_id, month), delta in deltas.items():
+        if farm_id in regions:
+            base = (*regions[farm_id], commodity_id, month)
+            region_deltas.setdefault(base, HarvestRollupDelta()).add(delta)
+    _apply_level_deltas(_level_deltas(region_deltas))
+
+
+def _apply_level_deltas(levels: dict):
+    """
+    Tambahkan delta per level ke HarvestRollup, di dalam transaksi
+    pemanggil. Baris dibuat dulu kalau belum ada (ignore_conflicts), lalu
+    ditambah dengan F() + CASE per key dalam satu UPDATE per potongan key
+    (urut key). Baris yang kembali nol dihapus (hanya dicek kalau ada delta
+    pengurang).
+    """
+    HarvestRollup = apps.get_model("batches", "HarvestRollup")
+
+    levels = {rollup_key(*level): (level, delta) for level, delta in levels.items() if not delta.is_empty()}
+    if not levels:
+        return
+    with transaction.atomic():
+        HarvestRollup.objects.bulk_create(
+            [
+                HarvestRollup(
+                    key=key,
+                    province=province or "",
+                    city_id=city_id,
+                    commodity_id=commodity_id,
+                    month=month,
+                )
+                for key, ((province, city_id, commodity_id, month), _) in levels.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        keys = sorted(levels)
+        for start in range(0, len(keys), ROLLUP_KEY_CHUNK):
+            chunk = keys[start:start + ROLLUP_KEY_CHUNK]
+            updates = {}
+            for name in HARVEST_ROLLUP_MEASURES:
+                whens = [
+                    When(key=key, then=Value(getattr(levels[key][1], name)))
+                    for key in chunk
+                    if getattr(levels[key][1], name)
+                ]
+                if whens:
+                    output_field = HarvestRollup._meta.get_field(name)
+                    updates[name] = F(name) + Case(*whens, default=Value(0), output_field=output_field)
+            HarvestRollup.objects.filter(key__in=chunk).update(**updates)
+        shrinking = [
+            key for key in keys if levels[key][1].jumlah_batch < 0 or levels[key][1].diuji < 0
+        ]
+        for start in range(0, len(shrinking), ROLLUP_KEY_CHUNK):
+            HarvestRollup.objects.filter(
+                key__in=shrinking[start:start + ROLLUP_KEY_CHUNK], jumlah_batch=0, diuji=0
+            ).delete()
+
+
+def _batch_totals(batches, *group_fields) -> dict:
+    """{(*group_fields, commodity_id, bulan): HarvestRollupDelta} dari queryset batch (satu query)."""
+    ditahan = Q(shipment_status="DITAHAN")
+    dikirim = Q(shipment_status="SUDAH_DIKIRIM")
+    # alias "n_": nama ukuran sama dengan field batch (volume_kg)
+    rows = (
+        batches.order_by()
+        .annotate(bulan=TruncMonth("tanggal_panen"))
+        .values(*group_fields, "commodity_id", "bulan")
+        .annotate(
+            n_jumlah_batch=Count("pk"),
+            n_volume_kg=Sum("volume_kg"),
+            n_ditahan=Count("pk", filter=ditahan),
+            n_dikirim=Count("pk", filter=dikirim),
+            n_volume_dikirim_kg=Sum("volume_kg", filter=dikirim),
+            n_diuji=Count("lab_test"),
+        )
+    )
+    totals = {}
+    for row in rows:
+        key = (*(row[name] for name in group_fields), row["commodity_id"], row["bulan"])
+        totals[key] = HarvestRollupDelta(
+            **{name: row[f"n_{name}"] or 0 for name in HARVEST_ROLLUP_MEASURES}
+        )
+    return totals
+
+
+def move_harvest_rollups(group_field: str, moves: dict):
+    """
+    Geser seluruh batch dari wilayah lama ke wilayah baru.
+    group_field: "farm_id" (farm pindah kota) atau "farm__city_id" (kota
+    pindah provinsi); moves: {nilai group_field: (wilayah lama, wilayah baru)},
+    wilayah = (provinsi, city_id) seperti farm_regions.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    moves = {group: (old, new) for group, (old, new) in moves.items() if old != new}
+    if not moves:
+        return
+    region_deltas = {}
+    batches = HarvestBatch.objects.filter(**{f"{group_field}__in": moves})
+    for (group, commodity_id, month), total in _batch_totals(batches, group_field).items():
+        old, new = moves[group]
+        region_deltas.setdefault((*old, commodity_id, month), HarvestRollupDelta()).add(total, -1)
+        region_deltas.setdefault((*new, commodity_id, month), HarvestRollupDelta()).add(total)
+    _apply_level_deltas(_level_deltas(region_deltas))
+
+
+def harvest_rollup_rows() -> dict:
+    """{key: HarvestRollup} dihitung langsung dari tabel batch / uji lab."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    HarvestRollup = apps.get_model("batches", "HarvestRollup")
+
+    region_deltas = {}
+    for (province, city_id, commodity_id, month), total in _batch_totals(
+        HarvestBatch.objects.all(), "farm__city__province", "farm__city_id"
+    ).items():
+        region_deltas[(province if city_id is not None else None, city_id, commodity_id, month)] = total
+    rows = {}
+    for (province, city_id, commodity_id, month), delta in _level_deltas(region_deltas).items():
+        key = rollup_key(province, city_id, commodity_id, month)
+        rows[key] = HarvestRollup(
+            key=key,
+            province=province or "",
+            city_id=city_id,
+            commodity_id=commodity_id,
+            month=month,
+            **{name: getattr(delta, name) for name in HARVEST_ROLLUP_MEASURES},
+        )
+    return rows
+
+
+def rebuild_harvest_rollups() -> int:
+    """Bangun ulang seluruh HarvestRollup dari HarvestBatch / LabTest. Return jumlah baris."""
+    HarvestRollup = apps.get_model("batches", "HarvestRollup")
+
+    with transaction.atomic():
+        # kunci baris lama dulu supaya tidak ada delta yang ditulis di tengah rebuild
+        list(HarvestRollup.objects.select_for_update().order_by("pk").values_list("pk", flat=True))
+        rows = harvest_rollup_rows()
+        HarvestRollup.objects.all().delete()
+        HarvestRollup.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+# --- query ------------------------------------------------------------------
+
+def _pk(value):
+    return getattr(value, "pk", value)
+
+
+def harvest_rollup(province=None, city=None, commodity=None, month=None):
+    """
+    Satu baris rollup (None = semua) lewat index unik key. city / commodity
+    boleh instance atau pk; kalau city diisi, province tidak dipakai.
+    Return HarvestRollup kosong (belum disimpan) kalau belum ada batch.
+    """
+    HarvestRollup = apps.get_model("batches", "HarvestRollup")
+
+    city_id = _pk(city)
+    if city_id is not None:
+        province = (
+            apps.get_model("farms", "City").objects.filter(pk=city_id).values_list("province", flat=True).first()
+        )
+    month = rollup_month(month) if month is not None else None
+    key = rollup_key(province, city_id, _pk(commodity), month)
+    return HarvestRollup.objects.filter(key=key).first() or HarvestRollup(
+        key=key, province=province or "", city_id=city_id, commodity_id=_pk(commodity), month=month
+    )
+
+
+def harvest_rollups(by: str, province=None, city=None, commodity=None, month=None, since=None, until=None):
+    """
+    Rincian satu level hierarki: satu baris per nilai dimensi `by` (lihat
+    HARVEST_ROLLUP_LEVELS), dimensi lain sesuai filter (None = semua).
+    since / until membatasi bulan kalau by="month". Semua baris dibaca
+    dari index (province, city, commodity, month), tanpa join ke batch.
+    """
+    HarvestRollup = apps.get_model("batches", "HarvestRollup")
+
+    if by not in HARVEST_ROLLUP_LEVELS:
+        raise ValueError(f"by harus dari {list(HARVEST_ROLLUP_LEVELS)}, bukan {by!r}")
+
+    rows = HarvestRollup.objects.all()
+    if by == "province":
+        rows = rows.filter(city=None).exclude(province="")
+    elif by == "city":
+        rows = rows.filter(city__isnull=False).select_related("city")
+        if province:
+            rows = rows.filter(province=province)
+    elif city is not None:
+        rows = rows.filter(city=_pk(city))
+    else:
+        rows = rows.filter(city=None, province=province or "")
+
+    if by == "commodity":
+        rows = rows.filter(commodity__isnull=False).select_related("commodity")
+    else:
+        rows = rows.filter(commodity=_pk(commodity))
+
+    if by == "month":
+        rows = rows.filter(month__isnull=False)
+        if since is not None:
+            rows = rows.filter(month__gte=rollup_month(since))
+        if until is not None:
+            rows = rows.filter(month__lte=until)
+    else:
+        rows = rows.filter(month=rollup_month(month) if month is not None else None)
+    return rows.order_by({"city": "city__name", "commodity": "commodity__name"}.get(by, by))
@@ -0,0 +1,51 @@
+"""
+Rule set risiko yang sedang berlaku (lihat batches.models.RiskRuleSet).
+
+Dicache per proses supaya score_batch / shipment_status tidak query
+setiap dipanggil. Setiap rule set di-save / dihapus, versi cache di key
+
+    rules:active:version
+
+(cache Django bersama, lihat batches.checks) diganti setelah commit. Setiap
+pemanggilan membandingkan versi itu dengan versi saat rule set dimuat (satu
+GET ke cache, nol query database), jadi semua proses langsung memakai rule
+set baru. Kalau key versi hilang (evict / restart) rule set tetap dimuat
+ulang paling lambat setelah RULE_SET_CACHE_SECONDS.
+"""
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+RULE_SET_CACHE_SECONDS = 60
+
+VERSION_KEY = "rules:active:version"
+
+_active = {"rules": None, "version": 0, "loaded_at": 0.0}
+
+
+def get_active_rule_set():
+    """Versi tertinggi yang aktif, atau RiskRuleSet default (tidak disimpan)."""
+    now = time.monotonic()
+    version = cache.get(VERSION_KEY, 0)
+    if (
+        _active["rules"] is None
+        or _active["version"] != version
+        or now - _active["loaded_at"] > RULE_SET_CACHE_SECONDS
+    ):
+        RiskRuleSet = apps.get_model("batches", "RiskRuleSet")
+        rules = RiskRuleSet.objects.filter(is_active=True).order_by("-version").first()
+        _active["rules"] = rules if rules is not None else RiskRuleSet(version=0)
+        _active["version"] = version
+        _active["loaded_at"] = now
+    return _active["rules"]
+
+
+def clear_rule_set_cache():
+    """
+    Kosongkan cache proses ini sekarang, dan ganti versi di cache bersama
+    setelah commit supaya proses lain ikut memuat ulang.
+    """
+    _active["rules"] = None
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), timeout=None))
@@ -0,0 +1,181 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from farms.summary import activity_date, add_activity_summary_delta, apply_farm_summary_deltas, batch_farm_ids
+from .models import Activity, HarvestBatch, RiskRuleSet
+from .risk import refresh_shipment_status
+from .rollup import move_harvest_rollups
+from .rules import clear_rule_set_cache
+from .state import BATCH_STATE_FIELDS, BatchState, apply_batch_side_effects, batch_state
+from .trace import invalidate_trace
+
+# field Farm yang ikut tampil di snapshot trace
+FARM_TRACE_FIELDS = {"name", "location", "city"}
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def invalidate_related_trace(sender, instance, **kwargs):
+    invalidate_trace([instance.batch_id])
+
+
+@receiver(post_save, sender="farms.Farm")
+def invalidate_farm_trace(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Nama / lokasi farm ikut tampil di trace. Save yang hanya mengubah
+    risk_score (recalculate_farm_risk) tidak perlu menginvalidasi apa pun.
+    """
+    if created or (update_fields is not None and not FARM_TRACE_FIELDS & set(update_fields)):
+        return
+    invalidate_trace(instance.batches.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender="batches.Commodity")
+def invalidate_commodity_trace(sender, instance, created, **kwargs):
+    """Nama dan batas aman komoditas ikut tampil di trace."""
+    if not created:
+        invalidate_trace(HarvestBatch.objects.filter(commodity=instance).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender="farms.City")
+def invalidate_city_trace(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_trace(HarvestBatch.objects.filter(farm__city=instance).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender="labs.Laboratory")
+def invalidate_laboratory_trace(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_trace(HarvestBatch.objects.filter(lab_test__lab=instance).values_list("pk", flat=True))
+
+
+# Tabel turunan batch: FarmRiskBucket (farms.utils), FarmSummary
+# (farms.summary), HarvestRollup (batches.rollup) ---------------------------
+
+def _touches_risk_bucket(update_fields):
+    return update_fields is None or bool(HarvestBatch.RISK_BUCKET_FIELDS & set(update_fields))
+
+
+def _touches_summary(update_fields):
+    return update_fields is None or bool(HarvestBatch.FARM_SUMMARY_FIELDS & set(update_fields))
+
+
+def _touches_harvest_rollup(update_fields):
+    return update_fields is None or bool(HarvestBatch.HARVEST_ROLLUP_FIELDS & set(update_fields))
+
+
+@receiver(pre_save, sender=HarvestBatch)
+def load_batch_state(sender, instance, update_fields=None, **kwargs):
+    """Instance yang tidak dibaca lengkap dari DB: ambil state lamanya sekali untuk semua tabel."""
+    if instance._state.adding or hasattr(instance, "_batch_state"):
+        return
+    if not (
+        _touches_risk_bucket(update_fields)
+        or _touches_summary(update_fields)
+        or _touches_harvest_rollup(update_fields)
+    ):
+        return
+    old = HarvestBatch.objects.filter(pk=instance.pk).only(*BATCH_STATE_FIELDS).first()
+    instance._batch_state = old._batch_state if old else None
+
+
+@receiver(post_save, sender=HarvestBatch)
+def update_batch_state(sender, instance, created, update_fields=None, **kwargs):
+    touched = BatchState(*(
+        created or touches(update_fields)
+        for touches in (_touches_risk_bucket, _touches_summary, _touches_harvest_rollup)
+    ))
+    old = None if created else getattr(instance, "_batch_state", None)
+    new = batch_state(instance)
+    if old is not None:
+        # bagian yang tidak ikut update_fields masih bernilai lama di DB
+        new = BatchState(*(n if t else o for n, o, t in zip(new, old, touched)))
+    elif not created and not any(touched):
+        # tidak ada bagian state yang ikut disimpan: cukup invalidasi trace
+        apply_batch_side_effects([(instance.pk, new, new)])
+        return
+
+    apply_batch_side_effects([(instance.pk, old, new)])
+    instance._batch_state = new
+
+
+@receiver(post_delete, sender=HarvestBatch)
+def remove_batch_state(sender, instance, **kwargs):
+    old = getattr(instance, "_batch_state", None) or batch_state(instance)
+    apply_batch_side_effects([(instance.pk, old, None)])
+
+
+# Activity di FarmSummary (farms.summary) ------------------------------------
+
+@receiver(post_save, sender=Activity)
+def add_activity_to_summary(sender, instance, created, **kwargs):
+    deltas = {}
+    for farm_id in batch_farm_ids([instance.batch_id]):
+        if created:
+            add_activity_summary_delta(deltas, farm_id, activity_date(instance))
+        else:
+            # tanggal bisa mundur: aktivitas terakhir dihitung ulang
+            add_activity_summary_delta(deltas, farm_id, activity_date(instance), 0)
+    apply_farm_summary_deltas(deltas)
+
+
+@receiver(post_delete, sender=Activity)
+def remove_activity_from_summary(sender, instance, **kwargs):
+    deltas = {}
+    for farm_id in batch_farm_ids([instance.batch_id]):
+        add_activity_summary_delta(deltas, farm_id, activity_date(instance), -1)
+    apply_farm_summary_deltas(deltas)
+
+
+# wilayah farm / kota di HarvestRollup (batches.rollup) ---------------------
+
+def _farm_region(city_id):
+    City = apps.get_model("farms", "City")
+    if city_id is None:
+        return (None, None)
+    return (City.objects.filter(pk=city_id).values_list("province", flat=True).first(), city_id)
+
+
+@receiver(pre_save, sender="farms.Farm")
+def load_farm_region(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and "city" not in update_fields):
+        return
+    old_city_id = sender.objects.filter(pk=instance.pk).values_list("city_id", flat=True).first()
+    instance._harvest_region = _farm_region(old_city_id)
+
+
+@receiver(post_save, sender="farms.Farm")
+def move_farm_harvest_rollup(sender, instance, created, **kwargs):
+    """Farm pindah kota: seluruh batch-nya pindah wilayah di HarvestRollup."""
+    old_region = instance.__dict__.pop("_harvest_region", None)
+    if created or old_region is None:
+        return
+    move_harvest_rollups("farm_id", {instance.pk: (old_region, _farm_region(instance.city_id))})
+
+
+@receiver(pre_save, sender="farms.City")
+def load_city_province(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and "province" not in update_fields):
+        return
+    instance._harvest_province = sender.objects.filter(pk=instance.pk).values_list("province", flat=True).first()
+
+
+@receiver(post_save, sender="farms.City")
+def move_city_harvest_rollup(sender, instance, created, **kwargs):
+    """Kota pindah provinsi: batch semua farm di kota itu ikut pindah."""
+    old_province = instance.__dict__.pop("_harvest_province", None)
+    if created or old_province is None:
+        return
+    move_harvest_rollups(
+        "farm__city_id",
+        {instance.pk: ((old_province, instance.pk), (instance.province, instance.pk))},
+    )
+
+
+@receiver(post_save, sender=RiskRuleSet)
+@receiver(post_delete, sender=RiskRuleSet)
+def reload_rule_set(sender, **kwargs):
+    clear_rule_set_cache()
+    # cutoff rule set aktif bisa berubah: shipment_status yang tersimpan ikut
+    refresh_shipment_status()
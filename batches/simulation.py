@@ -0,0 +1,214 @@
+"""
+Simulasi what-if risk di atas seluruh data batch + lab test, tanpa menulis
+ke database.
+
+    snapshot = load_risk_snapshot()
+    baseline = simulate(snapshot)
+    skenario = simulate(snapshot, batas={"UDANG": 300})
+    skenario.distribution("commodity")
+
+Data dibaca sekali ke array NumPy (RiskSnapshot), lalu setiap skenario
+(batas Cs-137 per komoditas dan/atau rule set lain) dihitung dengan
+fungsi vektor yang sama dengan recompute_risk (batches.risk).
+"""
+import copy
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from farms.models import City, Farm
+from farms.utils import farm_risk_window_start
+from .models import Commodity, HarvestBatch, RiskRuleSet
+from .risk import AMAN, MASALAH, PENDING, score_batches, score_farms
+from .rules import get_active_rule_set
+from .utils import DEFAULT_BATAS_AMAN_CS137
+
+SHIPMENT_STATUSES = ["BELUM_DITINJAU", "LAYAK_KIRIM", "DITAHAN", "SUDAH_DIKIRIM"]
+GROUP_BY = ["commodity", "farm", "city", "month"]
+
+
+@dataclass
+class RiskSnapshot:
+    """Data batch dalam bentuk array, satu elemen per HarvestBatch."""
+
+    farm_index: np.ndarray
+    city_index: np.ndarray
+    commodity_index: np.ndarray
+    month_index: np.ndarray
+    in_window: np.ndarray
+    is_shipped: np.ndarray
+    has_test: np.ndarray
+    nilai: np.ndarray
+    # label untuk setiap index di atas
+    labels: dict = field(default_factory=dict)
+    # batas aman per komoditas saat ini (NaN = tidak diisi)
+    batas_komoditas: np.ndarray = None
+
+    def __len__(self):
+        return len(self.has_test)
+
+
+@dataclass
+class SimulationResult:
+    snapshot: RiskSnapshot
+    risk_score: np.ndarray        # float, NaN = belum ada LabTest
+    shipment_status: np.ndarray   # index ke SHIPMENT_STATUSES
+
+    def counts(self) -> dict:
+        """Jumlah batch per shipment_status untuk seluruh data."""
+        total = np.bincount(self.shipment_status, minlength=len(SHIPMENT_STATUSES))
+        return dict(zip(SHIPMENT_STATUSES, total.tolist()))
+
+    def distribution(self, by: str) -> list[dict]:
+        """
+        Distribusi per komoditas / farm / kota / bulan panen:
+        jumlah batch per shipment_status dan rata-rata risk_score.
+        """
+        if by not in GROUP_BY:
+            raise ValueError(f"by harus salah satu dari {GROUP_BY}")
+
+        group = getattr(self.snapshot, f"{by}_index")
+        labels = self.snapshot.labels[by]
+        n_groups = len(labels)
+        n_status = len(SHIPMENT_STATUSES)
+
+        counts = np.bincount(
+            group * n_status + self.shipment_status,
+            minlength=n_groups * n_status,
+        ).reshape(n_groups, n_status)
+
+        scored = ~np.isnan(self.risk_score)
+        risk_sum = np.bincount(group[scored], weights=self.risk_score[scored], minlength=n_groups)
+        risk_n = np.bincount(group[scored], minlength=n_groups)
+        risk_mean = np.divide(risk_sum, risk_n, out=np.full(n_groups, np.nan), where=risk_n > 0)
+
+        return [
+            {
+                by: labels[i],
+                "total": int(counts[i].sum()),
+                **dict(zip(SHIPMENT_STATUSES, counts[i].tolist())),
+                "risk_score_rata2": None if np.isnan(risk_mean[i]) else round(float(risk_mean[i]), 1),
+            }
+            for i in range(n_groups)
+            if counts[i].sum()
+        ]
+
+
+def _index(values, labels_by_id):
+    """Ubah list id jadi array index 0..n-1 + label per index."""
+    ids, index = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    lookup = {str(key): label for key, label in labels_by_id.items()}
+    return index, [lookup.get(i, i) for i in ids]
+
+
+def load_risk_snapshot() -> RiskSnapshot:
+    """Baca semua batch (+ lab test) ke array. Read-only, satu query utama."""
+    rows = list(
+        HarvestBatch.objects.order_by().values_list(
+            "farm_id",
+            "farm__city_id",
+            "commodity_id",
+            "tanggal_panen",
+            "is_shipped",
+            "lab_test__nilai_cs137",
+            "lab_test__pk",
+        )
+    )
+    n = len(rows)
+    commodities = list(Commodity.objects.order_by("code"))
+    commodity_position = {c.pk: i for i, c in enumerate(commodities)}
+
+    farm_index, farm_labels = _index(
+        [row[0] for row in rows], dict(Farm.objects.values_list("pk", "name"))
+    )
+    city_labels_by_id = dict(City.objects.values_list("pk", "name"))
+    city_labels_by_id["None"] = "(tanpa kota)"
+    city_index, city_labels = _index([row[1] for row in rows], city_labels_by_id)
+    month_index, month_labels = _index(
+        [row[3].strftime("%Y-%m") for row in rows], {}
+    )
+
+    window_start = farm_risk_window_start()
+    return RiskSnapshot(
+        farm_index=farm_index,
+        city_index=city_index,
+        commodity_index=np.fromiter(
+            (commodity_position[row[2]] for row in rows), dtype=np.int64, count=n
+        ),
+        month_index=month_index,
+        in_window=np.fromiter((row[3] >= window_start for row in rows), dtype=bool, count=n),
+        is_shipped=np.fromiter((row[4] for row in rows), dtype=bool, count=n),
+        has_test=np.fromiter((row[6] is not None for row in rows), dtype=bool, count=n),
+        nilai=np.array([np.nan if row[5] is None else row[5] for row in rows], dtype=float),
+        labels={
+            "commodity": [c.code for c in commodities],
+            "farm": farm_labels,
+            "city": city_labels,
+            "month": month_labels,
+        },
+        batas_komoditas=np.array(
+            [np.nan if c.default_batas_aman_cs137 is None else c.default_batas_aman_cs137
+             for c in commodities],
+            dtype=float,
+        ),
+    )
+
+
+def rule_set_with(rules=None, **overrides) -> RiskRuleSet:
+    """Salinan rule set (default: yang aktif) dengan beberapa ambang diganti. Tidak disimpan."""
+    rules = copy.copy(rules or get_active_rule_set())
+    names = {f.name for f in RiskRuleSet._meta.concrete_fields} - {"id", "version", "is_active", "catatan", "created_at"}
+    for name, value in overrides.items():
+        if name not in names:
+            raise ValueError(f"'{name}' bukan ambang di RiskRuleSet")
+        setattr(rules, name, type(getattr(rules, name))(value))
+    return rules
+
+
+def simulate(snapshot: RiskSnapshot, rules=None, batas=None, ignore_shipped=True) -> SimulationResult:
+    """
+    Hitung risk_score dan shipment_status semua batch untuk satu skenario.
+
+    rules: RiskRuleSet (default: rule set aktif), misal dari rule_set_with(...)
+    batas: {kode komoditas: batas aman Cs-137 baru} (None = hapus batas)
+    ignore_shipped: batch yang sudah dikirim tetap dinilai LAYAK_KIRIM / DITAHAN,
+        bukan SUDAH_DIKIRIM, supaya skenario bisa dibandingkan untuk data historis
+    """
+    rules = rules or get_active_rule_set()
+
+    batas_komoditas = snapshot.batas_komoditas.copy()
+    codes = snapshot.labels["commodity"]
+    for code, value in (batas or {}).items():
+        if code not in codes:
+            raise ValueError(f"Commodity '{code}' tidak ditemukan")
+        batas_komoditas[codes.index(code)] = np.nan if value is None else value
+    batas_batch = batas_komoditas[snapshot.commodity_index]
+
+    # kesimpulan seperti LabTest.save(), skor dengan fallback global
+    bermasalah = snapshot.has_test & ~np.isnan(batas_batch) & (snapshot.nilai > batas_batch)
+    status = np.where(snapshot.has_test, np.where(bermasalah, MASALAH, AMAN), PENDING)
+    farm_risk = score_farms(
+        snapshot.farm_index,
+        snapshot.in_window,
+        status == MASALAH,
+        len(snapshot.labels["farm"]),
+        rules,
+    )
+    risk = score_batches(
+        status,
+        snapshot.nilai,
+        np.where(np.isnan(batas_batch), DEFAULT_BATAS_AMAN_CS137, batas_batch),
+        farm_risk[snapshot.farm_index],
+        rules,
+    )
+
+    # urutan sama dengan HarvestBatch.shipment_status
+    shipment = np.select(
+        [np.isnan(risk), risk < rules.shipment_risk_cutoff],
+        [SHIPMENT_STATUSES.index("BELUM_DITINJAU"), SHIPMENT_STATUSES.index("LAYAK_KIRIM")],
+        default=SHIPMENT_STATUSES.index("DITAHAN"),
+    )
+    if not ignore_shipped:
+        shipment = np.where(snapshot.is_shipped, SHIPMENT_STATUSES.index("SUDAH_DIKIRIM"), shipment)
+
+    return SimulationResult(snapshot=snapshot, risk_score=risk, shipment_status=shipment)
@@ -0,0 +1,156 @@
+"""
+State batch yang menentukan isi tabel turunan: FarmRiskBucket,
+FarmSummary dan HarvestRollup, plus satu pintu untuk semua efek samping
+tulis HarvestBatch.
+
+State lama dibaca sekali per instance, di HarvestBatch.from_db atau
+(kalau instance tidak dibaca lengkap) dengan satu SELECT di pre_save,
+lalu dipakai bersama sebagai pembanding di signal post_save / post_delete
+dan di jalur bulk:
+
+    old = batch._batch_state          # BatchState saat dibaca
+    ...
+    apply_batch_side_effects([(batch.pk, old, batch_state(batch))])
+
+Signal (batches/signals.py) dan jalur bulk (import_data,
+labs.utils.apply_labtest_events) sama-sama lewat apply_batch_side_effects,
+jadi tabel turunan baru cukup ditambahkan di sini.
+"""
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from django.apps import apps
+from django.db import transaction
+
+from farms.summary import (
+    add_activity_summary_delta,
+    add_batch_summary_delta,
+    add_lab_test_summary_delta,
+    apply_farm_summary_deltas,
+    batch_summary_state,
+    combine_farm_summary_deltas,
+)
+from farms.utils import add_risk_bucket_delta, apply_risk_bucket_deltas, risk_bucket_state
+from labs.rollup import RollupDelta, apply_rollup_deltas, rollup_month
+from labs.workqueue import enqueue_batches, refresh_pending_lab_tests
+
+from .rollup import (
+    apply_harvest_rollup_deltas,
+    combine_harvest_rollup_deltas,
+    harvest_batch_deltas,
+    harvest_rollup_state,
+)
+from .trace import invalidate_trace
+
+# field yang dibutuhkan batch_state(); instance yang memuat semuanya
+# mendapat _batch_state di from_db
+BATCH_STATE_FIELDS = {
+    "farm_id", "commodity_id", "tanggal_panen", "quality_status",
+    "is_shipped", "volume_kg", "risk_score", "shipment_status",
+}
+
+
+class BatchState(NamedTuple):
+    risk_bucket: tuple      # farms.utils.risk_bucket_state
+    summary: tuple          # farms.summary.batch_summary_state
+    harvest_rollup: tuple   # batches.rollup.harvest_rollup_state
+
+
+def batch_state(batch) -> BatchState:
+    return BatchState(
+        risk_bucket_state(batch),
+        batch_summary_state(batch),
+        harvest_rollup_state(batch),
+    )
+
+
+@contextmanager
+def combine_side_effects():
+    """
+    Satu save HarvestBatch / LabTest (beserta activity default, UJI_LAB dan
+    risk batch-nya) menghasilkan beberapa delta FarmSummary dan
+    HarvestRollup; di dalam blok ini setiap tabel ditulis sekali di akhir.
+    FarmRiskBucket tetap langsung ditulis karena risk farm dibaca darinya
+    di tengah LabTest.save().
+    """
+    with (
+        transaction.atomic(savepoint=False),
+        combine_farm_summary_deltas(),
+        combine_harvest_rollup_deltas(),
+    ):
+        yield
+
+
+def apply_batch_side_effects(changes):
+    """
+    Terapkan perubahan sekumpulan batch ke semua tabel turunannya:
+    FarmRiskBucket, FarmSummary, HarvestRollup, Cs137Rollup (hasil uji
+    batch yang pindah farm / komoditas), antrian QC dan cache trace.
+
+    changes: list (kode_batch, old, new) dengan BatchState; old None =
+    batch baru, new None = batch dihapus. Bagian state yang sama tidak
+    menghasilkan delta; cache trace selalu diinvalidasi.
+    """
+    LabTest = apps.get_model("labs", "LabTest")
+    Activity = apps.get_model("batches", "Activity")
+
+    bucket_deltas, summary_deltas = {}, {}
+    created, requeue, moved_farm, moved_owner = [], [], {}, {}
+    for kode_batch, old, new in changes:
+        add_risk_bucket_delta(bucket_deltas, old and old.risk_bucket, new and new.risk_bucket)
+        add_batch_summary_delta(summary_deltas, old and old.summary, new and new.summary)
+        if old is None:
+            if new is not None:
+                created.append(kode_batch)
+            continue
+        if new is None:
+            continue
+        # antrian QC menyalin farm (kota) dan tanggal panen
+        if old.risk_bucket[:2] != new.risk_bucket[:2]:
+            requeue.append(kode_batch)
+        if old.summary[0] != new.summary[0]:
+            moved_farm[kode_batch] = (old.summary[0], new.summary[0])
+        if old.harvest_rollup[:2] != new.harvest_rollup[:2]:
+            moved_owner[kode_batch] = (old.harvest_rollup[:2], new.harvest_rollup[:2])
+
+    tests = {}
+    if moved_farm or moved_owner:
+        tests = {
+            batch_id: (tanggal_uji, nilai)
+            for batch_id, tanggal_uji, nilai in LabTest.objects.filter(
+                batch_id__in=moved_farm.keys() | moved_owner.keys()
+            ).values_list("batch_id", "tanggal_uji", "nilai_cs137")
+        }
+
+    # batch pindah farm: hasil uji dan timeline-nya ikut pindah di FarmSummary
+    if moved_farm:
+        for kode_batch, tanggal in Activity.objects.filter(batch_id__in=moved_farm).values_list(
+            "batch_id", "tanggal"
+        ):
+            old_farm, new_farm = moved_farm[kode_batch]
+            add_activity_summary_delta(summary_deltas, old_farm, tanggal, -1)
+            add_activity_summary_delta(summary_deltas, new_farm, tanggal, 1)
+        for kode_batch, (old_farm, new_farm) in moved_farm.items():
+            if kode_batch in tests:
+                add_lab_test_summary_delta(summary_deltas, old_farm, -1)
+                add_lab_test_summary_delta(summary_deltas, new_farm, 1)
+
+    # batch pindah farm / komoditas: hasil ujinya pindah baris Cs137Rollup
+    rollup_deltas = {}
+    for kode_batch, (old_owner, new_owner) in moved_owner.items():
+        if kode_batch not in tests:
+            continue
+        tanggal_uji, nilai = tests[kode_batch]
+        month = rollup_month(tanggal_uji)
+        rollup_deltas.setdefault((*old_owner, month), RollupDelta()).add(nilai, -1)
+        rollup_deltas.setdefault((*new_owner, month), RollupDelta()).add(nilai, 1)
+
+    apply_risk_bucket_deltas(bucket_deltas)
+    apply_farm_summary_deltas(summary_deltas)
+    apply_harvest_rollup_deltas(harvest_batch_deltas(
+        [(kode_batch, old and old.harvest_rollup, new and new.harvest_rollup) for kode_batch, old, new in changes]
+    ))
+    apply_rollup_deltas(rollup_deltas)
+    enqueue_batches(created)
+    refresh_pending_lab_tests(requeue)
+    invalidate_trace([kode_batch for kode_batch, _, _ in changes])
@@ -1,3 +1,504 @@
-from django.test import TestCase
+import threading
+from collections import Counter
+from datetime import date
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from batches.checks import check_trace_cache
+from batches.models import Activity, Commodity, HarvestBatch, HarvestRollup, RiskRuleSet
+from batches.pagination import InvalidCursor, keyset_page
+from batches.risk import recompute_risk, recompute_risk_sql, refresh_shipment_status
+from batches.rollup import rebuild_harvest_rollups
+from batches.rules import VERSION_KEY, clear_rule_set_cache, get_active_rule_set
+from batches.simulation import SHIPMENT_STATUSES, load_risk_snapshot, rule_set_with, simulate
+from batches.trace import _snapshot_key, _version_key, trace_version
+from batches.utils import reserve_sequence
+from batches.views import BATCH_LIST_SORTS
+from farms.models import City, Farm, FarmRiskBucket, FarmSummary
+from farms.utils import rebuild_risk_buckets
+from labs.models import LabTest
+
+DATA_DIR = str(settings.BASE_DIR / "data")
+
+
+class ImportedDataTestCase(TestCase):
+    """Data contoh dari data/*.csv, diimport sekali per kelas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # invalidasi trace ditulis on_commit
+        with cls.captureOnCommitCallbacks(execute=True):
+            call_command("import_data", "--data-dir", DATA_DIR, stdout=StringIO())
+
+    def rebuilt(self, rebuild, snapshot):
+        """snapshot() setelah rebuild(), tanpa menyimpan hasil rebuild-nya."""
+        sid = transaction.savepoint()
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild()
+        rows = snapshot()
+        transaction.savepoint_rollback(sid)
+        return rows
+
+
+def harvest_rollups():
+    return sorted(
+        HarvestRollup.objects.values_list(
+            "key", "jumlah_batch", "volume_kg", "ditahan", "dikirim", "volume_dikirim_kg", "diuji"
+        )
+    )
+
+
+def risk_buckets():
+    return sorted(FarmRiskBucket.objects.filter(total__gt=0).values_list("farm_id", "day", "total", "masalah"))
+
+
+class MaterializedTableTests(ImportedDataTestCase):
+    """HarvestRollup dan FarmRiskBucket harus selalu sama dengan hasil rebuild penuh."""
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(harvest_rollups(), self.rebuilt(rebuild_harvest_rollups, harvest_rollups))
+        self.assertEqual(risk_buckets(), self.rebuilt(rebuild_risk_buckets, risk_buckets))
+
+    def test_after_import(self):
+        self.assertTrue(HarvestRollup.objects.exists())
+        self.assertMatchesRebuild()
+
+    def test_batch_edits(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=False).first()
+        other_farm = Farm.objects.exclude(pk=batch.farm_id).exclude(city=batch.farm.city).first()
+        steps = [
+            ("kirim", lambda: setattr(batch, "is_shipped", True)),
+            ("volume", lambda: setattr(batch, "volume_kg", 1234.5)),
+            ("status", lambda: setattr(batch, "quality_status", "MASALAH")),
+            ("pindah farm + bulan", lambda: (
+                setattr(batch, "farm", other_farm), setattr(batch, "tanggal_panen", date(2024, 2, 10))
+            )),
+            ("komoditas", lambda: setattr(
+                batch, "commodity", Commodity.objects.exclude(pk=batch.commodity_id).first()
+            )),
+        ]
+        for name, change in steps:
+            with self.subTest(name):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                    batch.save()
+                self.assertMatchesRebuild()
+
+    def test_rollup_follows_transaction(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=True).first()
+        before = harvest_rollups()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            batch.volume_kg = 4321
+            batch.save()
+            # sudah tertulis sebelum commit, tanpa menunggu on_commit
+            self.assertNotEqual(harvest_rollups(), before)
+            raise RuntimeError
+        self.assertEqual(harvest_rollups(), before)
+
+        batch = HarvestBatch.objects.get(pk=batch.pk)
+        with self.captureOnCommitCallbacks(execute=False):
+            batch.is_shipped = True
+            batch.save()
+        self.assertMatchesRebuild()
+
+    def test_update_fields_save(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=True).first()
+        batch.volume_kg = 77.5
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save(update_fields=["volume_kg"])
+        self.assertMatchesRebuild()
+
+    def test_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            HarvestBatch.objects.filter(lab_test__isnull=False).first().delete()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.first().delete()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Farm.objects.first().delete()
+        self.assertMatchesRebuild()
+
+    def test_farm_and_city_region(self):
+        farm = Farm.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            farm.city = City.objects.exclude(pk=farm.city_id).exclude(province=farm.city.province).first()
+            farm.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            farm.city = None
+            farm.save()
+        self.assertMatchesRebuild()
+
+        city = Farm.objects.exclude(city=None).first().city
+        with self.captureOnCommitCallbacks(execute=True):
+            city.province = "Provinsi Baru"
+            city.save()
+        self.assertMatchesRebuild()
+
+
+def risk_snapshot():
+    return {
+        "batch": sorted(HarvestBatch.objects.values_list("pk", "quality_status", "risk_score", "shipment_status")),
+        "farm": sorted(Farm.objects.values_list("pk", "risk_score")),
+        "lab_test": sorted(LabTest.objects.values_list("batch_id", "kesimpulan")),
+        "bucket": risk_buckets(),
+        "summary": sorted(FarmSummary.objects.values_list(
+            "farm_id", "batch_aman", "batch_pending", "batch_masalah", "risk_total", "risk_count"
+        )),
+        "rollup": harvest_rollups(),
+    }
+
+
+class SaveQueryCountTests(ImportedDataTestCase):
+    def test_batch_create(self):
+        batch = HarvestBatch.objects.select_related("farm__city", "commodity").first()
+        get_active_rule_set()
+        # kode batch, batch, bucket, antrian QC, activity default, lalu satu
+        # tulis FarmSummary dan satu tulis HarvestRollup (semua key sekaligus)
+        with self.assertNumQueries(28), self.captureOnCommitCallbacks(execute=True):
+            HarvestBatch.objects.create(
+                farm=batch.farm,
+                commodity=batch.commodity,
+                tanggal_tebar=batch.tanggal_tebar,
+                tanggal_panen=date(2026, 5, 3),
+                volume_kg=100,
+                tujuan="Jepang",
+            )
+        self.assertEqual(harvest_rollups(), self.rebuilt(rebuild_harvest_rollups, harvest_rollups))
+
+
+class RuleSetCacheTests(TestCase):
+    def setUp(self):
+        # cache rule set per proses tidak ikut rollback antar test
+        self.addCleanup(cache.delete, VERSION_KEY)
+        self.addCleanup(clear_rule_set_cache)
+        clear_rule_set_cache()
+
+    def test_save_reloads_rule_set(self):
+        self.assertEqual(get_active_rule_set().version, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            RiskRuleSet.objects.create(version=1, is_active=True, shipment_risk_cutoff=60)
+        self.assertTrue(cache.has_key(VERSION_KEY))
+        self.assertEqual(get_active_rule_set().version, 1)
+
+    def test_other_process_change(self):
+        rule_set = RiskRuleSet.objects.create(version=1, is_active=True, shipment_risk_cutoff=60)
+        self.assertEqual(get_active_rule_set().shipment_risk_cutoff, 60)
+
+        # tulis tanpa signal, seperti proses lain sebelum commit-nya selesai:
+        # rule set dari cache proses ini, tanpa query
+        RiskRuleSet.objects.filter(pk=rule_set.pk).update(shipment_risk_cutoff=70)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_rule_set().shipment_risk_cutoff, 60)
+
+        # proses lain mengganti versi di cache bersama setelah commit
+        cache.set(VERSION_KEY, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_active_rule_set().shipment_risk_cutoff, 70)
+
+
+class ReserveSequenceTests(TransactionTestCase):
+    THREADS = 4
+    RESERVATIONS = 10
+
+    def test_rollback_cancels_reservation(self):
+        self.assertEqual(reserve_sequence("JKT-F0001-20260501", 3), range(1, 4))
+        with self.assertRaises(ValueError), transaction.atomic():
+            reserve_sequence("JKT-F0001-20260501", 2)
+            raise ValueError
+        self.assertEqual(reserve_sequence("JKT-F0001-20260501"), range(4, 5))
+
+    def test_concurrent_reservations_do_not_overlap(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("thread lain butuh database file, bukan SQLite in-memory")
+        barrier = threading.Barrier(self.THREADS)
+        reserved, errors = [], []
+
+        def reserve(count):
+            try:
+                # semua thread mulai bersamaan, termasuk saat baris sequence belum ada
+                barrier.wait()
+                for _ in range(self.RESERVATIONS):
+                    reserved.extend(reserve_sequence("JKT-F0001-20260501", count))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(i + 1,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.RESERVATIONS * sum(range(1, self.THREADS + 1))
+        self.assertEqual(sorted(reserved), list(range(1, total + 1)))
+
+
+class RecomputeRiskTests(ImportedDataTestCase):
+    def test_numpy_matches_sql(self):
+        # batas komoditas turun tanpa signal: kesimpulan, status, risk batch
+        # dan risk farm semuanya basi
+        Commodity.objects.update(default_batas_aman_cs137=300)
+        Farm.objects.update(risk_score=0)
+
+        python = self.rebuilt(recompute_risk, risk_snapshot)
+        sql = self.rebuilt(recompute_risk_sql, risk_snapshot)
+        self.assertNotEqual(python, risk_snapshot())
+        self.assertEqual(python, sql)
+
+    def test_sql_applies_bucket_deltas(self):
+        Commodity.objects.update(default_batas_aman_cs137=300)
+        buckets = set(FarmRiskBucket.objects.values_list("pk", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(recompute_risk_sql().batches)
+        self.assertEqual(risk_buckets(), self.rebuilt(rebuild_risk_buckets, risk_buckets))
+        # bucket hanya di-update, tidak dibangun ulang
+        self.assertEqual(set(FarmRiskBucket.objects.values_list("pk", flat=True)), buckets)
+
+    def test_farm_ids_limits_recompute(self):
+        Farm.objects.update(risk_score=0)
+        farm = Farm.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            recompute_risk(farm_ids=[farm.pk])
+        untouched = Farm.objects.exclude(pk=farm.pk)
+        self.assertEqual(set(untouched.values_list("risk_score", flat=True)), {0})
+
+
+def risk_totals():
+    return (
+        dict(Counter(HarvestBatch.objects.values_list("shipment_status", flat=True))),
+        sorted(HarvestBatch.objects.filter(risk_score__isnull=False).values_list("risk_score", flat=True)),
+    )
+
+
+class RiskSimulationTests(ImportedDataTestCase):
+    def simulated(self, **scenario):
+        """Total simulate(...) dalam bentuk risk_totals(), dan pastikan tidak menulis apa pun."""
+        with CaptureQueriesContext(connection) as queries:
+            result = simulate(load_risk_snapshot(), ignore_shipped=False, **scenario)
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in queries.captured_queries))
+        counts = {status: n for status, n in result.counts().items() if n}
+        return counts, sorted(int(risk) for risk in result.risk_score if risk == risk)
+
+    def test_matches_recompute_risk(self):
+        # batas berubah tanpa signal: risk tersimpan basi, simulasi harus
+        # mengikuti data saat ini seperti recompute_risk
+        Commodity.objects.update(default_batas_aman_cs137=600)
+        before = risk_snapshot()
+        self.assertEqual(self.simulated(), self.rebuilt(recompute_risk, risk_totals))
+
+        batas = {code: 300 for code in Commodity.objects.values_list("code", flat=True)}
+        simulated = self.simulated(batas=batas)
+        Commodity.objects.update(default_batas_aman_cs137=300)
+        self.assertEqual(simulated, self.rebuilt(recompute_risk, risk_totals))
+        self.assertNotEqual(simulated, risk_totals())
+
+        rules = rule_set_with(shipment_risk_cutoff=40)
+        self.assertEqual(
+            self.simulated(rules=rules, batas=batas),
+            self.rebuilt(lambda: recompute_risk(rules=rules), risk_totals),
+        )
+        self.assertEqual(risk_snapshot(), before)
+
+    def test_distribution(self):
+        result = simulate(load_risk_snapshot(), ignore_shipped=False)
+        rows = result.distribution("commodity")
+        self.assertEqual(sum(row["total"] for row in rows), HarvestBatch.objects.count())
+        self.assertEqual(
+            {status: sum(row[status] for row in rows) for status in SHIPMENT_STATUSES},
+            result.counts(),
+        )
+        with self.assertRaises(ValueError):
+            result.distribution("laboratorium")
+
+
+class ShipmentStatusTests(ImportedDataTestCase):
+    def setUp(self):
+        self.addCleanup(cache.delete, VERSION_KEY)
+        self.addCleanup(clear_rule_set_cache)
+
+    def assertStoredStatusCurrent(self, rules=None):
+        for batch in HarvestBatch.objects.all():
+            self.assertEqual(batch.shipment_status, batch.compute_shipment_status(rules), batch.pk)
+        self.assertEqual(harvest_rollups(), self.rebuilt(rebuild_harvest_rollups, harvest_rollups))
+
+    def test_refresh_follows_rule_set(self):
+        rules = rule_set_with(shipment_risk_cutoff=25)
+        expected = {
+            batch.pk for batch in HarvestBatch.objects.all()
+            if batch.compute_shipment_status(rules) != batch.shipment_status
+        }
+        self.assertTrue(expected)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(refresh_shipment_status(rules), expected)
+        self.assertStoredStatusCurrent(rules)
+        self.assertEqual(refresh_shipment_status(rules), set())
+
+        # rule set baru disimpan: status tersimpan ikut lewat signal
+        with self.captureOnCommitCallbacks(execute=True):
+            RiskRuleSet.objects.create(version=1, is_active=True, shipment_risk_cutoff=80)
+        self.assertStoredStatusCurrent()
+        self.assertTrue(HarvestBatch.objects.filter(shipment_status="LAYAK_KIRIM", risk_score=75).exists())
+
+    def test_batch_list_filters_stored_status(self):
+        farm = Farm.objects.filter(batches__shipment_status="DITAHAN").first()
+        self.client.force_login(farm.owner.user)
+        owned = HarvestBatch.objects.filter(farm__owner=farm.owner)
+        counts = Counter(owned.values_list("shipment_status", flat=True))
+
+        response = self.client.get(reverse("batches:batch_list"), {"status": "DITAHAN"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [batch.pk for batch in response.context["batches"]],
+            list(owned.filter(shipment_status="DITAHAN").order_by(*BATCH_LIST_SORTS["terbaru"])
+                 .values_list("pk", flat=True)),
+        )
+        self.assertEqual(
+            {value: n for value, _, n in response.context["status_counts"] if n}, dict(counts)
+        )
+        self.assertEqual(response.context["total"], owned.count())
+
+
+class KeysetPaginationTests(ImportedDataTestCase):
+    ordering = ["-tanggal_panen", "-kode_batch"]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # beberapa batch dengan tanggal panen sama: urutan dipecah kode_batch
+        batch = HarvestBatch.objects.first()
+        with cls.captureOnCommitCallbacks(execute=True):
+            for volume in (100, 200, 300):
+                HarvestBatch.objects.create(
+                    farm=batch.farm,
+                    commodity=batch.commodity,
+                    tanggal_tebar=batch.tanggal_tebar,
+                    tanggal_panen=batch.tanggal_panen,
+                    volume_kg=volume,
+                    tujuan="Jepang",
+                )
+
+    def test_next_and_prev(self):
+        expected = list(HarvestBatch.objects.order_by(*self.ordering).values_list("pk", flat=True))
+        self.assertEqual(len(expected), 8)
+
+        pages, cursor = [], None
+        while True:
+            page = keyset_page(HarvestBatch.objects.all(), self.ordering, cursor, 3)
+            pages.append(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual([b.pk for page in pages for b in page.items], expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 2])
+
+        # mundur dari halaman terakhir memberi halaman yang sama persis
+        back = keyset_page(HarvestBatch.objects.all(), self.ordering, pages[-1].prev_cursor, 3)
+        self.assertEqual([b.pk for b in back.items], [b.pk for b in pages[1].items])
+        self.assertTrue(back.has_next)
+        first = keyset_page(HarvestBatch.objects.all(), self.ordering, back.prev_cursor, 3)
+        self.assertEqual([b.pk for b in first.items], [b.pk for b in pages[0].items])
+        self.assertFalse(first.has_previous)
+        self.assertEqual(first.next_cursor, pages[0].next_cursor)
+
+    def test_invalid_cursor(self):
+        for cursor in ("rusak", "WyJ4IiwgW11d"):
+            with self.subTest(cursor), self.assertRaises(InvalidCursor):
+                keyset_page(HarvestBatch.objects.all(), self.ordering, cursor, 3)
+
+
+class TraceConditionalGetTests(ImportedDataTestCase):
+    def setUp(self):
+        self.batch = HarvestBatch.objects.filter(activities__isnull=False).distinct().first()
+        self.url = reverse("batches:batch_trace_json", args=[self.batch.pk])
+
+    def get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(self.url, **headers)
+
+    def assertInvalidated(self, change):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.get(response["ETag"]).status_code, 304)
+        return response
+
+    def test_farm_rename(self):
+        farm = self.batch.farm
+        farm.name = "Tambak Baru"
+        response = self.assertInvalidated(farm.save)
+        self.assertIn("Tambak Baru", response.content.decode())
+
+    def test_activity_create_and_delete(self):
+        self.assertInvalidated(lambda: Activity.objects.create(
+            batch=self.batch, tanggal=date(2026, 5, 1), jenis="LAINNYA", lokasi="Gudang", pelaku="Kurir"
+        ))
+        self.assertInvalidated(lambda: Activity.objects.filter(batch=self.batch).first().delete())
+
+    def test_batch_and_lab_test_changes(self):
+        self.batch.volume_kg += 1
+        self.assertInvalidated(self.batch.save)
+        lab_test = LabTest.objects.first()
+        self.url = reverse("batches:batch_trace_json", args=[lab_test.batch_id])
+        self.assertInvalidated(lab_test.delete)
+
+    def test_unknown_batch(self):
+        # kode yang tidak ada (scan QR salah, pencarian landing) tidak
+        # meninggalkan key versi maupun snapshot di cache
+        for url in (
+            reverse("batches:batch_trace_json", args=["TIDAK-ADA"]),
+            reverse("batches:batch_trace", args=["TIDAK-ADA"]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.get(reverse("main:landing"), {"kode_batch": "TIDAK-ADA"})
+        self.assertFalse(cache.has_key(_version_key("TIDAK-ADA")))
+        self.assertFalse(cache.has_key(_snapshot_key("TIDAK-ADA", 0)))
+        self.assertEqual(trace_version("TIDAK-ADA"), 0)
+
+    def test_batch_detail_is_read_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.filter(batch=self.batch).delete()
+        url = reverse("batches:batch_detail", args=[self.batch.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(Activity.objects.filter(batch=self.batch).exists())
+
+        # batch lama tanpa timeline diisi lewat command, bukan lewat GET
+        self.url = url
+        self.assertInvalidated(lambda: call_command("backfill_default_activities", stdout=StringIO()))
+        self.assertEqual(
+            set(Activity.objects.filter(batch=self.batch).values_list("jenis", flat=True)),
+            {"PENEBARAN", "PANEN", "DARI_TAMBAK"},
+        )
+
+
+class TraceCacheCheckTests(SimpleTestCase):
+    LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    REDIS = {"default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:6379/1",
+    }}
+
+    def test_production_needs_shared_cache(self):
+        with override_settings(PRODUCTION=True, CACHES=self.LOCMEM):
+            self.assertEqual([error.id for error in check_trace_cache(None)], ["batches.E001"])
+        with override_settings(PRODUCTION=True, CACHES=self.REDIS):
+            self.assertEqual(check_trace_cache(None), [])
+        with override_settings(PRODUCTION=False, CACHES=self.LOCMEM):
+            self.assertEqual(check_trace_cache(None), [])
@@ -0,0 +1,197 @@
+"""
+Snapshot timeline batch untuk halaman traceability publik (scan QR).
+
+Snapshot (batch, farm, komoditas, hasil lab, activity) disimpan di cache
+Django dengan key yang memuat versi per batch:
+
+    trace:<SNAPSHOT_SCHEMA>:<kode_batch>:<versi>
+
+Versi per batch disimpan di key terpisah dan diganti setiap kali
+HarvestBatch, Activity atau LabTest batch itu berubah (lihat
+batches/signals.py). Batch yang belum pernah berubah tidak punya key versi
+(versi 0), jadi membaca trace kode yang tidak ada tidak meninggalkan key
+apa pun. Snapshot lama tidak perlu dihapus: tidak akan dibaca lagi dan
+kedaluwarsa sendiri setelah TRACE_SNAPSHOT_TIMEOUT.
+
+Cache hit = dua GET ke cache, nol query database.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from .utils import get_batas_aman_cs137
+
+# naikkan kalau isi snapshot berubah, supaya snapshot format lama tidak dibaca
+SNAPSHOT_SCHEMA = 2
+
+# snapshot yang tidak pernah diinvalidasi tetap dibangun ulang sesekali
+TRACE_SNAPSHOT_TIMEOUT = getattr(settings, "TRACE_SNAPSHOT_TIMEOUT", 60 * 60 * 24)
+
+
+def _version_key(kode_batch: str) -> str:
+    return f"trace:{SNAPSHOT_SCHEMA}:{kode_batch}:version"
+
+
+def _snapshot_key(kode_batch: str, version: int) -> str:
+    return f"trace:{SNAPSHOT_SCHEMA}:{kode_batch}:{version}"
+
+
+def _new_version() -> int:
+    # unik walau key versi sempat hilang dari cache (evict / restart)
+    return time.time_ns()
+
+
+def trace_version(kode_batch: str) -> int:
+    """Versi snapshot yang berlaku sekarang untuk batch ini; 0 kalau belum ada key."""
+    return cache.get(_version_key(kode_batch), 0)
+
+
+def invalidate_trace(kode_batches):
+    """
+    Ganti versi snapshot batch-batch ini setelah transaksi commit.
+
+    Dipanggil setelah commit supaya pembaca yang membangun snapshot dari
+    data lama tidak menyimpannya di bawah versi baru.
+    """
+    kode_batches = set(kode_batches)
+    if not kode_batches:
+        return
+
+    def bump():
+        version = _new_version()
+        cache.set_many({_version_key(kode): version for kode in kode_batches}, timeout=None)
+        # key versi yang hilang (evict / restart) jatuh ke versi 0 lagi:
+        # snapshot versi 0 yang dibangun sebelum perubahan ini dibuang
+        cache.delete_many([_snapshot_key(kode, 0) for kode in kode_batches])
+
+    transaction.on_commit(bump)
+
+
+def build_trace_snapshot(kode_batch: str):
+    """
+    Bangun snapshot dari database (dua query). None kalau batch tidak ada.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    Activity = apps.get_model("batches", "Activity")
+    LabTest = apps.get_model("labs", "LabTest")
+
+    batch = (
+        HarvestBatch.objects
+        .select_related("farm__city", "commodity", "lab_test__lab")
+        .filter(pk=kode_batch)
+        .first()
+    )
+    if batch is None:
+        return None
+
+    jenis_display = dict(Activity.ACTIVITY_CHOICES)
+    activities = []
+    changed_at = [batch.updated_at]
+    for act in Activity.objects.filter(batch_id=batch.pk):
+        activities.append({
+            "tanggal": act.tanggal,
+            "jenis": act.jenis,
+            "jenis_display": jenis_display.get(act.jenis, act.jenis),
+            "lokasi": act.lokasi,
+            "pelaku": act.pelaku,
+            "keterangan": act.keterangan,
+        })
+        changed_at.append(act.created_at)
+
+    try:
+        lab_test = batch.lab_test
+    except LabTest.DoesNotExist:
+        lab_test = None
+    else:
+        changed_at.append(lab_test.updated_at)
+
+    lab = None
+    if lab_test is not None:
+        lab = {
+            "nilai_cs137": lab_test.nilai_cs137,
+            "kesimpulan": lab_test.kesimpulan,
+            "tanggal_uji": lab_test.tanggal_uji,
+            "lab": lab_test.lab.nama if lab_test.lab else None,
+            "batas_aman_cs137": get_batas_aman_cs137(batch),
+        }
+
+    farm = batch.farm
+    return {
+        "kode_batch": batch.kode_batch,
+        "last_modified": max(changed_at),
+        "tanggal_tebar": batch.tanggal_tebar,
+        "tanggal_panen": batch.tanggal_panen,
+        "volume_kg": batch.volume_kg,
+        "tujuan": batch.tujuan,
+        "quality_status": batch.quality_status,
+        "quality_status_display": batch.get_quality_status_display(),
+        "risk_score": batch.risk_score,
+        "shipment_status": batch.shipment_status,
+        "has_received_activity": any(a["jenis"] == "DITERIMA" for a in activities),
+        "commodity": batch.commodity.name,
+        "farm": {
+            "name": farm.name,
+            "location": farm.location,
+            "city": farm.city.name if farm.city else None,
+        },
+        "lab_test": lab,
+        "activities": activities,
+    }
+
+
+def _version_time(version: int) -> datetime:
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def trace_last_modified(kode_batch: str):
+    """
+    Waktu perubahan terakhir batch, activity-nya, atau lab test-nya
+    (validator conditional GET). Diambil dari snapshot kalau ada di cache,
+    kalau tidak dengan satu query agregat. None kalau batch tidak ada.
+
+    Perubahan yang tidak meninggalkan timestamp di baris batch (farm /
+    komoditas diubah, activity dihapus) tetap terlihat lewat waktu versi
+    snapshot, yang diganti invalidate_trace.
+    """
+    version = trace_version(kode_batch)
+    snapshot = cache.get(_snapshot_key(kode_batch, version))
+    if snapshot is not None:
+        return max(snapshot["last_modified"], _version_time(version))
+
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    row = (
+        HarvestBatch.objects
+        .filter(pk=kode_batch)
+        .values("updated_at", "lab_test__updated_at")
+        .annotate(last_activity=Max("activities__created_at"))
+        .order_by("updated_at")
+        .first()
+    )
+    if row is None:
+        return None
+    return max(_version_time(version), *(value for value in row.values() if value is not None))
+
+
+def trace_etag(kode_batch: str, last_modified, variant: str = "") -> str:
+    """
+    ETag dari versi snapshot (diganti setiap invalidate_trace) dan waktu
+    perubahan terakhir; variant untuk representasi berbeda.
+    """
+    version = trace_version(kode_batch)
+    return f"{SNAPSHOT_SCHEMA}-{kode_batch}-{version}-{last_modified.timestamp():.6f}{variant}"
+
+
+def get_trace_snapshot(kode_batch: str):
+    """Snapshot dari cache; kalau belum ada, bangun lalu simpan."""
+    key = _snapshot_key(kode_batch, trace_version(kode_batch))
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_trace_snapshot(kode_batch)
+        if snapshot is not None:
+            cache.add(key, snapshot, timeout=TRACE_SNAPSHOT_TIMEOUT)
+    return snapshot
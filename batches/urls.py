@@ -8,6 +8,10 @@ urlpatterns = [
     path("", views.batch_list, name="batch_list"),
     path("create/", views.batch_create, name="batch_create"),
 
+    # halaman publik (scan QR), read-only dari snapshot cache
+    path("trace/<str:pk>/", views.batch_trace, name="batch_trace"),
+    path("trace/<str:pk>/json/", views.batch_trace_json, name="batch_trace_json"),
+
     path("<str:pk>/", views.batch_detail, name="batch_detail"),
     path("<str:pk>/edit/", views.batch_update, name="batch_update"),
     path("<str:pk>/delete/", views.batch_delete, name="batch_delete"),
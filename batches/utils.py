@@ -4,8 +4,12 @@ from typing import TYPE_CHECKING
 
 from django.utils import timezone
 from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import F
 
+from farms.summary import activity_summary_deltas, apply_farm_summary_deltas
 from farms.utils import recalculate_farm_risk
+from .rules import get_active_rule_set
 
 if TYPE_CHECKING:
     from .models import HarvestBatch
@@ -49,52 +53,37 @@ def recalculate_batch_risk(batch: HarvestBatch):
     # Cek LabTest (desain: 1:1 per batch)
     lab_test = getattr(batch, "lab_test", None)
 
-    # Kasus 3 – belum ada LabTest
     if lab_test is None:
-        batch.quality_status = "PENDING"
-        # risk_score dikosongkan supaya shipment_status = BELUM_DITINJAU
-        batch.risk_score = None
-        batch.save(update_fields=["quality_status", "risk_score"])
-        return None
+        quality_status, risk_score = score_batch(None, None, None, farm_risk)
+    else:
+        quality_status, risk_score = score_batch(
+            lab_test.kesimpulan,
+            lab_test.nilai_cs137,
+            get_batas_aman_cs137(batch),  # ← ambil dari komoditas + fallback global
+            farm_risk,
+        )
+
+    batch.quality_status = quality_status
+    batch.risk_score = risk_score
+    batch.save(update_fields=["quality_status", "risk_score", "updated_at"])
+    return batch.risk_score
 
-    # Kasus 1 – ada LabTest bermasalah
-    if lab_test.kesimpulan == "BERMASALAH":
-        base_risk = 90
-        batch.quality_status = "MASALAH"
 
-    else:
-        # Kasus 2 – ada LabTest dan kesimpulan AMAN
-        batas = get_batas_aman_cs137(batch)  # ← ambil dari komoditas + fallback global
-
-        # batas dijamin > 0 karena fallback = 500,
-        # tapi tetap kita jaga case aneh (misal di-set 0)
-        if batas:
-            worst_ratio = lab_test.nilai_cs137 / batas
-        else:
-            # fallback ekstrem: kalau batas tidak terdefinisi masuk case ini,
-            # anggap dekat limit
-            worst_ratio = 1.0
-
-        if worst_ratio <= 0.50:
-            base_risk = 30
-        elif worst_ratio <= 0.80:
-            base_risk = 50
-        else:
-            base_risk = 75
-
-        batch.quality_status = "AMAN"
-
-    # Penyesuaian dengan Farm Risk (likelihood)
-    if farm_risk <= 40:
-        extra = 0
-    elif farm_risk <= 70:
-        extra = 10
-    else:
-        extra = 20
+def score_batch(kesimpulan, nilai_cs137, batas, farm_risk, rules=None):
+    """
+    Aturan skor batch tanpa akses database, dipakai recalculate_batch_risk
+    dan perhitungan ulang massal (defer_labtest_side_effects).
+    Ambang batas diambil dari rule set aktif (RiskRuleSet).
 
-    batch.risk_score = min(100, base_risk + extra)
-    batch.save(update_fields=["quality_status", "risk_score"])
-    return batch.risk_score
+    - belum ada LabTest          → PENDING, risk_score kosong
+    - LabTest BERMASALAH         → MASALAH, risk dasar tinggi
+    - LabTest AMAN               → risk dasar dari rasio nilai / batas
+    ditambah penalti dari Farm.risk_score.
+
+    Return (quality_status, risk_score).
+    """
+    rules = rules or get_active_rule_set()
+    return rules.score_batch(kesimpulan, nilai_cs137, batas, farm_risk)
 
 
 def generate_batch_code(farm, tanggal_panen=None) -> str:
@@ -106,9 +95,10 @@ def generate_batch_code(farm, tanggal_panen=None) -> str:
     - nomor urut 3 digit
     Contoh: IDM-F0012-20250301-001
     """
+    return reserve_batch_codes(farm, tanggal_panen, 1)[0]
 
-    HarvestBatch = apps.get_model("batches", "HarvestBatch")
 
+def batch_code_prefix(farm, tanggal_panen=None) -> str:
     city = getattr(farm, "city", None)
     city_code = getattr(city, "code", None) or "XXX"
 
@@ -123,24 +113,119 @@ def generate_batch_code(farm, tanggal_panen=None) -> str:
     else:
         date_part = timezone.now().strftime("%Y%m%d")
 
-    prefix = f"{city_code}-{farm_part}-{date_part}"
+    return f"{city_code}-{farm_part}-{date_part}"
 
-    # Cari kode terakhir dengan prefix ini, lalu increment suffix
-    last_batch = (
-        HarvestBatch.objects.filter(kode_batch__startswith=prefix)
-        .order_by("-kode_batch")
-        .first()
-    )
 
-    if last_batch and last_batch.kode_batch:
-        # Format: PREFIX-XYZ  → ambil bagian akhir
-        try:
-            last_suffix_str = last_batch.kode_batch.split("-")[-1]
-            last_suffix = int(last_suffix_str)
-        except (ValueError, IndexError):
-            last_suffix = 0
-    else:
-        last_suffix = 0
+def reserve_batch_codes(farm, tanggal_panen=None, count: int = 1) -> list[str]:
+    """
+    Pesan `count` kode_batch berurutan untuk satu farm + tanggal panen
+    dalam satu kali increment, misal untuk bulk_create banyak batch.
+    """
+    prefix = batch_code_prefix(farm, tanggal_panen)
+    return [f"{prefix}-{suffix:03d}" for suffix in reserve_sequence(prefix, count)]
+
 
-    new_suffix = last_suffix + 1
-    return f"{prefix}-{new_suffix:03d}"
+def reserve_sequence(prefix: str, count: int = 1) -> range:
+    """
+    Naikkan BatchCodeSequence.last_value untuk prefix ini sebanyak `count`
+    secara atomik dan kembalikan rentang suffix yang didapat.
+
+    UPDATE ... SET last_value = last_value + n mengunci baris sequence
+    sampai transaksi selesai, jadi dua request bersamaan untuk prefix
+    yang sama tidak pernah mendapat suffix yang sama. Kalau transaksi
+    pemanggil rollback, nomor yang dipesan ikut batal.
+
+    Prefix yang belum punya baris (batch pertama farm itu di tanggal itu)
+    mulai dari 0; prefix data lama sudah diisi migrasi 0003.
+    """
+    BatchCodeSequence = apps.get_model("batches", "BatchCodeSequence")
+    sequences = BatchCodeSequence.objects.filter(prefix=prefix)
+
+    with transaction.atomic():
+        if not sequences.update(last_value=F("last_value") + count):
+            try:
+                with transaction.atomic():
+                    BatchCodeSequence.objects.create(prefix=prefix, last_value=count)
+            except IntegrityError:
+                # sudah dibuat request lain di saat yang sama
+                sequences.update(last_value=F("last_value") + count)
+        last_value = sequences.values_list("last_value", flat=True).get()
+
+    return range(last_value - count + 1, last_value + 1)
+
+
+def farm_pelaku(farm) -> str:
+    """Nama pelaku untuk activity dari tambak: nama owner, fallback nama farm."""
+    pelaku = farm.name
+    owner_profile = getattr(farm, "owner", None)  # ini UserProfile atau None
+    if owner_profile is not None:
+        user = getattr(owner_profile, "user", None)
+        if user is not None:
+            pelaku = user.get_full_name() or user.username
+    return pelaku
+
+
+def build_default_activities(batches) -> list:
+    """
+    Activity timeline default (PENEBARAN, PANEN, DARI_TAMBAK) untuk
+    sekumpulan batch, belum disimpan.
+
+    Farm + owner + user untuk kolom pelaku diambil dengan satu query
+    join untuk semua batch sekaligus.
+    """
+    Activity = apps.get_model("batches", "Activity")
+    Farm = apps.get_model("farms", "Farm")
+
+    farms = Farm.objects.select_related("owner__user").in_bulk(
+        {batch.farm_id for batch in batches}
+    )
+
+    activities = []
+    for batch in batches:
+        farm = farms[batch.farm_id]
+        pelaku = farm_pelaku(farm)
+
+        # PENEBARAN (kalau tanggal_tebar ada)
+        if batch.tanggal_tebar:
+            activities.append(Activity(
+                batch=batch,
+                tanggal=batch.tanggal_tebar,
+                jenis="PENEBARAN",
+                lokasi=farm.location,
+                pelaku=pelaku,
+                keterangan="Penebaran benur awal siklus",
+            ))
+
+        # PANEN
+        activities.append(Activity(
+            batch=batch,
+            tanggal=batch.tanggal_panen,
+            jenis="PANEN",
+            lokasi=farm.location,
+            pelaku=pelaku,
+            keterangan="Panen utama",
+        ))
+
+        # DARI_TAMBAK
+        activities.append(Activity(
+            batch=batch,
+            tanggal=batch.created_at.date() if batch.created_at else timezone.now().date(),
+            jenis="DARI_TAMBAK",
+            lokasi=farm.location,
+            pelaku=pelaku,
+            keterangan="Batch didaftarkan ke sistem oleh farm owner",
+        ))
+    return activities
+
+
+def create_default_activities(batches, batch_size=None) -> list:
+    """Simpan timeline default untuk semua batch dengan satu bulk_create."""
+    Activity = apps.get_model("batches", "Activity")
+    activities = Activity.objects.bulk_create(
+        build_default_activities(batches), batch_size=batch_size
+    )
+    # bulk_create tidak mengirim signal: FarmSummary diperbarui di sini
+    apply_farm_summary_deltas(
+        activity_summary_deltas(activities, farms={batch.pk: batch.farm_id for batch in batches})
+    )
+    return activities
@@ -1,11 +1,17 @@
 # batches/views.py
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.db.models import Count
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.views.decorators.http import condition
 
 from .models import HarvestBatch, Activity
-from .forms import HarvestBatchForm  # tambahin ActivityManualForm nanti
+from .forms import BatchFilterForm, HarvestBatchForm  # tambahin ActivityManualForm nanti
+from .pagination import InvalidCursor, keyset_page
+from .trace import get_trace_snapshot, trace_etag, trace_last_modified
+from .utils import farm_pelaku
 
 
 def _require_farm_owner(request):
@@ -29,71 +35,95 @@ def _check_batch_owner(request, batch: HarvestBatch):
         raise PermissionDenied("Anda tidak berhak mengubah batch dari tambak lain.")
     return profile
 
-# batches/views.py
-from .models import HarvestBatch, Activity
-from django.utils import timezone
 
-def _get_pelaku_from_farm(farm):
-    pelaku = farm.name
-    owner_profile = getattr(farm, "owner", None)
-    if owner_profile is not None:
-        user = getattr(owner_profile, "user", None)
-        if user is not None:
-            pelaku = user.get_full_name() or user.username
-    return pelaku
+BATCH_LIST_PAGE_SIZE = 50
 
+# sort → urutan keyset; kode_batch (unik) sebagai pemecah seri
+BATCH_LIST_SORTS = {
+    "terbaru": ["-created_at", "-kode_batch"],
+    "terlama": ["created_at", "kode_batch"],
+    "panen": ["-tanggal_panen", "-kode_batch"],
+}
 
-def _ensure_default_activities(batch: HarvestBatch):
-    """Bikin activity PENEBARAN/PANEN/DARI_TAMBAK kalau belum ada sama sekali."""
-    if batch.activities.exists():
-        return
 
-    farm = batch.farm
-    pelaku = _get_pelaku_from_farm(farm)
+# @login_required
+def batch_list(request):
+    """
+    Daftar batch milik farm owner. Filter dan urutan dikerjakan di SQL,
+    halaman memakai keyset pagination (?cursor=...), jadi halaman mana pun
+    hanya membaca BATCH_LIST_PAGE_SIZE baris lewat index.
+    """
+    profile = _require_farm_owner(request)
 
-    if batch.tanggal_tebar:
-        Activity.objects.create(
-            batch=batch,
-            tanggal=batch.tanggal_tebar,
-            jenis="PENEBARAN",
-            lokasi=farm.location,
-            pelaku=pelaku,
-            keterangan="Penebaran benur awal siklus",
-        )
+    form = BatchFilterForm(request.GET, profile=profile)
+    owned = HarvestBatch.objects.filter(farm__owner=profile)
+    filtered = form.filter(owned)
 
-    Activity.objects.create(
-        batch=batch,
-        tanggal=batch.tanggal_panen,
-        jenis="PANEN",
-        lokasi=farm.location,
-        pelaku=pelaku,
-        keterangan="Panen utama",
+    # jumlah per status kirim untuk filter lain yang sedang aktif
+    status_counts = dict(
+        form.filter(owned, ignore=("status",))
+        .order_by()
+        .values_list("shipment_status")
+        .annotate(jumlah=Count("pk"))
     )
 
-    Activity.objects.create(
-        batch=batch,
-        tanggal=batch.created_at.date() if batch.created_at else timezone.now().date(),
-        jenis="DARI_TAMBAK",
-        lokasi=farm.location,
-        pelaku=pelaku,
-        keterangan="Batch didaftarkan ke sistem oleh farm owner",
-    )
+    try:
+        page = keyset_page(
+            filtered.select_related("farm", "commodity"),
+            BATCH_LIST_SORTS[form.sort_key],
+            request.GET.get("cursor"),
+            BATCH_LIST_PAGE_SIZE,
+        )
+    except InvalidCursor:
+        return redirect(f"{request.path}?{_query_without(request.GET, 'cursor')}")
 
+    context = {
+        "form": form,
+        "page": page,
+        "batches": page.items,
+        "status": form.cleaned_data.get("status", ""),
+        "status_counts": [
+            (value, label, status_counts.get(value, 0))
+            for value, label in HarvestBatch.SHIPMENT_STATUS_CHOICES
+        ],
+        "total": sum(status_counts.values()),
+        "filter_query": _query_without(request.GET, "cursor"),
+        "status_query": _query_without(request.GET, "cursor", "status"),
+    }
+    return render(request, "batch_list.html", context)
 
-# @login_required
-def batch_list(request):
-    profile = _require_farm_owner(request)
 
-    batches = (
-        HarvestBatch.objects
-        .select_related("farm", "commodity")
-        .filter(farm__owner=profile)
-    )
+def _query_without(params, *names) -> str:
+    query = params.copy()
+    for name in names:
+        query.pop(name, None)
+    return query.urlencode()
+
+
+def _trace_last_modified(request, pk):
+    """Validator conditional GET, dihitung sekali per request."""
+    if not hasattr(request, "trace_last_modified"):
+        request.trace_last_modified = trace_last_modified(pk)
+    return request.trace_last_modified
 
-    return render(request, "batch_list.html", {"batches": batches})
+
+def _trace_page_etag(request, pk):
+    last_modified = _trace_last_modified(request, pk)
+    if last_modified is None:
+        return None
+    # halaman HTML ikut berbeda per user (navbar, tombol kelola)
+    return trace_etag(pk, last_modified, f"-html-{request.user.pk or 'anon'}")
+
+
+def _trace_json_etag(request, pk):
+    last_modified = _trace_last_modified(request, pk)
+    if last_modified is None:
+        return None
+    return trace_etag(pk, last_modified, "-json")
 
 
 # @login_required
+@condition(etag_func=_trace_page_etag, last_modified_func=_trace_last_modified)
 def batch_detail(request, pk):
     """
     Detail 1 batch + daftar activity (timeline)
@@ -101,15 +131,15 @@ def batch_detail(request, pk):
     """
     batch = get_object_or_404(
         HarvestBatch.objects
-        .select_related("farm", "commodity")
+        .select_related("farm", "commodity", "lab_test")
         .prefetch_related("activities"),
         pk=pk,
     )
     # _check_batch_owner(request, batch)
-    _ensure_default_activities(batch)
-
+    # GET hanya membaca: timeline default dibuat HarvestBatch.save() / import,
+    # batch lama tanpa activity diisi backfill_default_activities
     activities = batch.activities.all()
-    has_received_activity = activities.filter(jenis="DITERIMA").exists()
+    has_received_activity = any(activity.jenis == "DITERIMA" for activity in activities)
 
     context = {
         "batch": batch,
@@ -119,6 +149,29 @@ def batch_detail(request, pk):
     return render(request, "batch_detail.html", context)
 
 
+@condition(etag_func=_trace_page_etag, last_modified_func=_trace_last_modified)
+def batch_trace(request, pk):
+    """
+    Halaman traceability publik (tujuan scan QR dan pencarian di landing page).
+    Read-only dan dilayani dari snapshot di cache: cache hit tanpa query database.
+    """
+    trace = get_trace_snapshot(pk)
+    if trace is None:
+        raise Http404("Batch dengan kode tersebut tidak ditemukan.")
+
+    return render(request, "batch_trace.html", {"trace": trace})
+
+
+@condition(etag_func=_trace_json_etag, last_modified_func=_trace_last_modified)
+def batch_trace_json(request, pk):
+    """Snapshot trace yang sama dalam bentuk JSON, untuk sistem pembeli yang polling."""
+    trace = get_trace_snapshot(pk)
+    if trace is None:
+        raise Http404("Batch dengan kode tersebut tidak ditemukan.")
+
+    return JsonResponse(trace)
+
+
 # @login_required
 def batch_create(request):
     _require_farm_owner(request)
@@ -162,16 +215,6 @@ def batch_delete(request, pk):
 
     return render(request, "batch_confirm_delete.html", {"batch": batch})
 
-def _get_pelaku_from_farm(farm):
-    pelaku = farm.name
-    owner_profile = getattr(farm, "owner", None)
-    if owner_profile is not None:
-        user = getattr(owner_profile, "user", None)
-        if user is not None:
-            pelaku = user.get_full_name() or user.username
-    return pelaku
-
-
 # @login_required
 def batch_mark_shipped(request, pk):
     """
@@ -187,7 +230,7 @@ def batch_mark_shipped(request, pk):
         batch.save()
 
         farm = batch.farm
-        pelaku = _get_pelaku_from_farm(farm)
+        pelaku = farm_pelaku(farm)
 
         Activity.objects.create(
             batch=batch,
@@ -214,7 +257,7 @@ def batch_mark_received(request, pk):
         already = batch.activities.filter(jenis="DITERIMA").exists()
         if not already:
             farm = batch.farm
-            pelaku = _get_pelaku_from_farm(farm)
+            pelaku = farm_pelaku(farm)
 
             Activity.objects.create(
                 batch=batch,
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import City, Farm
+from .models import City, Farm, FarmSummary
 
 # Register your models here.
 admin.site.register(City)
-admin.site.register(Farm)
\ No newline at end of file
+admin.site.register(Farm)
+admin.site.register(FarmSummary)
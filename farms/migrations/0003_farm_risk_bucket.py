@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_buckets(apps, schema_editor):
+    """Isi FarmRiskBucket dari batch yang sudah ada."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    FarmRiskBucket = apps.get_model("farms", "FarmRiskBucket")
+
+    rows = (
+        HarvestBatch.objects.order_by()
+        .values("farm_id", "tanggal_panen")
+        .annotate(
+            total=Count("pk"),
+            masalah=Count("pk", filter=Q(quality_status="MASALAH")),
+        )
+    )
+    FarmRiskBucket.objects.bulk_create(
+        [
+            FarmRiskBucket(
+                farm_id=row["farm_id"],
+                day=row["tanggal_panen"],
+                total=row["total"],
+                masalah=row["masalah"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0003_batch_code_sequence'),
+        ('farms', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmRiskBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('masalah', models.IntegerField(default=0)),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_buckets', to='farms.farm')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('farm', 'day'), name='unique_farm_risk_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    """Isi FarmSummary semua farm dari batch, uji lab dan activity yang sudah ada."""
+    Farm = apps.get_model("farms", "Farm")
+    FarmSummary = apps.get_model("farms", "FarmSummary")
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    LabTest = apps.get_model("labs", "LabTest")
+    Activity = apps.get_model("batches", "Activity")
+
+    rows = {pk: FarmSummary(farm_id=pk) for pk in Farm.objects.values_list("pk", flat=True)}
+    shipped = Q(is_shipped=True)
+    # alias "n_": nama counter sama dengan field batch (volume_kg)
+    totals = {
+        "total_batch": Count("pk"),
+        "batch_aman": Count("pk", filter=Q(quality_status="AMAN")),
+        "batch_pending": Count("pk", filter=Q(quality_status="PENDING")),
+        "batch_masalah": Count("pk", filter=Q(quality_status="MASALAH")),
+        "batch_dikirim": Count("pk", filter=shipped),
+        "volume_kg": Sum("volume_kg"),
+        "volume_dikirim_kg": Sum("volume_kg", filter=shipped),
+        "risk_total": Sum("risk_score"),
+        "risk_count": Count("risk_score"),
+    }
+    for row in HarvestBatch.objects.order_by().values("farm_id").annotate(
+        **{f"n_{name}": aggregate for name, aggregate in totals.items()}
+    ):
+        summary = rows[row["farm_id"]]
+        for name in totals:
+            setattr(summary, name, row[f"n_{name}"] or 0)
+    for farm_id, jumlah in (
+        LabTest.objects.order_by().values("batch__farm_id").annotate(n=Count("pk")).values_list("batch__farm_id", "n")
+    ):
+        rows[farm_id].sudah_diuji = jumlah
+    for farm_id, jumlah, terakhir in (
+        Activity.objects.order_by()
+        .values("batch__farm_id")
+        .annotate(n=Count("pk"), terakhir=Max("tanggal"))
+        .values_list("batch__farm_id", "n", "terakhir")
+    ):
+        rows[farm_id].jumlah_aktivitas = jumlah
+        rows[farm_id].aktivitas_terakhir = terakhir
+    FarmSummary.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_batch_list_indexes'),
+        ('farms', '0003_farm_risk_bucket'),
+        ('labs', '0008_pending_lab_assignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmSummary',
+            fields=[
+                ('farm', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='farms.farm')),
+                ('total_batch', models.IntegerField(default=0)),
+                ('batch_aman', models.IntegerField(default=0)),
+                ('batch_pending', models.IntegerField(default=0)),
+                ('batch_masalah', models.IntegerField(default=0)),
+                ('batch_dikirim', models.IntegerField(default=0)),
+                ('volume_kg', models.FloatField(default=0)),
+                ('volume_dikirim_kg', models.FloatField(default=0)),
+                ('risk_total', models.IntegerField(default=0)),
+                ('risk_count', models.IntegerField(default=0)),
+                ('sudah_diuji', models.IntegerField(default=0)),
+                ('jumlah_aktivitas', models.IntegerField(default=0)),
+                ('aktivitas_terakhir', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
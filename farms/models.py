@@ -21,3 +21,65 @@ class Farm(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class FarmRiskBucket(models.Model):
+    """
+    Jumlah batch (total dan MASALAH) per farm per tanggal_panen.
+
+    Dijaga incremental setiap status / tanggal panen batch berubah
+    (lihat farms.utils.apply_risk_bucket_deltas), supaya Farm Risk Score
+    cukup menjumlahkan bucket di window 180 hari, bukan scan tabel batch.
+    """
+
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name="risk_buckets")
+    day = models.DateField()
+    total = models.IntegerField(default=0)
+    masalah = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["farm", "day"], name="unique_farm_risk_bucket"),
+        ]
+
+    def __str__(self):
+        return f"{self.farm} {self.day}: {self.masalah}/{self.total}"
+
+
+class FarmSummary(models.Model):
+    """
+    Ringkasan satu farm untuk dashboard owner: jumlah batch per status mutu,
+    volume (total / sudah dikirim), rata-rata risk, batch belum diuji dan
+    aktivitas terakhir.
+
+    Dijaga incremental setiap HarvestBatch / LabTest / Activity ditulis
+    (lihat farms.summary), jadi dashboard cukup membaca satu baris per
+    farm, berapa pun panjang histori batch-nya.
+    """
+
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+    total_batch = models.IntegerField(default=0)
+    batch_aman = models.IntegerField(default=0)
+    batch_pending = models.IntegerField(default=0)
+    batch_masalah = models.IntegerField(default=0)
+    batch_dikirim = models.IntegerField(default=0)
+    volume_kg = models.FloatField(default=0)
+    volume_dikirim_kg = models.FloatField(default=0)
+    # jumlah dan banyaknya risk_score batch yang sudah punya skor (rata-rata = total / count)
+    risk_total = models.IntegerField(default=0)
+    risk_count = models.IntegerField(default=0)
+    sudah_diuji = models.IntegerField(default=0)
+    jumlah_aktivitas = models.IntegerField(default=0)
+    aktivitas_terakhir = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.farm}: {self.total_batch} batch"
+
+    @property
+    def avg_risk(self):
+        return round(self.risk_total / self.risk_count, 1) if self.risk_count else None
+
+    @property
+    def belum_diuji(self) -> int:
+        return self.total_batch - self.sudah_diuji
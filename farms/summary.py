@@ -0,0 +1,327 @@
+"""
+Ringkasan per farm (FarmSummary) untuk dashboard owner.
+
+Setiap tulis HarvestBatch / LabTest / Activity menghasilkan delta kecil
+per farm yang digabung ke barisnya:
+
+    deltas = {}
+    add_batch_summary_delta(deltas, old_state, batch_summary_state(batch))
+    add_activity_summary_delta(deltas, farm_id, tanggal)
+    apply_farm_summary_deltas(deltas)
+
+Signal (batches/signals.py) menangani save per baris; jalur bulk
+(import_data, labs.ingest, apply_labtest_events) memanggil fungsi yang
+sama. Operasi massal seperti recompute_risk cukup memanggil
+refresh_farm_summaries untuk farm yang tersentuh.
+
+Satu save bisa menghasilkan beberapa delta (batch, hasil uji, activity
+default / UJI_LAB); di dalam combine_farm_summary_deltas() semuanya
+digabung dan ditulis sekali di akhir blok.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+# field counter FarmSummary; aktivitas_terakhir ditangani terpisah
+SUMMARY_COUNTERS = [
+    "total_batch",
+    "batch_aman",
+    "batch_pending",
+    "batch_masalah",
+    "batch_dikirim",
+    "volume_kg",
+    "volume_dikirim_kg",
+    "risk_total",
+    "risk_count",
+    "sudah_diuji",
+    "jumlah_aktivitas",
+]
+
+QUALITY_COUNTERS = {"AMAN": "batch_aman", "PENDING": "batch_pending", "MASALAH": "batch_masalah"}
+
+
+@dataclass
+class FarmSummaryDelta:
+    total_batch: int = 0
+    batch_aman: int = 0
+    batch_pending: int = 0
+    batch_masalah: int = 0
+    batch_dikirim: int = 0
+    volume_kg: float = 0.0
+    volume_dikirim_kg: float = 0.0
+    risk_total: int = 0
+    risk_count: int = 0
+    sudah_diuji: int = 0
+    jumlah_aktivitas: int = 0
+    aktivitas_terakhir: object = None
+    # ada activity yang dihapus / diubah: aktivitas_terakhir dihitung ulang
+    activity_removed: bool = False
+
+    def is_empty(self) -> bool:
+        return not self.activity_removed and self.aktivitas_terakhir is None and not any(
+            getattr(self, name) for name in SUMMARY_COUNTERS
+        )
+
+    def add(self, other):
+        for name in SUMMARY_COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        if other.aktivitas_terakhir is not None and (
+            self.aktivitas_terakhir is None or other.aktivitas_terakhir > self.aktivitas_terakhir
+        ):
+            self.aktivitas_terakhir = other.aktivitas_terakhir
+        self.activity_removed = self.activity_removed or other.activity_removed
+
+
+# delta yang ditahan combine_farm_summary_deltas(); None = langsung ditulis
+_pending: ContextVar[dict | None] = ContextVar("farm_summary_pending", default=None)
+
+
+@contextmanager
+def combine_farm_summary_deltas():
+    """
+    Di dalam blok ini apply_farm_summary_deltas() hanya mengumpulkan delta;
+    gabungannya ditulis sekali saat blok selesai tanpa error. Blok bersarang
+    ikut blok terluar. Panggil di dalam transaksi.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    apply_farm_summary_deltas(pending)
+
+
+def batch_summary_state(batch):
+    """Kontribusi satu batch: (farm_id, quality_status, is_shipped, volume_kg, risk_score)."""
+    # nilai bisa masih berupa string (misal dari import_data) sebelum dibaca ulang
+    opts = batch._meta
+    return (
+        batch.farm_id,
+        batch.quality_status,
+        opts.get_field("is_shipped").to_python(batch.is_shipped),
+        float(opts.get_field("volume_kg").to_python(batch.volume_kg) or 0),
+        opts.get_field("risk_score").to_python(batch.risk_score),
+    )
+
+
+def activity_date(activity):
+    return activity._meta.get_field("tanggal").to_python(activity.tanggal)
+
+
+def add_batch_summary_delta(deltas: dict, old_state, new_state):
+    """Catat perpindahan satu batch dari old_state ke new_state (None = belum ada / dihapus)."""
+    if old_state == new_state:
+        return
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        farm_id, quality_status, is_shipped, volume_kg, risk_score = state
+        delta = deltas.setdefault(farm_id, FarmSummaryDelta())
+        delta.total_batch += sign
+        if quality_status in QUALITY_COUNTERS:
+            counter = QUALITY_COUNTERS[quality_status]
+            setattr(delta, counter, getattr(delta, counter) + sign)
+        delta.volume_kg += sign * volume_kg
+        if is_shipped:
+            delta.batch_dikirim += sign
+            delta.volume_dikirim_kg += sign * volume_kg
+        if risk_score is not None:
+            delta.risk_total += sign * risk_score
+            delta.risk_count += sign
+
+
+def add_lab_test_summary_delta(deltas: dict, farm_id, sign: int = 1):
+    deltas.setdefault(farm_id, FarmSummaryDelta()).sudah_diuji += sign
+
+
+def add_activity_summary_delta(deltas: dict, farm_id, tanggal, sign: int = 1):
+    delta = deltas.setdefault(farm_id, FarmSummaryDelta())
+    delta.jumlah_aktivitas += sign
+    if sign > 0:
+        if delta.aktivitas_terakhir is None or tanggal > delta.aktivitas_terakhir:
+            delta.aktivitas_terakhir = tanggal
+    else:
+        delta.activity_removed = True
+
+
+def activity_summary_deltas(activities, farms=None) -> dict:
+    """
+    Delta untuk sekumpulan Activity baru (misal dari bulk_create).
+    farms: {batch_id: farm_id} kalau sudah diketahui; sisanya dibaca dengan satu query.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    farms = dict(farms or {})
+    missing = {activity.batch_id for activity in activities} - farms.keys()
+    if missing:
+        farms.update(HarvestBatch.objects.filter(pk__in=missing).values_list("pk", "farm_id"))
+    deltas = {}
+    for activity in activities:
+        if activity.batch_id in farms:
+            add_activity_summary_delta(deltas, farms[activity.batch_id], activity_date(activity))
+    return deltas
+
+
+def lab_test_summary_deltas(batch_ids, sign: int = 1) -> dict:
+    """Delta untuk LabTest baru / terhapus milik batch_ids, dihitung per farm dengan satu query."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    deltas = {}
+    for farm_id, jumlah in (
+        HarvestBatch.objects.filter(pk__in=batch_ids)
+        .order_by()
+        .values("farm_id")
+        .annotate(n=Count("pk"))
+        .values_list("farm_id", "n")
+    ):
+        add_lab_test_summary_delta(deltas, farm_id, sign * jumlah)
+    return deltas
+
+
+def apply_farm_summary_deltas(deltas: dict):
+    """
+    Tambahkan deltas {farm_id: FarmSummaryDelta} ke FarmSummary. Baris
+    dibuat dulu kalau belum ada (ignore_conflicts), lalu dikunci dan
+    di-bulk_update. Pengurangan untuk farm tanpa baris (misal farm-nya
+    sedang dihapus) diabaikan. Di dalam combine_farm_summary_deltas()
+    delta hanya dikumpulkan.
+    """
+    FarmSummary = apps.get_model("farms", "FarmSummary")
+
+    deltas = {farm_id: delta for farm_id, delta in deltas.items() if not delta.is_empty()}
+    if not deltas:
+        return
+
+    pending = _pending.get()
+    if pending is not None:
+        for farm_id, delta in deltas.items():
+            pending.setdefault(farm_id, FarmSummaryDelta()).add(delta)
+        return
+
+    with transaction.atomic():
+        FarmSummary.objects.bulk_create(
+            [
+                FarmSummary(farm_id=farm_id)
+                for farm_id, delta in deltas.items()
+                if any(getattr(delta, name) > 0 for name in SUMMARY_COUNTERS)
+            ],
+            ignore_conflicts=True,
+        )
+        rows = list(FarmSummary.objects.select_for_update().filter(farm_id__in=deltas).order_by("pk"))
+
+        now = timezone.now()
+        stale = []
+        for row in rows:
+            delta = deltas[row.farm_id]
+            row.updated_at = now  # bulk_update tidak mengisi auto_now
+            for name in SUMMARY_COUNTERS:
+                setattr(row, name, getattr(row, name) + getattr(delta, name))
+            if delta.activity_removed:
+                stale.append(row)
+            elif delta.aktivitas_terakhir is not None and (
+                row.aktivitas_terakhir is None or delta.aktivitas_terakhir > row.aktivitas_terakhir
+            ):
+                row.aktivitas_terakhir = delta.aktivitas_terakhir
+
+        if stale:
+            Activity = apps.get_model("batches", "Activity")
+            latest = dict(
+                Activity.objects.filter(batch__farm_id__in=[row.farm_id for row in stale])
+                .order_by()
+                .values("batch__farm_id")
+                .annotate(terakhir=Max("tanggal"))
+                .values_list("batch__farm_id", "terakhir")
+            )
+            for row in stale:
+                row.aktivitas_terakhir = latest.get(row.farm_id)
+
+        FarmSummary.objects.bulk_update(
+            rows, [*SUMMARY_COUNTERS, "aktivitas_terakhir", "updated_at"], batch_size=1000
+        )
+
+
+def farm_summary_rows(farm_ids=None) -> dict:
+    """{farm_id: FarmSummary} dihitung langsung dari tabel batch / uji lab / activity."""
+    Farm = apps.get_model("farms", "Farm")
+    FarmSummary = apps.get_model("farms", "FarmSummary")
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    LabTest = apps.get_model("labs", "LabTest")
+    Activity = apps.get_model("batches", "Activity")
+
+    farms = Farm.objects.all()
+    batches = HarvestBatch.objects.all()
+    lab_tests = LabTest.objects.all()
+    activities = Activity.objects.all()
+    if farm_ids is not None:
+        farms = farms.filter(pk__in=farm_ids)
+        batches = batches.filter(farm_id__in=farm_ids)
+        lab_tests = lab_tests.filter(batch__farm_id__in=farm_ids)
+        activities = activities.filter(batch__farm_id__in=farm_ids)
+
+    rows = {pk: FarmSummary(farm_id=pk) for pk in farms.values_list("pk", flat=True)}
+    shipped = Q(is_shipped=True)
+    # alias "n_": nama counter sama dengan field batch (volume_kg)
+    totals = {
+        "total_batch": Count("pk"),
+        "batch_aman": Count("pk", filter=Q(quality_status="AMAN")),
+        "batch_pending": Count("pk", filter=Q(quality_status="PENDING")),
+        "batch_masalah": Count("pk", filter=Q(quality_status="MASALAH")),
+        "batch_dikirim": Count("pk", filter=shipped),
+        "volume_kg": Sum("volume_kg"),
+        "volume_dikirim_kg": Sum("volume_kg", filter=shipped),
+        "risk_total": Sum("risk_score"),
+        "risk_count": Count("risk_score"),
+    }
+    for row in batches.order_by().values("farm_id").annotate(
+        **{f"n_{name}": aggregate for name, aggregate in totals.items()}
+    ):
+        summary = rows[row["farm_id"]]
+        for name in totals:
+            setattr(summary, name, row[f"n_{name}"] or 0)
+    for farm_id, jumlah in (
+        lab_tests.order_by().values("batch__farm_id").annotate(n=Count("pk")).values_list("batch__farm_id", "n")
+    ):
+        rows[farm_id].sudah_diuji = jumlah
+    for farm_id, jumlah, terakhir in (
+        activities.order_by()
+        .values("batch__farm_id")
+        .annotate(n=Count("pk"), terakhir=Max("tanggal"))
+        .values_list("batch__farm_id", "n", "terakhir")
+    ):
+        rows[farm_id].jumlah_aktivitas = jumlah
+        rows[farm_id].aktivitas_terakhir = terakhir
+    return rows
+
+
+def refresh_farm_summaries(farm_ids=None) -> int:
+    """
+    Hitung ulang FarmSummary farm_ids (None = semua farm) dari tabel
+    sumbernya, untuk operasi massal dan perbaikan manual. Return jumlah farm.
+    """
+    FarmSummary = apps.get_model("farms", "FarmSummary")
+
+    with transaction.atomic():
+        existing = FarmSummary.objects.all()
+        if farm_ids is not None:
+            farm_ids = set(farm_ids)
+            existing = existing.filter(farm_id__in=farm_ids)
+        # kunci baris lama dulu supaya delta dari signal tidak hilang di tengah
+        list(existing.select_for_update().order_by("pk").values_list("pk", flat=True))
+        rows = farm_summary_rows(farm_ids)
+        existing.delete()
+        FarmSummary.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+def batch_farm_ids(batch_ids) -> set:
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    return set(HarvestBatch.objects.filter(pk__in=batch_ids).values_list("farm_id", flat=True))
@@ -1,3 +1,102 @@
-from django.test import TestCase
+from datetime import date
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+
+from batches.models import Activity, HarvestBatch
+from batches.risk import recompute_risk
+from batches.tests import ImportedDataTestCase
+from farms.models import Farm, FarmSummary
+from farms.summary import SUMMARY_COUNTERS, refresh_farm_summaries
+from labs.models import LabTest
+from profiles.models import UserProfile
+
+
+def farm_summaries():
+    return sorted(FarmSummary.objects.values_list("farm_id", *SUMMARY_COUNTERS, "aktivitas_terakhir"))
+
+
+class FarmSummaryTestCase(ImportedDataTestCase):
+    def assertMatchesRebuild(self):
+        """FarmSummary harus selalu sama dengan hasil refresh_farm_summaries()."""
+        self.assertEqual(farm_summaries(), self.rebuilt(refresh_farm_summaries, farm_summaries))
+
+
+class FarmSummaryTests(FarmSummaryTestCase):
+    def test_after_import(self):
+        self.assertEqual(FarmSummary.objects.count(), Farm.objects.count())
+        self.assertMatchesRebuild()
+
+    def test_batch_edits_and_deletes(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=False).first()
+        batch.is_shipped = True
+        batch.risk_score = 95
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save()
+        self.assertMatchesRebuild()
+
+        # hasil uji dan activity batch ikut pindah ke farm baru
+        batch.farm = Farm.objects.exclude(pk=batch.farm_id).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.delete()
+        self.assertMatchesRebuild()
+
+    def test_new_batch(self):
+        farm = Farm.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            HarvestBatch.objects.create(
+                farm=farm,
+                commodity=farm.batches.first().commodity,
+                tanggal_tebar=date(2026, 1, 5),
+                tanggal_panen=date(2026, 4, 5),
+                volume_kg=500,
+                tujuan="Jepang",
+            )
+        self.assertMatchesRebuild()
+
+    def test_activity_and_lab_test(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(
+                batch=batch, tanggal=date(2027, 1, 1), jenis="LAINNYA", lokasi="Gudang", pelaku="Kurir"
+            )
+        self.assertMatchesRebuild()
+
+        activity = Activity.objects.filter(batch=batch).order_by("tanggal").first()
+        activity.tanggal = date(2027, 2, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.filter(batch=batch).order_by("-tanggal").first().delete()
+        self.assertMatchesRebuild()
+
+        qc = UserProfile.objects.filter(user__role="labAssistant").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.create(batch=batch, nilai_cs137=650, tanggal_uji=date(2026, 5, 1), qc=qc)
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.get(batch=batch).delete()
+        self.assertMatchesRebuild()
+
+
+class RefreshFarmRiskTests(FarmSummaryTestCase):
+    def test_batch_risk_follows_farm_risk(self):
+        # risk farm basi (tanpa signal): batch farm itu ikut dihitung ulang,
+        # kecuali batch yang sudah dikirim
+        shipped = HarvestBatch.objects.filter(lab_test__isnull=False).first()
+        HarvestBatch.objects.filter(pk=shipped.pk).update(is_shipped=True, risk_score=1)
+        Farm.objects.update(risk_score=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("refresh_farm_risk", stdout=StringIO())
+        self.assertFalse(Farm.objects.filter(risk_score=0).exists())
+        self.assertEqual(HarvestBatch.objects.get(pk=shipped.pk).risk_score, 1)
+        result = recompute_risk(dry_run=True, skip_shipped=True)
+        self.assertEqual((result.farms, result.batches), (0, 0))
+        self.assertEqual(recompute_risk(dry_run=True).batches, 1)
@@ -1,35 +1,175 @@
 from datetime import timedelta
 
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 
-from .models import Farm
+from .models import Farm, FarmRiskBucket
+
+FARM_RISK_WINDOW_DAYS = 180
 
 
 def recalculate_farm_risk(farm: Farm) -> int:
     """
     Hitung Farm Risk Score berdasarkan % batch MASALAH
-    dalam 6 bulan terakhir (pakai tanggal_panen).
+    dalam 6 bulan terakhir (pakai tanggal_panen), dari FarmRiskBucket.
     """
 
+    counts = FarmRiskBucket.objects.filter(
+        farm=farm,
+        day__gte=farm_risk_window_start(),
+    ).aggregate(total=Sum("total"), masalah=Sum("masalah"))
+
+    score = score_farm(counts["total"] or 0, counts["masalah"] or 0)
+    farm.risk_score = score
+    farm.save(update_fields=["risk_score"])
+    return score
+
+
+def farm_risk_window_start():
+    """Batas bawah tanggal_panen yang ikut dihitung di Farm Risk."""
     today = timezone.now().date()
-    six_months_ago = today - timedelta(days=180)  # approx 6 bulan
+    return today - timedelta(days=FARM_RISK_WINDOW_DAYS)  # approx 6 bulan
 
-    qs = farm.batches.filter(tanggal_panen__gte=six_months_ago)
-    total_batch = qs.count()
 
-    if total_batch == 0:
-        score = 30
-    else:
-        jumlah_masalah = qs.filter(quality_status="MASALAH").count()
-        ratio = jumlah_masalah / total_batch
+def score_farm(total_batch: int, jumlah_masalah: int, rules=None) -> int:
+    """Aturan Farm Risk Score dari jumlah batch dan batch MASALAH di window (rule set aktif)."""
+    if rules is None:
+        from batches.rules import get_active_rule_set
 
-        if ratio <= 0.10:
-            score = 30
-        elif ratio <= 0.30:
-            score = 60
-        else:
-            score = 85
+        rules = get_active_rule_set()
+    return rules.score_farm(total_batch, jumlah_masalah)
 
-    farm.risk_score = score
-    farm.save(update_fields=["risk_score"])
-    return score
+
+def window_risk_counts(farm_ids=None) -> dict:
+    """{farm_id: (total, masalah)} batch di window risk, dijumlah dari bucket."""
+    buckets = FarmRiskBucket.objects.filter(day__gte=farm_risk_window_start())
+    if farm_ids is not None:
+        buckets = buckets.filter(farm_id__in=farm_ids)
+    return {
+        row["farm_id"]: (row["total"], row["masalah"])
+        for row in buckets.order_by().values("farm_id").annotate(
+            total=Sum("total"), masalah=Sum("masalah")
+        )
+    }
+
+
+def risk_bucket_state(batch):
+    """Kontribusi satu batch ke bucket: (farm_id, tanggal_panen, MASALAH?)."""
+    return (batch.farm_id, batch.tanggal_panen, batch.quality_status == "MASALAH")
+
+
+def add_risk_bucket_delta(deltas: dict, old_state, new_state):
+    """
+    Catat perpindahan satu batch dari old_state ke new_state
+    (None = batch belum ada / sudah dihapus) ke dalam deltas.
+    """
+    if old_state == new_state:
+        return
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        farm_id, day, masalah = state
+        delta = deltas.setdefault((farm_id, day), [0, 0])
+        delta[0] += sign
+        delta[1] += sign * masalah
+
+
+def apply_risk_bucket_deltas(deltas: dict):
+    """
+    Tambahkan deltas {(farm_id, day): [total, masalah]} ke FarmRiskBucket.
+
+    Bucket yang sudah ada dikunci (select_for_update) lalu di-bulk_update;
+    yang belum ada dibuat dengan bulk_create. Kalau proses lain membuat
+    bucket yang sama di saat bersamaan, bulk_create gagal dan diulang
+    sebagai update.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+    if not deltas:
+        return
+
+    farm_ids = {farm_id for farm_id, _ in deltas}
+    days = [day for _, day in deltas]
+
+    while True:
+        with transaction.atomic():
+            existing = {
+                (bucket.farm_id, bucket.day): bucket
+                for bucket in FarmRiskBucket.objects.select_for_update().filter(
+                    farm_id__in=farm_ids,
+                    day__range=(min(days), max(days)),
+                )
+                if (bucket.farm_id, bucket.day) in deltas
+            }
+            for key, bucket in existing.items():
+                bucket.total += deltas[key][0]
+                bucket.masalah += deltas[key][1]
+            FarmRiskBucket.objects.bulk_update(existing.values(), ["total", "masalah"], batch_size=1000)
+
+            # bucket baru hanya untuk batch yang masuk; pengurangan dari bucket
+            # yang tidak ada (misal farm-nya sedang dihapus) diabaikan
+            missing = [
+                FarmRiskBucket(farm_id=farm_id, day=day, total=total, masalah=masalah)
+                for (farm_id, day), (total, masalah) in deltas.items()
+                if (farm_id, day) not in existing and total > 0
+            ]
+            try:
+                with transaction.atomic():
+                    FarmRiskBucket.objects.bulk_create(missing, batch_size=1000)
+            except IntegrityError:
+                # dibuat proses lain; bucket itu di-update di putaran berikutnya
+                transaction.set_rollback(True)
+                continue
+            return
+
+
+def refresh_farm_risk(farm_ids=None) -> set:
+    """
+    Hitung ulang risk_score farm dari bucket (job harian untuk menggeser
+    window 180 hari). Hanya farm yang skornya berubah yang ditulis.
+    Return pk farm yang berubah; risk_score / shipment_status batch-nya
+    belum ikut, lanjutkan dengan
+    batches.risk.recompute_risk(farm_ids=..., skip_shipped=True).
+    """
+    farms = Farm.objects.only("pk", "risk_score")
+    if farm_ids is not None:
+        farms = farms.filter(pk__in=farm_ids)
+
+    counts = window_risk_counts(farm_ids)
+    changed = []
+    for farm in farms:
+        score = score_farm(*counts.get(farm.pk, (0, 0)))
+        if score != farm.risk_score:
+            farm.risk_score = score
+            changed.append(farm)
+
+    Farm.objects.bulk_update(changed, ["risk_score"], batch_size=1000)
+    return {farm.pk for farm in changed}
+
+
+def rebuild_risk_buckets():
+    """Bangun ulang seluruh FarmRiskBucket dari tabel batch (perbaikan manual)."""
+    from batches.models import HarvestBatch
+
+    rows = (
+        HarvestBatch.objects.order_by()
+        .values("farm_id", "tanggal_panen")
+        .annotate(
+            total=Count("pk"),
+            masalah=Count("pk", filter=Q(quality_status="MASALAH")),
+        )
+    )
+    with transaction.atomic():
+        FarmRiskBucket.objects.all().delete()
+        FarmRiskBucket.objects.bulk_create(
+            [
+                FarmRiskBucket(
+                    farm_id=row["farm_id"],
+                    day=row["tanggal_panen"],
+                    total=row["total"],
+                    masalah=row["masalah"],
+                )
+                for row in rows.iterator()
+            ],
+            batch_size=1000,
+        )
@@ -91,9 +91,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # import_data --workers dan worker antrian menulis dari beberapa proses;
+        # transaksi DEFERRED SQLite langsung gagal "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # database test berupa file supaya test --workers bisa dibuka proses worker
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Cache
+# Snapshot trace publik (batches/trace.py) diinvalidasi oleh proses lain
+# (worker, import_data, lab_feed_listener), jadi production butuh cache
+# bersama antar proses; dicek batches.E001.
+# REDIS_URL contoh: redis://127.0.0.1:6379/1
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import Laboratory, LabTest
+from .models import Laboratory, LabTest, LabTestSideEffect, PendingLabTest
 
 # Register your models here.
 admin.site.register(Laboratory)
-admin.site.register(LabTest)
\ No newline at end of file
+admin.site.register(LabTest)
+admin.site.register(LabTestSideEffect)
+admin.site.register(PendingLabTest)
@@ -0,0 +1,212 @@
+"""
+Deteksi anomali Cs-137 secara streaming, saat hasil uji masuk.
+
+Untuk setiap farm dan setiap komoditas disimpan rata-rata dan varians
+berjalan (EWMA) di tabel Cs137Stat. Hasil baru dibandingkan dengan
+statistik sebelum hasil itu masuk:
+
+    z = (nilai - mean) / max(std, CS137_ANOMALY_MIN_STD)
+
+lalu statistik diperbarui dengan nilai tersebut, O(1) per hasil. Hasil
+ditandai anomali kalau z >= CS137_ANOMALY_Z untuk farm atau komoditasnya,
+walaupun masih di bawah batas aman: kenaikan mendadak di satu farm
+terlihat sebelum batch-nya bermasalah.
+
+Statistik baru dipakai setelah CS137_ANOMALY_MIN_SAMPLES hasil, supaya
+farm baru tidak langsung ditandai. Hanya hasil uji baru yang dihitung
+sebagai sampel; LabTest yang disimpan ulang tidak menambah n.
+
+Karena EWMA bergantung urutan, import massal (import_data, termasuk
+--workers) menangguhkan deteksi lewat suspend_cs137_anomalies() lalu
+memutar hanya LabTest yang baru diimport, urut tanggal uji, di akhir
+(apply_new_cs137_anomalies). Rebuild seluruh histori hanya lewat
+command rebuild_cs137_stats.
+
+Kolom anomali bukan data hasil uji: menulisnya tidak memajukan
+LabTest.updated_at, cache trace batch yang berubah diinvalidasi.
+"""
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from batches.trace import invalidate_trace
+
+# bobot hasil terbaru; 0.1 ≈ rata-rata ~20 hasil terakhir
+CS137_EWMA_ALPHA = getattr(settings, "CS137_EWMA_ALPHA", 0.1)
+CS137_ANOMALY_Z = getattr(settings, "CS137_ANOMALY_Z", 3.0)
+CS137_ANOMALY_MIN_SAMPLES = getattr(settings, "CS137_ANOMALY_MIN_SAMPLES", 5)
+# ketidakpastian ukur (Bq/kg): farm yang hasilnya selalu sama tidak membuat std ≈ 0
+CS137_ANOMALY_MIN_STD = getattr(settings, "CS137_ANOMALY_MIN_STD", 5.0)
+
+ANOMALY_FIELDS = ["anomali_z_farm", "anomali_z_komoditas", "is_anomali"]
+
+
+_suspended: ContextVar[bool] = ContextVar("cs137_anomalies_suspended", default=False)
+
+
+@contextmanager
+def suspend_cs137_anomalies():
+    """
+    Di dalam blok ini detect_cs137_anomalies() tidak melakukan apa-apa.
+    Pemanggil wajib memutar hasil yang masuk sesudahnya
+    (apply_new_cs137_anomalies() atau rebuild_cs137_stats()).
+    """
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def ewma_update(stat, nilai: float, alpha: float = CS137_EWMA_ALPHA):
+    """Tambahkan satu nilai ke statistik (n, mean, var) di tempat."""
+    if stat.n == 0:
+        stat.mean, stat.var = nilai, 0.0
+    else:
+        diff = nilai - stat.mean
+        increment = alpha * diff
+        stat.mean += increment
+        stat.var = (1 - alpha) * (stat.var + diff * increment)
+    stat.n += 1
+
+
+def z_score(stat, nilai: float):
+    """Skor z nilai terhadap statistik; None kalau sampel belum cukup."""
+    if stat.n < CS137_ANOMALY_MIN_SAMPLES:
+        return None
+    std = max(math.sqrt(stat.var), CS137_ANOMALY_MIN_STD)
+    return round((nilai - stat.mean) / std, 2)
+
+
+def is_anomali(*z_scores) -> bool:
+    return any(z is not None and z >= CS137_ANOMALY_Z for z in z_scores)
+
+
+def _load_stats(farm_ids, commodity_ids):
+    """Ambil (dan kunci) statistik farm / komoditas, buat baris kosong kalau belum ada."""
+    Cs137Stat = apps.get_model("labs", "Cs137Stat")
+
+    Cs137Stat.objects.bulk_create(
+        [Cs137Stat(farm_id=farm_id) for farm_id in farm_ids]
+        + [Cs137Stat(commodity_id=commodity_id) for commodity_id in commodity_ids],
+        ignore_conflicts=True,
+    )
+    stats = Cs137Stat.objects.select_for_update().filter(
+        Q(farm_id__in=farm_ids) | Q(commodity_id__in=commodity_ids)
+    ).order_by("pk")
+    farm_stats, commodity_stats = {}, {}
+    for stat in stats:
+        if stat.farm_id is not None:
+            farm_stats[stat.farm_id] = stat
+        else:
+            commodity_stats[stat.commodity_id] = stat
+    return farm_stats, commodity_stats
+
+
+def detect_cs137_anomalies(events, batches) -> dict:
+    """
+    Nilai dan catat sekumpulan hasil uji (LabTestEvent atau LabTest, cukup
+    batch_id + nilai_cs137; urut sesuai masuk).
+    batches: {kode_batch: HarvestBatch} (cukup farm_id + commodity_id).
+
+    Statistik farm / komoditas diperbarui, kolom anomali LabTest ditulis,
+    dan return {kode_batch: (z_farm, z_komoditas, is_anomali)} untuk hasil
+    terakhir setiap batch (kosong di dalam suspend_cs137_anomalies()).
+    Panggil di dalam transaksi.
+    """
+    if not events or _suspended.get():
+        return {}
+
+    Cs137Stat = apps.get_model("labs", "Cs137Stat")
+    LabTest = apps.get_model("labs", "LabTest")
+
+    farm_stats, commodity_stats = _load_stats(
+        {batches[event.batch_id].farm_id for event in events},
+        {batches[event.batch_id].commodity_id for event in events},
+    )
+
+    results = {}
+    for event in events:
+        batch = batches[event.batch_id]
+        farm_stat = farm_stats[batch.farm_id]
+        commodity_stat = commodity_stats[batch.commodity_id]
+
+        z_farm = z_score(farm_stat, event.nilai_cs137)
+        z_komoditas = z_score(commodity_stat, event.nilai_cs137)
+        results[event.batch_id] = (z_farm, z_komoditas, is_anomali(z_farm, z_komoditas))
+
+        ewma_update(farm_stat, event.nilai_cs137)
+        ewma_update(commodity_stat, event.nilai_cs137)
+
+    now = timezone.now()
+    stats = [*farm_stats.values(), *commodity_stats.values()]
+    for stat in stats:
+        stat.updated_at = now  # bulk_update tidak mengisi auto_now
+    Cs137Stat.objects.bulk_update(stats, ["n", "mean", "var", "updated_at"])
+
+    # hanya kolom anomali yang ditulis, dan hanya kalau berubah: updated_at
+    # (Last-Modified halaman batch) tidak ikut maju, versi trace yang diganti
+    lab_tests = LabTest.objects.only(*ANOMALY_FIELDS, "batch_id").in_bulk(results, field_name="batch_id")
+    changed = []
+    for kode, lab_test in lab_tests.items():
+        if (lab_test.anomali_z_farm, lab_test.anomali_z_komoditas, lab_test.is_anomali) != results[kode]:
+            lab_test.anomali_z_farm, lab_test.anomali_z_komoditas, lab_test.is_anomali = results[kode]
+            changed.append(lab_test)
+    LabTest.objects.bulk_update(changed, ANOMALY_FIELDS, batch_size=1000)
+    invalidate_trace(lab_test.batch_id for lab_test in changed)
+    return results
+
+
+def apply_new_cs137_anomalies(lab_tests, chunk_size: int = 5000) -> int:
+    """
+    Putar LabTest yang baru masuk (queryset) ke statistik yang sudah ada,
+    urut tanggal uji. Dipakai import_data setelah suspend_cs137_anomalies():
+    biaya sebanding jumlah hasil baru, bukan seluruh histori, dan hasilnya
+    sama untuk mode serial / --bulk / --workers. Hasil baru yang tanggal
+    ujinya lebih awal dari histori tetap diputar sesudahnya; pakai
+    rebuild_cs137_stats() kalau urutan penuh diperlukan. Return jumlah LabTest.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    lab_tests = lab_tests.only("batch_id", "nilai_cs137").order_by("tanggal_uji", "batch_id")
+    total = 0
+    with transaction.atomic():
+        for chunk in _chunks(lab_tests.iterator(chunk_size=chunk_size), chunk_size):
+            batches = HarvestBatch.objects.only("farm_id", "commodity_id").in_bulk(
+                {lab_test.batch_id for lab_test in chunk}
+            )
+            detect_cs137_anomalies(chunk, batches)
+            total += len(chunk)
+    return total
+
+
+def rebuild_cs137_stats(chunk_size: int = 5000) -> int:
+    """
+    Hapus semua statistik lalu putar ulang seluruh LabTest urut tanggal uji.
+    Untuk mengisi awal atau setelah parameter EWMA diubah (command
+    rebuild_cs137_stats). Urutan tidak bergantung kapan / proses mana yang
+    menyimpan (batch_id unik per LabTest). Return jumlah LabTest.
+    """
+    Cs137Stat = apps.get_model("labs", "Cs137Stat")
+    LabTest = apps.get_model("labs", "LabTest")
+
+    with transaction.atomic():
+        Cs137Stat.objects.all().delete()
+        return apply_new_cs137_anomalies(LabTest.objects.all(), chunk_size)
+
+
+def _chunks(iterator, size):
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,265 @@
+"""
+Listener asyncio untuk hasil uji Cs-137 yang dikirim langsung oleh detektor.
+
+Dua cara kirim, di port yang sama:
+
+- TCP: satu pembacaan per baris, JSON
+  ({"kode_batch": ..., "nilai_cs137": ..., "tanggal_uji": ...}) atau CSV
+  (kode_batch,nilai_cs137,tanggal_uji). Setiap baris dibalas satu baris
+  JSON hasilnya, urut sesuai kiriman.
+- HTTP: POST dengan body baris-baris yang sama (Transfer-Encoding: chunked
+  atau Content-Length). Balasan 200 berisi hasil per baris (NDJSON) setelah
+  body selesai dikirim.
+
+Pembacaan dari semua koneksi masuk ke satu antrian berukuran tetap, lalu
+dikumpulkan jadi micro-batch (maksimal batch_size baris atau max_wait detik)
+dan disimpan lewat labs.ingest.ingest_lab_results: satu bulk_create dan
+efek samping LabTest.save() sekali per micro-batch. Kalau database tertinggal,
+antrian penuh dan koneksi berhenti dibaca (backpressure sampai ke TCP).
+
+Penulisan ke database hanya di satu thread, jadi ORM tetap dipakai secara
+sinkron dan micro-batch tidak saling berebut farm yang sama.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.db import close_old_connections, connection
+
+from .ingest import GAGAL, ingest_lab_results
+
+FEED_FIELDS = ("kode_batch", "nilai_cs137", "tanggal_uji")
+
+
+def parse_reading(line: str) -> dict:
+    """Satu baris kiriman (JSON atau CSV) jadi record untuk ingest_lab_results."""
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError("Baris JSON tidak valid")
+        if not isinstance(record, dict):
+            raise ValueError("Baris JSON harus berupa objek")
+        return record
+
+    values = [value.strip() for value in line.split(",")]
+    if len(values) != len(FEED_FIELDS):
+        raise ValueError(f"Baris CSV harus berisi {','.join(FEED_FIELDS)}")
+    return dict(zip(FEED_FIELDS, values))
+
+
+def _failed(records, error) -> list[dict]:
+    """Hasil GAGAL untuk setiap record micro-batch yang tidak bisa disimpan."""
+    return [
+        {"kode_batch": str(record.get("kode_batch", "")), "status": GAGAL, "pesan": f"Gagal menyimpan: {error}"}
+        for record in records
+    ]
+
+
+@dataclass
+class Reading:
+    record: dict
+    result: asyncio.Future
+
+
+@dataclass
+class FeedStats:
+    diterima: int = 0
+    disimpan: int = 0
+    gagal: int = 0
+    batches: int = 0
+    koneksi: int = 0
+    # ukuran micro-batch terbesar, untuk melihat apakah batch_size tercapai
+    batch_terbesar: int = 0
+
+
+@dataclass
+class LabFeedListener:
+    qc: object                  # UserProfile lab assistant
+    lab: object = None          # Laboratory
+    batch_size: int = 200
+    max_wait: float = 0.5
+    queue_size: int = 2000
+    stats: FeedStats = field(default_factory=FeedStats)
+
+    def __post_init__(self):
+        self.queue = None
+        # satu thread untuk semua penulisan database
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lab-feed-db")
+
+    async def serve(self, host: str, port: int, ready=None):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        worker = asyncio.create_task(self.run_batches())
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._close_connection)
+            self.executor.shutdown()
+
+    # koneksi ------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        self.stats.koneksi += 1
+        try:
+            first = await reader.readline()
+            if first.startswith((b"POST ", b"PUT ")):
+                await self._handle_http(reader, writer)
+            elif first:
+                await self._handle_stream(first, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def submit(self, line: str):
+        """Masukkan satu baris ke antrian. Menunggu kalau antrian penuh."""
+        future = asyncio.get_running_loop().create_future()
+        self.stats.diterima += 1
+        try:
+            record = parse_reading(line)
+        except ValueError as e:
+            self.stats.gagal += 1
+            future.set_result({"kode_batch": "", "status": GAGAL, "pesan": str(e)})
+            return future
+        await self.queue.put(Reading(record, future))
+        return future
+
+    async def _handle_stream(self, first, reader, writer):
+        # hasil dibalas berurutan oleh task terpisah; antrian hasil juga
+        # dibatasi, jadi klien yang tidak membaca balasan ikut tertahan
+        pending = asyncio.Queue(maxsize=self.queue_size)
+
+        async def respond():
+            while (future := await pending.get()) is not None:
+                writer.write(json.dumps(await future).encode() + b"\n")
+                await writer.drain()
+
+        responder = asyncio.create_task(respond())
+        line = first
+        while line:
+            text = line.decode("utf-8-sig").strip()
+            if text:
+                await pending.put(await self.submit(text))
+            line = await reader.readline()
+        await pending.put(None)
+        await responder
+
+    async def _handle_http(self, reader, writer):
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        futures = []
+        buffer = b""
+
+        async def feed(data):
+            nonlocal buffer
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in lines:
+                text = line.decode("utf-8-sig").strip()
+                if text:
+                    futures.append(await self.submit(text))
+
+        try:
+            if "chunked" in headers.get("transfer-encoding", "").lower():
+                while size := int((await reader.readline()).split(b";")[0].strip() or b"0", 16):
+                    await feed(await reader.readexactly(size))
+                    await reader.readline()
+                # trailer sampai baris kosong
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+            else:
+                await feed(await reader.readexactly(int(headers.get("content-length", 0))))
+        except ValueError:
+            # ukuran chunk / Content-Length bukan angka (atau negatif); baris
+            # yang sudah masuk antrian tetap diproses
+            body = b"Ukuran chunk atau Content-Length tidak valid\n"
+            writer.write(
+                b"HTTP/1.1 400 Bad Request\r\n"
+                b"Content-Type: text/plain; charset=utf-8\r\n"
+                b"Connection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            return
+        await feed(b"\n")
+
+        results = [await future for future in futures]
+        body = b"".join(json.dumps(result).encode() + b"\n" for result in results)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Connection: close\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    # micro-batch ----------------------------------------------------------
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            records = [reading.record for reading in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self._ingest, records)
+            except Exception as e:
+                # micro-batch ini gagal semuanya, listener tetap jalan
+                results = _failed(records, e)
+            self.stats.batches += 1
+            self.stats.batch_terbesar = max(self.stats.batch_terbesar, len(batch))
+            for reading, result in zip(batch, results):
+                if result["status"] == GAGAL:
+                    self.stats.gagal += 1
+                else:
+                    self.stats.disimpan += 1
+                if not reading.result.done():
+                    reading.result.set_result(result)
+
+    @staticmethod
+    def _close_connection():
+        # dijalankan di thread database: koneksi Django per thread
+        connection.close()
+
+    def _ingest(self, records):
+        """Dijalankan di thread database."""
+        close_old_connections()
+        try:
+            report = ingest_lab_results(list(enumerate(records, start=1)), qc=self.qc, lab=self.lab)
+        except Exception as e:
+            # error apa pun (database, data tak terduga) hanya menggagalkan
+            # micro-batch ini, bukan thread database / listener
+            return _failed(records, e)
+        return [
+            {
+                "kode_batch": row.kode_batch,
+                "status": row.status,
+                "pesan": row.pesan,
+                "kesimpulan": row.kesimpulan,
+            }
+            for row in report.rows
+        ]
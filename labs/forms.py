@@ -24,4 +24,17 @@ class LabTestForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['qc'].widget = forms.HiddenInput()
\ No newline at end of file
+        self.fields['qc'].widget = forms.HiddenInput()
+
+
+class LabResultUploadForm(forms.Form):
+    file = forms.FileField(
+        label="File hasil uji (CSV / JSON)",
+        help_text="Kolom: kode_batch, nilai_cs137, tanggal_uji (YYYY-MM-DD)",
+    )
+    lab = forms.ModelChoiceField(
+        queryset=Laboratory.objects.all(),
+        required=False,
+        label="Laboratorium",
+    )
+    dry_run = forms.BooleanField(required=False, label="Cek saja, jangan simpan")
@@ -0,0 +1,224 @@
+"""
+Import hasil uji lab dari file ekspor instrumen (CSV / JSON) sekaligus.
+
+    rows = read_lab_results(f, "hasil_shift_pagi.csv")
+    report = ingest_lab_results(rows, qc=profile, lab=profile.laboratory)
+    report.created, report.failed
+
+Setiap baris divalidasi terhadap HarvestBatch dan claim antrian QC
+(labs.workqueue) dengan satu query masing-masing untuk seluruh file.
+Baris yang valid dibuat dengan satu bulk_create, lalu efek sampingnya
+(risk batch / farm, activity UJI_LAB / SIAP_EKSPOR) dikerjakan sekali
+lewat apply_labtest_events, begitu juga rollup Cs-137. Baris yang gagal
+tidak menggagalkan baris lain; alasannya ada di laporan per baris. Kalau
+hasil uji lain masuk di antara validasi dan bulk_create, baris itu
+divalidasi ulang dan gagal sendiri.
+
+Kolom yang dibaca: kode_batch (atau batch_kode), nilai_cs137, tanggal_uji
+(YYYY-MM-DD). Kolom lain diabaikan.
+"""
+import csv
+import io
+import json
+import math
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.db import IntegrityError, transaction
+
+from batches.models import HarvestBatch
+from .models import LabTest
+from .utils import LabTestEvent, apply_lab_test_side_effects, apply_labtest_events, hitung_kesimpulan
+from .workqueue import claimed_by_others
+
+KODE_COLUMNS = ("kode_batch", "batch_kode")
+
+OK, GAGAL = "OK", "GAGAL"
+
+
+@dataclass
+class LabResultRow:
+    baris: int                  # nomor baris di file (CSV: termasuk header)
+    kode_batch: str
+    status: str = OK
+    pesan: str = ""
+    nilai_cs137: float | None = None
+    tanggal_uji: date | None = None
+    kesimpulan: str | None = None
+
+    def fail(self, pesan: str):
+        self.status = GAGAL
+        self.pesan = pesan
+
+
+@dataclass
+class LabResultReport:
+    rows: list = field(default_factory=list)
+    dry_run: bool = False
+
+    @property
+    def created(self) -> int:
+        return sum(row.status == OK for row in self.rows)
+
+    @property
+    def failed(self) -> int:
+        return sum(row.status == GAGAL for row in self.rows)
+
+    def as_dicts(self) -> list[dict]:
+        return [
+            {
+                "baris": row.baris,
+                "kode_batch": row.kode_batch,
+                "status": row.status,
+                "pesan": row.pesan,
+                "nilai_cs137": row.nilai_cs137,
+                "tanggal_uji": row.tanggal_uji.isoformat() if row.tanggal_uji else None,
+                "kesimpulan": row.kesimpulan,
+            }
+            for row in self.rows
+        ]
+
+
+def read_lab_results(fileobj, filename: str) -> list[tuple[int, dict]]:
+    """
+    Baca file CSV / JSON jadi list (nomor baris, record). JSON boleh berupa
+    list objek atau {"results": [...]}. ValueError kalau format tidak dikenal.
+    """
+    content = fileobj.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+
+    if filename.lower().endswith(".json"):
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get("results")
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ValueError("JSON harus berupa list objek atau {\"results\": [...]}")
+        return list(enumerate(data, start=1))
+
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(content))
+        return [(reader.line_num, record) for record in reader]
+
+    raise ValueError("Format file harus .csv atau .json")
+
+
+def _text(record, key) -> str:
+    value = record.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def _parse_row(baris, record) -> LabResultRow:
+    kode = next((_text(record, c) for c in KODE_COLUMNS if _text(record, c)), "")
+    row = LabResultRow(baris=baris, kode_batch=kode)
+    if not kode:
+        row.fail("kode_batch kosong")
+        return row
+
+    try:
+        row.nilai_cs137 = float(_text(record, "nilai_cs137"))
+    except ValueError:
+        row.fail("nilai_cs137 bukan angka")
+        return row
+    if not math.isfinite(row.nilai_cs137) or row.nilai_cs137 < 0:
+        row.fail("nilai_cs137 harus angka >= 0")
+        return row
+
+    try:
+        row.tanggal_uji = date.fromisoformat(_text(record, "tanggal_uji"))
+    except ValueError:
+        row.fail("tanggal_uji harus berformat YYYY-MM-DD")
+    return row
+
+
+def _check_batches(rows, qc) -> dict:
+    """
+    Gagalkan baris yang batch-nya tidak ada, sudah diuji, dipegang QC lain,
+    atau dobel di kiriman yang sama. Return {kode: batas aman komoditas}.
+    """
+    # satu query: batch yang ada, batas komoditasnya, dan apakah sudah diuji
+    batches = {
+        kode: (batas, lab_test_id)
+        for kode, batas, lab_test_id in HarvestBatch.objects.filter(
+            pk__in={row.kode_batch for row in rows}
+        ).values_list("pk", "commodity__default_batas_aman_cs137", "lab_test__pk")
+    }
+    # batch yang sedang di-claim QC lain (labs.workqueue) jangan diuji dua kali
+    pemegang = claimed_by_others(batches, qc)
+
+    seen = set()
+    for row in rows:
+        if row.kode_batch not in batches:
+            row.fail("Batch tidak ditemukan")
+        elif batches[row.kode_batch][1] is not None:
+            row.fail("Batch sudah memiliki hasil uji lab")
+        elif row.kode_batch in pemegang:
+            user = pemegang[row.kode_batch].user
+            row.fail(f"Batch sedang diuji oleh {user.get_full_name() or user.username}")
+        elif row.kode_batch in seen:
+            row.fail("Kode batch muncul lebih dari sekali di kiriman yang sama")
+        else:
+            seen.add(row.kode_batch)
+            row.kesimpulan = hitung_kesimpulan(row.nilai_cs137, batches[row.kode_batch][0])
+    return {kode: batas for kode, (batas, _) in batches.items()}
+
+
+def ingest_lab_results(records, qc, lab=None, dry_run: bool = False) -> LabResultReport:
+    """
+    Validasi dan simpan hasil uji lab. records dari read_lab_results,
+    qc = UserProfile lab assistant, lab = Laboratory (boleh None).
+    dry_run: hanya validasi, tidak ada yang ditulis.
+    """
+    report = LabResultReport(rows=[_parse_row(baris, record) for baris, record in records], dry_run=dry_run)
+    valid = [row for row in report.rows if row.status == OK]
+    batas = _check_batches(valid, qc)
+
+    while True:
+        valid = [row for row in valid if row.status == OK]
+        if dry_run or not valid:
+            return report
+        try:
+            _create_lab_tests(valid, batas, qc, lab)
+            return report
+        except IntegrityError:
+            # LabTest batch ini dibuat request lain setelah validasi: cek
+            # ulang, baris itu gagal sendiri dan sisanya dicoba lagi
+            failed = report.failed
+            batas = _check_batches(valid, qc)
+            if report.failed == failed:
+                raise
+
+
+def _create_lab_tests(rows, batas, qc, lab):
+    lab_tests = [
+        LabTest(
+            batch_id=row.kode_batch,
+            nilai_cs137=row.nilai_cs137,
+            kesimpulan=row.kesimpulan,
+            tanggal_uji=row.tanggal_uji,
+            qc=qc,
+            lab=lab,
+        )
+        for row in rows
+    ]
+    events = [
+        LabTestEvent(
+            batch_id=row.kode_batch,
+            nilai_cs137=row.nilai_cs137,
+            kesimpulan=row.kesimpulan,
+            tanggal_uji=row.tanggal_uji,
+            qc_id=qc.pk,
+            lab_id=lab.pk if lab else None,
+            batas=batas[row.kode_batch],
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        LabTest.objects.bulk_create(lab_tests)
+        # bulk_create tidak mengirim signal: antrian QC, rollup Cs-137,
+        # FarmSummary, HarvestRollup dan trace lewat pintu yang sama dengan signal
+        apply_lab_test_side_effects(
+            [(None, (row.kode_batch, row.tanggal_uji, row.nilai_cs137)) for row in rows]
+        )
+        # risk batch / farm + activity sekali untuk semua batch dan farm di file
+        apply_labtest_events(events)
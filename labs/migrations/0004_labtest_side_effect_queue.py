@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0004_risk_rule_set'),
+        ('labs', '0003_labtest_updated_at'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabTestSideEffect',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nilai_cs137', models.FloatField()),
+                ('kesimpulan', models.CharField(max_length=20)),
+                ('tanggal_uji', models.DateField()),
+                ('batas', models.FloatField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='batches.harvestbatch')),
+                ('lab', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='labs.laboratory')),
+                ('qc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.userprofile')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0004_risk_rule_set'),
+        ('farms', '0003_farm_risk_bucket'),
+        ('labs', '0004_labtest_side_effect_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labtest',
+            name='anomali_z_farm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='anomali_z_komoditas',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='is_anomali',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='Cs137Stat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('var', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('commodity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='batches.commodity')),
+                ('farm', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='farms.farm')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('farm',), name='unique_cs137_stat_farm'), models.UniqueConstraint(fields=('commodity',), name='unique_cs137_stat_commodity'), models.CheckConstraint(condition=models.Q(models.Q(('commodity__isnull', True), ('farm__isnull', False)), models.Q(('commodity__isnull', False), ('farm__isnull', True)), _connector='OR'), name='cs137_stat_farm_or_commodity')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0004_risk_rule_set'),
+        ('farms', '0003_farm_risk_bucket'),
+        ('labs', '0005_cs137_anomaly_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cs137Rollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='Tanggal 1 bulan uji')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('total_sq', models.FloatField(default=0)),
+                ('min_nilai', models.FloatField(blank=True, null=True)),
+                ('max_nilai', models.FloatField(blank=True, null=True)),
+                ('sketch', models.JSONField(default=dict)),
+                ('commodity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='batches.commodity')),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='farms.farm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='cs137_rollup_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('farm', 'commodity', 'month'), name='unique_cs137_rollup')],
+            },
+        ),
+    ]
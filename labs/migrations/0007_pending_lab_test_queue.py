@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_queue(apps, schema_editor):
+    """Semua batch yang belum punya LabTest masuk antrian QC."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    rows = HarvestBatch.objects.filter(lab_test__isnull=True).values_list(
+        "pk", "farm__city_id", "tanggal_panen"
+    )
+    PendingLabTest.objects.bulk_create(
+        [
+            PendingLabTest(batch_id=pk, city_id=city_id, tanggal_panen=tanggal_panen)
+            for pk, city_id, tanggal_panen in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_batch_list_indexes'),
+        ('farms', '0003_farm_risk_bucket'),
+        ('labs', '0006_cs137_rollup'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingLabTest',
+            fields=[
+                ('batch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_lab_test', serialize=False, to='batches.harvestbatch')),
+                ('tanggal_panen', models.DateField()),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('city', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='farms.city')),
+                ('claimed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='profiles.userprofile')),
+            ],
+            options={
+                'ordering': ['tanggal_panen', 'batch'],
+                'indexes': [models.Index(fields=['city', 'tanggal_panen', 'batch'], name='pending_lab_city_idx'), models.Index(fields=['tanggal_panen', 'batch'], name='pending_lab_panen_idx'), models.Index(fields=['claimed_by', 'lease_until'], name='pending_lab_claim_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_queue, migrations.RunPython.noop),
+    ]
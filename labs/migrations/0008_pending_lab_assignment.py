@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_batch_list_indexes'),
+        ('farms', '0003_farm_risk_bucket'),
+        ('labs', '0007_pending_lab_test_queue'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendinglabtest',
+            name='assigned_lab',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='labs.laboratory'),
+        ),
+        migrations.AddField(
+            model_name='pendinglabtest',
+            name='rencana_uji',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pendinglabtest',
+            index=models.Index(fields=['assigned_lab', 'tanggal_panen', 'batch'], name='pending_lab_assigned_idx'),
+        ),
+    ]
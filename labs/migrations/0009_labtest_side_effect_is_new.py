@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labs', '0008_pending_lab_assignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labtestsideeffect',
+            name='is_new',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labs', '0009_labtest_side_effect_is_new'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='labtestsideeffect',
+            name='lab',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='labs.laboratory'),
+        ),
+        migrations.AlterField(
+            model_name='labtestsideeffect',
+            name='qc',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='profiles.userprofile'),
+        ),
+    ]
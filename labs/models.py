@@ -1,9 +1,14 @@
-from django.db import models
-from batches.models import Activity, HarvestBatch
+from django.db import models, transaction
+from batches.models import Activity, Commodity, HarvestBatch
 from profiles.models import UserProfile
-from farms.models import City
+from farms.models import City, Farm
 from farms.utils import recalculate_farm_risk
 from batches.utils import recalculate_batch_risk, get_batas_aman_cs137
+from batches.rules import get_active_rule_set
+from batches.state import combine_side_effects
+from labs.anomaly import detect_cs137_anomalies
+from labs.rollup import rollup_state
+from labs.utils import LabTestEvent, defer_labtest_event, hitung_kesimpulan, siap_ekspor_keterangan
 
 # Create your models here.
 
@@ -24,6 +29,13 @@ class LabTest(models.Model):
     )
 
     tanggal_uji = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # hasil deteksi anomali saat hasil masuk (labs.anomaly): jarak nilai dari
+    # rata-rata berjalan farm / komoditas, dalam satuan simpangan baku
+    anomali_z_farm = models.FloatField(null=True, blank=True)
+    anomali_z_komoditas = models.FloatField(null=True, blank=True)
+    is_anomali = models.BooleanField(default=False, db_index=True)
 
     qc = models.ForeignKey(
         UserProfile,
@@ -45,6 +57,14 @@ class LabTest(models.Model):
     def __str__(self):
         return f"{self.batch.kode_batch} ({self.kesimpulan})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # state rollup saat dibaca, pembanding di signal post_save / post_delete
+        if {"batch_id", "tanggal_uji", "nilai_cs137"} <= instance.__dict__.keys():
+            instance._rollup_state = rollup_state(instance)
+        return instance
+
     @property
     def batas_aman_cs137(self):
         commodity = getattr(self.batch, "commodity", None)
@@ -55,46 +75,194 @@ class LabTest(models.Model):
     def save(self, *args, **kwargs):
         is_new = self._state.adding
 
-        batas = self.batas_aman_cs137
-
-        if batas is not None and self.nilai_cs137 > batas:
-            self.kesimpulan = "BERMASALAH"
-        else:
-            # kalau batas None atau nilai <= batas → anggap masih AMAN
-            self.kesimpulan = "AMAN"
-
-        super().save(*args, **kwargs)
-
-        # setelah LabTest tersimpan, hitung ulang risiko farm & batch
-        farm = self.batch.farm
-        recalculate_batch_risk(self.batch)
-        recalculate_farm_risk(farm)
-
-        # buat activity UJI_LAB
-        lokasi_lab = self.lab.nama if self.lab else "Laboratorium"
-        pelaku_qc = self.qc.user.get_full_name() or self.qc.user.username
-        batas = self.batas_aman_cs137
-
-        Activity.objects.create(
-            batch=self.batch,
-            tanggal=self.tanggal_uji,
-            jenis="UJI_LAB",
-            lokasi=lokasi_lab,
-            pelaku=pelaku_qc,
-            keterangan=f"Uji Cs-137: {self.nilai_cs137} Bq/kg"
-            + (f" (batas {batas} Bq/kg)" if batas is not None else ""),
-        )
-
-        # Kalau risk_score PASS dan belum ada SIAP_EKSPOR, buat otomatis
-        batch = self.batch
-        if batch.risk_score is not None and batch.risk_score < 70:
-            sudah_siap = batch.activities.filter(jenis="SIAP_EKSPOR").exists()
-            if not sudah_siap:
-                Activity.objects.create(
-                    batch=batch,
-                    tanggal=self.tanggal_uji,
-                    jenis="SIAP_EKSPOR",
-                    lokasi=lokasi_lab,
-                    pelaku=pelaku_qc,
-                    keterangan="Batch dinyatakan siap ekspor (risk score < 70)",
-                )
\ No newline at end of file
+        # kalau batas None atau nilai <= batas → anggap masih AMAN
+        self.kesimpulan = hitung_kesimpulan(self.nilai_cs137, self.batas_aman_cs137)
+
+        # update_or_create() menyimpan dengan update_fields=defaults;
+        # kesimpulan yang baru dihitung dan updated_at harus ikut tersimpan
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "kesimpulan", "updated_at"}
+
+        # delta FarmSummary / HarvestRollup dari LabTest, batch dan activity-nya
+        # ditulis sekali di akhir blok
+        with combine_side_effects():
+            super().save(*args, **kwargs)
+
+            # di dalam defer_labtest_side_effects(): efek samping dikerjakan
+            # sekaligus di akhir blok, bukan per save
+            if defer_labtest_event(self, is_new):
+                return
+
+            # setelah LabTest tersimpan, hitung ulang risiko farm & batch
+            farm = self.batch.farm
+            recalculate_batch_risk(self.batch)
+            recalculate_farm_risk(farm)
+
+            # hanya hasil baru yang menjadi sampel statistik anomali
+            if is_new:
+                with transaction.atomic():
+                    anomali = detect_cs137_anomalies(
+                        [LabTestEvent.from_lab_test(self)], {self.batch_id: self.batch}
+                    ).get(self.batch_id)
+                if anomali is not None:
+                    self.anomali_z_farm, self.anomali_z_komoditas, self.is_anomali = anomali
+
+            # buat activity UJI_LAB
+            lokasi_lab = self.lab.nama if self.lab else "Laboratorium"
+            pelaku_qc = self.qc.user.get_full_name() or self.qc.user.username
+            batas = self.batas_aman_cs137
+
+            Activity.objects.create(
+                batch=self.batch,
+                tanggal=self.tanggal_uji,
+                jenis="UJI_LAB",
+                lokasi=lokasi_lab,
+                pelaku=pelaku_qc,
+                keterangan=f"Uji Cs-137: {self.nilai_cs137} Bq/kg"
+                + (f" (batas {batas} Bq/kg)" if batas is not None else ""),
+            )
+
+            # Kalau risk_score PASS dan belum ada SIAP_EKSPOR, buat otomatis
+            batch = self.batch
+            rules = get_active_rule_set()
+            if rules.is_layak_kirim(batch.risk_score):
+                sudah_siap = batch.activities.filter(jenis="SIAP_EKSPOR").exists()
+                if not sudah_siap:
+                    Activity.objects.create(
+                        batch=batch,
+                        tanggal=self.tanggal_uji,
+                        jenis="SIAP_EKSPOR",
+                        lokasi=lokasi_lab,
+                        pelaku=pelaku_qc,
+                        keterangan=siap_ekspor_keterangan(rules),
+                    )
+
+
+class LabTestSideEffect(models.Model):
+    """
+    Antrian efek samping LabTest.save() (risk batch, risk farm, activity
+    UJI_LAB / SIAP_EKSPOR) yang dikerjakan worker process_labtest_queue.
+    Isinya salinan LabTestEvent saat save (lihat labs.utils).
+    """
+
+    batch = models.ForeignKey(HarvestBatch, on_delete=models.CASCADE, related_name="+")
+    nilai_cs137 = models.FloatField()
+    kesimpulan = models.CharField(max_length=20)
+    tanggal_uji = models.DateField()
+    qc = models.ForeignKey(UserProfile, on_delete=models.PROTECT, related_name="+")
+    lab = models.ForeignKey(Laboratory, on_delete=models.PROTECT, null=True, related_name="+")
+    batas = models.FloatField(null=True)
+    is_new = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["pk"]
+
+    def __str__(self):
+        return f"{self.batch_id} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class Cs137Stat(models.Model):
+    """
+    Statistik berjalan (EWMA rata-rata / varians) nilai Cs-137 untuk satu
+    farm atau satu komoditas. Diperbarui O(1) per hasil uji, lihat labs.anomaly.
+    """
+
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    commodity = models.ForeignKey(Commodity, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    n = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    var = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["farm"], name="unique_cs137_stat_farm"),
+            models.UniqueConstraint(fields=["commodity"], name="unique_cs137_stat_commodity"),
+            models.CheckConstraint(
+                condition=(
+                    models.Q(farm__isnull=False, commodity__isnull=True)
+                    | models.Q(farm__isnull=True, commodity__isnull=False)
+                ),
+                name="cs137_stat_farm_or_commodity",
+            ),
+        ]
+
+    def __str__(self):
+        target = f"farm {self.farm_id}" if self.farm_id else f"commodity {self.commodity_id}"
+        return f"Cs-137 {target}: {self.mean:.1f} ± {self.var ** 0.5:.1f} (n={self.n})"
+
+
+class Cs137Rollup(models.Model):
+    """
+    Ringkasan nilai Cs-137 per farm, komoditas dan bulan uji (labs.rollup).
+    Semua kolom bisa dijumlahkan / digabung, jadi ringkasan per kota,
+    provinsi atau periode lain dihitung dari baris-baris ini saja.
+    """
+
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name="+")
+    commodity = models.ForeignKey(Commodity, on_delete=models.CASCADE, related_name="+")
+    month = models.DateField(help_text="Tanggal 1 bulan uji")
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    total_sq = models.FloatField(default=0)
+    min_nilai = models.FloatField(null=True, blank=True)
+    max_nilai = models.FloatField(null=True, blank=True)
+    # histogram skala log {index bucket: jumlah}, untuk perkiraan kuantil
+    sketch = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["farm", "commodity", "month"],
+                name="unique_cs137_rollup",
+            ),
+        ]
+        indexes = [models.Index(fields=["month"], name="cs137_rollup_month_idx")]
+
+    def __str__(self):
+        return f"{self.farm_id}/{self.commodity_id} {self.month:%Y-%m}: n={self.count}"
+
+
+class PendingLabTest(models.Model):
+    """
+    Antrian kerja QC: satu baris per batch yang belum punya LabTest
+    (labs.workqueue). Baris dibuat saat batch dibuat dan dihapus saat hasil
+    ujinya disimpan, jadi daftar "belum diuji" dibaca dari tabel kecil
+    berindeks ini, bukan anti-join ke seluruh HarvestBatch.
+
+    claimed_by + lease_until: batch sedang dikerjakan seorang QC sampai
+    lease habis; QC lain tidak mendapatkannya saat claim.
+
+    assigned_lab + rencana_uji: jadwal dari labs.scheduler (assign_lab_tests);
+    kosong untuk batch yang masuk setelah penjadwalan terakhir.
+    """
+
+    batch = models.OneToOneField(
+        HarvestBatch, on_delete=models.CASCADE, primary_key=True, related_name="pending_lab_test"
+    )
+    # kota farm batch (untuk mencocokkan dengan kota laboratorium QC)
+    city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, related_name="+")
+    tanggal_panen = models.DateField()
+    claimed_by = models.ForeignKey(
+        UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    lease_until = models.DateTimeField(null=True, blank=True)
+    assigned_lab = models.ForeignKey(
+        Laboratory, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    rencana_uji = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["tanggal_panen", "batch"]
+        indexes = [
+            models.Index(fields=["assigned_lab", "tanggal_panen", "batch"], name="pending_lab_assigned_idx"),
+            models.Index(fields=["city", "tanggal_panen", "batch"], name="pending_lab_city_idx"),
+            models.Index(fields=["tanggal_panen", "batch"], name="pending_lab_panen_idx"),
+            models.Index(fields=["claimed_by", "lease_until"], name="pending_lab_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.batch_id} (belum diuji)"
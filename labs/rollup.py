@@ -0,0 +1,294 @@
+"""
+Rollup analitik Cs-137 per (farm, komoditas, bulan uji) di tabel Cs137Rollup.
+
+Setiap baris menyimpan count, sum, sum of squares, min, max dan sketch
+kuantil (histogram skala log). Semuanya bisa digabung, jadi ringkasan per
+kota / provinsi / komoditas / bulan cukup membaca baris rollup, bukan
+memindai LabTest:
+
+    cs137_summary(by=("province", "month"))
+    → [{"province": ..., "month": ..., "count": ..., "mean": ..., "p95": ...}, ...]
+
+Rollup diperbarui saat LabTest ditulis (labs/signals.py, dan langsung di
+jalur bulk_create) dan bisa dibangun ulang dengan rebuild_cs137_rollups.
+"""
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.db.models.functions import TruncMonth
+
+# sketch: bucket skala log, 20 per dekade (lebar ±6%), mulai dari SKETCH_MIN Bq/kg
+SKETCH_PER_DECADE = 20
+SKETCH_MIN = 0.1
+
+# dimensi ringkasan → field di Cs137Rollup
+ROLLUP_GROUPS = {
+    "farm": "farm__name",
+    "city": "farm__city__name",
+    "province": "farm__city__province",
+    "commodity": "commodity__code",
+    "month": "month",
+}
+
+
+def sketch_index(nilai: float) -> int:
+    if nilai <= SKETCH_MIN:
+        return 0
+    return 1 + int(math.log10(nilai / SKETCH_MIN) * SKETCH_PER_DECADE)
+
+
+def sketch_value(index: int) -> float:
+    """Nilai wakil bucket (titik tengah geometris)."""
+    if index == 0:
+        return SKETCH_MIN
+    return SKETCH_MIN * 10 ** ((index - 0.5) / SKETCH_PER_DECADE)
+
+
+def sketch_quantile(sketch: dict, q: float, lo=None, hi=None):
+    """Perkiraan kuantil q (0..1) dari sketch {index: count}, dibatasi min / max asli."""
+    count = sum(sketch.values())
+    if not count:
+        return None
+    rank = max(1, math.ceil(q * count))
+    seen = 0
+    for index in sorted(sketch, key=int):
+        seen += sketch[index]
+        if seen >= rank:
+            value = sketch_value(int(index))
+            break
+    if lo is not None:
+        value = max(value, lo)
+    if hi is not None:
+        value = min(value, hi)
+    return round(value, 2)
+
+
+def rollup_month(tanggal_uji: date) -> date:
+    return tanggal_uji.replace(day=1)
+
+
+@dataclass
+class RollupDelta:
+    count: int = 0
+    total: float = 0.0
+    total_sq: float = 0.0
+    lo: float | None = None
+    hi: float | None = None
+    sketch: Counter = field(default_factory=Counter)
+    # ada nilai yang dikeluarkan: min / max harus dihitung ulang
+    removed: bool = False
+
+    def add(self, nilai: float, sign: int = 1):
+        self.count += sign
+        self.total += sign * nilai
+        self.total_sq += sign * nilai * nilai
+        self.sketch[str(sketch_index(nilai))] += sign
+        if sign > 0:
+            self.lo = nilai if self.lo is None else min(self.lo, nilai)
+            self.hi = nilai if self.hi is None else max(self.hi, nilai)
+        else:
+            self.removed = True
+
+
+def rollup_state(lab_test):
+    """State LabTest yang menentukan rollup-nya: (batch_id, tanggal_uji, nilai)."""
+    # nilai bisa masih berupa string (misal dari import_data) sebelum dibaca ulang
+    opts = lab_test._meta
+    return (
+        lab_test.batch_id,
+        opts.get_field("tanggal_uji").to_python(lab_test.tanggal_uji),
+        opts.get_field("nilai_cs137").to_python(lab_test.nilai_cs137),
+    )
+
+
+def lab_test_rollup_deltas(changes) -> dict:
+    """
+    changes: list (state, sign) dengan state dari rollup_state (None diabaikan).
+    Return {(farm_id, commodity_id, bulan): RollupDelta}; farm / komoditas
+    diambil dari batch dengan satu query.
+    """
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+
+    changes = [(state, sign) for state, sign in changes if state is not None]
+    owners = {
+        pk: (farm_id, commodity_id)
+        for pk, farm_id, commodity_id in HarvestBatch.objects.filter(
+            pk__in={state[0] for state, _ in changes}
+        ).values_list("pk", "farm_id", "commodity_id")
+    }
+    deltas = {}
+    for (batch_id, tanggal_uji, nilai), sign in changes:
+        if batch_id not in owners:
+            continue  # batch-nya sedang dihapus, rollup ikut terhapus lewat farm / cascade
+        key = (*owners[batch_id], rollup_month(tanggal_uji))
+        deltas.setdefault(key, RollupDelta()).add(nilai, sign)
+    return deltas
+
+
+def apply_rollup_deltas(deltas: dict):
+    """
+    Gabungkan deltas ke Cs137Rollup. Baris dibuat dulu kalau belum ada
+    (ignore_conflicts), lalu dikunci dan di-bulk_update. Min / max baris
+    yang kehilangan nilai dihitung ulang dari LabTest; baris yang kosong dihapus.
+    """
+    Cs137Rollup = apps.get_model("labs", "Cs137Rollup")
+
+    deltas = {key: delta for key, delta in deltas.items() if delta.count or delta.removed}
+    if not deltas:
+        return
+
+    farm_ids = {farm_id for farm_id, _, _ in deltas}
+    months = [month for _, _, month in deltas]
+
+    with transaction.atomic():
+        Cs137Rollup.objects.bulk_create(
+            [
+                Cs137Rollup(farm_id=farm_id, commodity_id=commodity_id, month=month)
+                for (farm_id, commodity_id, month), delta in deltas.items()
+                if delta.count > 0
+            ],
+            ignore_conflicts=True,
+        )
+        rows = {
+            (row.farm_id, row.commodity_id, row.month): row
+            for row in Cs137Rollup.objects.select_for_update().filter(
+                farm_id__in=farm_ids,
+                month__range=(min(months), max(months)),
+            ).order_by("pk")
+            if (row.farm_id, row.commodity_id, row.month) in deltas
+        }
+
+        stale = []
+        for key, row in rows.items():
+            delta = deltas[key]
+            row.count += delta.count
+            row.total += delta.total
+            row.total_sq += delta.total_sq
+            sketch = Counter(row.sketch)
+            sketch.update(delta.sketch)
+            row.sketch = {index: n for index, n in sketch.items() if n > 0}
+            if delta.lo is not None:
+                row.min_nilai = delta.lo if row.min_nilai is None else min(row.min_nilai, delta.lo)
+                row.max_nilai = delta.hi if row.max_nilai is None else max(row.max_nilai, delta.hi)
+            if delta.removed and row.count > 0:
+                stale.append(row)
+
+        _refresh_min_max(stale)
+        Cs137Rollup.objects.filter(pk__in=[row.pk for row in rows.values() if row.count <= 0]).delete()
+        Cs137Rollup.objects.bulk_update(
+            [row for row in rows.values() if row.count > 0],
+            ["count", "total", "total_sq", "min_nilai", "max_nilai", "sketch"],
+            batch_size=1000,
+        )
+
+
+def _refresh_min_max(rows):
+    """Min / max dari LabTest untuk baris rollup yang nilainya berkurang."""
+    if not rows:
+        return
+    LabTest = apps.get_model("labs", "LabTest")
+
+    condition = Q()
+    for row in rows:
+        condition |= Q(
+            batch__farm_id=row.farm_id,
+            batch__commodity_id=row.commodity_id,
+            tanggal_uji__year=row.month.year,
+            tanggal_uji__month=row.month.month,
+        )
+    extremes = {
+        (row["batch__farm_id"], row["batch__commodity_id"], row["bulan"]): (row["lo"], row["hi"])
+        for row in LabTest.objects.filter(condition)
+        .order_by()
+        .annotate(bulan=TruncMonth("tanggal_uji"))
+        .values("batch__farm_id", "batch__commodity_id", "bulan")
+        .annotate(lo=Min("nilai_cs137"), hi=Max("nilai_cs137"))
+    }
+    for row in rows:
+        row.min_nilai, row.max_nilai = extremes.get((row.farm_id, row.commodity_id, row.month), (None, None))
+
+
+def rebuild_cs137_rollups(chunk_size: int = 5000) -> int:
+    """Bangun ulang seluruh Cs137Rollup dari LabTest (satu pass). Return jumlah LabTest."""
+    Cs137Rollup = apps.get_model("labs", "Cs137Rollup")
+    LabTest = apps.get_model("labs", "LabTest")
+
+    deltas = {}
+    total = 0
+    rows = LabTest.objects.order_by().values_list(
+        "batch__farm_id", "batch__commodity_id", "tanggal_uji", "nilai_cs137"
+    )
+    for farm_id, commodity_id, tanggal_uji, nilai in rows.iterator(chunk_size=chunk_size):
+        deltas.setdefault((farm_id, commodity_id, rollup_month(tanggal_uji)), RollupDelta()).add(nilai)
+        total += 1
+
+    with transaction.atomic():
+        Cs137Rollup.objects.all().delete()
+        Cs137Rollup.objects.bulk_create(
+            [
+                Cs137Rollup(
+                    farm_id=farm_id,
+                    commodity_id=commodity_id,
+                    month=month,
+                    count=delta.count,
+                    total=delta.total,
+                    total_sq=delta.total_sq,
+                    min_nilai=delta.lo,
+                    max_nilai=delta.hi,
+                    sketch=dict(delta.sketch),
+                )
+                for (farm_id, commodity_id, month), delta in deltas.items()
+            ],
+            batch_size=1000,
+        )
+    return total
+
+
+def cs137_summary(by=("province", "month"), **filters) -> list[dict]:
+    """
+    Ringkasan Cs-137 dari rollup, dikelompokkan menurut dimensi di `by`
+    (lihat ROLLUP_GROUPS). filters diteruskan ke Cs137Rollup.objects.filter,
+    misal month__gte=date(2025, 1, 1) atau farm__city__province="Jawa Barat".
+    """
+    Cs137Rollup = apps.get_model("labs", "Cs137Rollup")
+
+    unknown = set(by) - ROLLUP_GROUPS.keys()
+    if unknown:
+        raise ValueError(f"by harus dari {list(ROLLUP_GROUPS)}, bukan {sorted(unknown)}")
+    fields = [ROLLUP_GROUPS[name] for name in by]
+
+    groups = {}
+    for *key, count, total, total_sq, lo, hi, sketch in (
+        Cs137Rollup.objects.filter(**filters)
+        .order_by()
+        .values_list(*fields, "count", "total", "total_sq", "min_nilai", "max_nilai", "sketch")
+    ):
+        group = groups.setdefault(tuple(key), RollupDelta())
+        group.count += count
+        group.total += total
+        group.total_sq += total_sq
+        group.sketch.update(sketch)
+        group.lo = lo if group.lo is None else min(group.lo, lo)
+        group.hi = hi if group.hi is None else max(group.hi, hi)
+
+    summary = []
+    for key in sorted(groups, key=lambda k: tuple("" if v is None else str(v) for v in k)):
+        group = groups[key]
+        mean = group.total / group.count
+        variance = max(0.0, group.total_sq / group.count - mean * mean)
+        summary.append({
+            **dict(zip(by, key)),
+            "count": group.count,
+            "mean": round(mean, 2),
+            "std": round(math.sqrt(variance), 2),
+            "min": group.lo,
+            "max": group.hi,
+            "p50": sketch_quantile(group.sketch, 0.5, group.lo, group.hi),
+            "p95": sketch_quantile(group.sketch, 0.95, group.lo, group.hi),
+        })
+    return summary
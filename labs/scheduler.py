@@ -0,0 +1,242 @@
+"""
+Penjadwalan batch belum diuji (PendingLabTest) ke laboratorium.
+
+    plan = assign_lab_tests()          # jalankan berkala (cron)
+    → [LabSchedule(lab_id, nama, kapasitas, jumlah, selesai), ...]
+
+Setiap lab diberi kapasitas harian dari throughput-nya sendiri
+(LabTest per hari selama LAB_THROUGHPUT_WINDOW_DAYS terakhir). Batch
+dikelompokkan per (kota farm, tingkat urgensi umur panen), lalu kelompok
+dibagi ke slot (lab, hari ke-d) dengan min-cost flow:
+
+    biaya = jarak(kota farm, kota lab) + d × bobot urgensi
+
+Jadi batch lama didahulukan, dan batch baru dikirim ke lab yang lebih
+jauh hanya kalau lab terdekat sudah penuh lebih lama daripada ongkos
+jaraknya. Belum ada koordinat kota, jadi jarak dinyatakan sebagai
+tingkat: kota sama, provinsi sama, provinsi lain.
+
+Hasilnya ditulis ke PendingLabTest.assigned_lab / rencana_uji (satu
+bulk_update), sehingga antrian QC cukup difilter per lab (workqueue.pending_for).
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from math import ceil
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# throughput lab dihitung dari uji selama N hari terakhir
+LAB_THROUGHPUT_WINDOW_DAYS = getattr(settings, "LAB_THROUGHPUT_WINDOW_DAYS", 28)
+# kapasitas minimum per hari: lab baru / sepi tetap mendapat batch
+LAB_MIN_DAILY_CAPACITY = getattr(settings, "LAB_MIN_DAILY_CAPACITY", 5)
+# jumlah hari yang dijadwalkan; sisa antrian menumpuk di hari terakhir
+LAB_SCHEDULE_DAYS = getattr(settings, "LAB_SCHEDULE_DAYS", 14)
+# ongkos jarak dalam "hari tunggu" batch baru: provinsi sama / provinsi lain
+LAB_DISTANCE_COST_PROVINCE = getattr(settings, "LAB_DISTANCE_COST_PROVINCE", 2)
+LAB_DISTANCE_COST_FAR = getattr(settings, "LAB_DISTANCE_COST_FAR", 5)
+# umur panen (hari) tempat bobot urgensi naik satu tingkat
+LAB_URGENCY_DAYS = getattr(settings, "LAB_URGENCY_DAYS", (3, 7, 14))
+
+_INF = np.iinfo(np.int64).max // 4
+
+
+@dataclass
+class LabSchedule:
+    lab_id: int
+    nama: str
+    kapasitas: int  # batch per hari
+    jumlah: int = 0  # batch yang dijadwalkan (termasuk yang sedang di-claim)
+    selesai: object = None  # rencana uji batch terakhir
+
+
+def lab_daily_capacity(today, window_days: int = LAB_THROUGHPUT_WINDOW_DAYS) -> dict:
+    """{lab_id: batch per hari} dari jumlah LabTest per lab selama window_days terakhir."""
+    Laboratory = apps.get_model("labs", "Laboratory")
+    LabTest = apps.get_model("labs", "LabTest")
+
+    capacity = {pk: LAB_MIN_DAILY_CAPACITY for pk in Laboratory.objects.values_list("pk", flat=True)}
+    rows = (
+        LabTest.objects.filter(tanggal_uji__gt=today - timedelta(days=window_days), tanggal_uji__lte=today)
+        # LabTest lama belum mengisi lab: pakai lab QC-nya
+        .annotate(lab_uji=Coalesce("lab", "qc__laboratory"))
+        .order_by()
+        .values("lab_uji")
+        .annotate(n=Count("pk"))
+    )
+    for row in rows:
+        if row["lab_uji"] in capacity:
+            capacity[row["lab_uji"]] = max(LAB_MIN_DAILY_CAPACITY, ceil(row["n"] / window_days))
+    return capacity
+
+
+def distance_cost(city, lab_city) -> int:
+    """city / lab_city: (id, provinsi); city None (farm tanpa kota) = jauh dari semua lab."""
+    if city is None:
+        return LAB_DISTANCE_COST_FAR
+    if city[0] == lab_city[0]:
+        return 0
+    if city[1] == lab_city[1]:
+        return LAB_DISTANCE_COST_PROVINCE
+    return LAB_DISTANCE_COST_FAR
+
+
+def urgency_weight(tanggal_panen, today) -> int:
+    """1 untuk panen baru, naik satu setiap melewati ambang LAB_URGENCY_DAYS."""
+    umur = (today - tanggal_panen).days
+    return 1 + sum(umur >= days for days in LAB_URGENCY_DAYS)
+
+
+def min_cost_flow(capacity, cost, source: int, sink: int):
+    """
+    Min-cost max-flow (successive shortest path, Dijkstra dengan potensial)
+    pada graf padat: capacity / cost matriks n×n int, biaya tidak negatif dan
+    sisi hanya satu arah. Return matriks flow.
+    """
+    n = len(capacity)
+    residual = capacity.astype(np.int64)
+    cost = cost.astype(np.int64)
+    cost = cost - cost.T  # sisi balik: biaya negatif
+    potential = np.zeros(n, dtype=np.int64)
+
+    while True:
+        dist = np.full(n, _INF, dtype=np.int64)
+        prev = np.full(n, -1)
+        done = np.zeros(n, dtype=bool)
+        dist[source] = 0
+        for _ in range(n):
+            u = int(np.where(done, _INF, dist).argmin())
+            if done[u] or dist[u] >= _INF:
+                break
+            done[u] = True
+            candidate = dist[u] + cost[u] + potential[u] - potential
+            better = (residual[u] > 0) & ~done & (candidate < dist)
+            dist[better] = candidate[better]
+            prev[better] = u
+        if dist[sink] >= _INF:
+            break
+        # node yang tidak terjangkau tetap tidak terjangkau, potensialnya boleh tetap
+        potential += np.where(dist < _INF, dist, 0)
+
+        path = [sink]
+        while path[-1] != source:
+            path.append(int(prev[path[-1]]))
+        path.reverse()
+        edges = list(zip(path, path[1:]))
+        amount = min(residual[u, v] for u, v in edges)
+        for u, v in edges:
+            residual[u, v] -= amount
+            residual[v, u] += amount
+
+    return np.maximum(capacity - residual, 0)
+
+
+def plan_lab_assignments(groups: dict, labs: list, capacity: dict, days: int):
+    """
+    groups: {(city, bobot): jumlah batch}, city = (id, provinsi) atau None.
+    labs: [(lab_id, (city_id, provinsi))]; capacity: {lab_id: [sisa slot hari 0..days-1]}.
+    Return {(city, bobot): [(lab_id, hari, jumlah), ...]} urut hari.
+    Slot hari terakhir tidak dibatasi, jadi semua batch selalu mendapat lab.
+    """
+    keys = list(groups)
+    slots = [(lab_id, day) for lab_id, _ in labs for day in range(days)]
+    lab_city = dict(labs)
+    total = sum(groups.values())
+
+    # node: 0 = sumber, 1..G = kelompok, G+1..G+S = slot (lab, hari), terakhir = sink
+    source, first_slot = 0, len(keys) + 1
+    sink = first_slot + len(slots)
+    cap = np.zeros((sink + 1, sink + 1), dtype=np.int64)
+    cost = np.zeros_like(cap)
+    for g, key in enumerate(keys, start=1):
+        city, weight = key
+        cap[source, g] = groups[key]
+        for s, (lab_id, day) in enumerate(slots, start=first_slot):
+            cap[g, s] = groups[key]
+            cost[g, s] = distance_cost(city, lab_city[lab_id]) + day * weight
+    for s, (lab_id, day) in enumerate(slots, start=first_slot):
+        cap[s, sink] = total if day == days - 1 else max(0, capacity[lab_id][day])
+
+    flow = min_cost_flow(cap, cost, source, sink)
+    plan = {}
+    for g, key in enumerate(keys, start=1):
+        plan[key] = [
+            (lab_id, day, int(flow[g, s]))
+            for s, (lab_id, day) in enumerate(slots, start=first_slot)
+            if flow[g, s] > 0
+        ]
+        plan[key].sort(key=lambda item: item[1])
+    return plan
+
+
+def assign_lab_tests(days: int = LAB_SCHEDULE_DAYS, dry_run: bool = False) -> list[LabSchedule]:
+    """
+    Jadwalkan ulang seluruh antrian ke laboratorium. Batch yang sedang di-claim
+    tetap di lab QC pemegangnya dan memakai kapasitas hari pertama lab itu.
+    Return ringkasan per lab; dry_run = hitung saja, tidak ditulis.
+    """
+    Laboratory = apps.get_model("labs", "Laboratory")
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    days = max(1, days)
+    today = timezone.localdate()
+    labs = list(Laboratory.objects.order_by("pk").values_list("pk", "nama", "city_id", "city__province"))
+    if not labs:
+        return []
+    daily = lab_daily_capacity(today)
+    schedule = {pk: LabSchedule(pk, nama, daily[pk]) for pk, nama, _, _ in labs}
+    remaining = {pk: [daily[pk]] * days for pk in schedule}
+
+    now = timezone.now()
+    pending = list(
+        PendingLabTest.objects.order_by("tanggal_panen", "batch").values_list(
+            "batch_id", "city_id", "city__province", "tanggal_panen",
+            "assigned_lab_id", "rencana_uji", "lease_until", "claimed_by__laboratory_id",
+        )
+    )
+
+    updates = {}
+    groups = defaultdict(list)
+    for batch_id, city_id, province, tanggal_panen, lab_id, rencana, lease_until, claim_lab in pending:
+        if lease_until is not None and lease_until >= now and claim_lab in schedule:
+            updates[batch_id] = (claim_lab, today)
+            slots = remaining[claim_lab]
+            day = next((d for d, free in enumerate(slots) if free > 0), days - 1)
+            slots[day] -= 1
+            continue
+        city = (city_id, province) if city_id is not None else None
+        groups[(city, urgency_weight(tanggal_panen, today))].append(batch_id)
+
+    plan = plan_lab_assignments(
+        {key: len(batch_ids) for key, batch_ids in groups.items()},
+        [(pk, (city_id, province)) for pk, _, city_id, province in labs],
+        remaining,
+        days,
+    )
+    for key, batch_ids in groups.items():
+        # batch tertua kelompok mendapat slot paling awal
+        batch_ids = iter(batch_ids)
+        for lab_id, day, jumlah in plan[key]:
+            for _ in range(jumlah):
+                updates[next(batch_ids)] = (lab_id, today + timedelta(days=day))
+
+    changed = []
+    for batch_id, _, _, _, lab_id, rencana, _, _ in pending:
+        new_lab, new_rencana = updates[batch_id]
+        entry = schedule[new_lab]
+        entry.jumlah += 1
+        entry.selesai = new_rencana if entry.selesai is None else max(entry.selesai, new_rencana)
+        if (lab_id, rencana) != (new_lab, new_rencana):
+            changed.append(PendingLabTest(batch_id=batch_id, assigned_lab_id=new_lab, rencana_uji=new_rencana))
+
+    if not dry_run:
+        with transaction.atomic():
+            # baris yang sudah diuji sementara itu tidak ada lagi: di-update 0 baris
+            PendingLabTest.objects.bulk_update(changed, ["assigned_lab", "rencana_uji"], batch_size=1000)
+    return list(schedule.values())
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import LabTest
+from .rollup import rollup_state
+from .utils import apply_lab_test_side_effects
+
+# field LabTest yang menentukan tabel turunannya (lihat apply_lab_test_side_effects)
+ROLLUP_FIELDS = {"batch", "batch_id", "tanggal_uji", "nilai_cs137"}
+
+
+def _touches_rollup(update_fields):
+    return update_fields is None or bool(ROLLUP_FIELDS & set(update_fields))
+
+
+@receiver(pre_save, sender=LabTest)
+def load_rollup_state(sender, instance, update_fields=None, **kwargs):
+    """Instance yang tidak dibaca lengkap dari DB: ambil state lamanya dulu."""
+    if instance._state.adding or hasattr(instance, "_rollup_state"):
+        return
+    if not _touches_rollup(update_fields):
+        return
+    instance._rollup_state = (
+        LabTest.objects.filter(pk=instance.pk)
+        .values_list("batch_id", "tanggal_uji", "nilai_cs137")
+        .first()
+    )
+
+
+@receiver(post_save, sender=LabTest)
+def update_lab_test_state(sender, instance, created, update_fields=None, **kwargs):
+    if not created and not _touches_rollup(update_fields):
+        # state tidak berubah, tapi isi trace (kesimpulan, lab, ...) bisa berubah
+        state = rollup_state(instance)
+        apply_lab_test_side_effects([(state, state)])
+        return
+    old_state = None if created else getattr(instance, "_rollup_state", None)
+    new_state = rollup_state(instance)
+    apply_lab_test_side_effects([(old_state, new_state)])
+    instance._rollup_state = new_state
+
+
+@receiver(post_delete, sender=LabTest)
+def remove_lab_test_state(sender, instance, **kwargs):
+    old_state = getattr(instance, "_rollup_state", None) or rollup_state(instance)
+    apply_lab_test_side_effects([(old_state, None)])
@@ -1,3 +1,631 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import threading
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from batches.models import Activity, Commodity, HarvestBatch
+from batches.rules import get_active_rule_set
+from batches.tests import ImportedDataTestCase
+from farms.models import Farm, FarmSummary
+from labs.anomaly import ewma_update, rebuild_cs137_stats, z_score
+from labs.feed import LabFeedListener
+from labs.ingest import GAGAL, OK, ingest_lab_results, read_lab_results
+from labs.models import Cs137Rollup, Cs137Stat, Laboratory, LabTest, LabTestSideEffect, PendingLabTest
+from labs.rollup import rebuild_cs137_rollups
+from labs.scheduler import assign_lab_tests, min_cost_flow, plan_lab_assignments
+from labs.utils import defer_labtest_side_effects, process_labtest_queue, queue_labtest_side_effects
+from labs.workqueue import (
+    available_for,
+    claim_batches,
+    claimed_by_other,
+    claimed_by_others,
+    my_claims,
+    rebuild_pending_lab_tests,
+    release_claims,
+)
+from profiles.models import UserProfile
+
+
+def cs137_rollups():
+    return sorted(
+        (row.farm_id, row.commodity_id, row.month, row.count, round(row.total, 6), round(row.total_sq, 4),
+         row.min_nilai, row.max_nilai, sorted(row.sketch.items()))
+        for row in Cs137Rollup.objects.all()
+    )
+
+
+def cs137_anomalies():
+    stats = sorted(
+        ((row.farm_id or 0, row.commodity_id or 0, row.n, round(row.mean, 6), round(row.var, 6))
+         for row in Cs137Stat.objects.all()),
+    )
+    return stats, sorted(LabTest.objects.values_list(
+        "batch_id", "anomali_z_farm", "anomali_z_komoditas", "is_anomali", "updated_at"
+    ))
+
+
+def lab_side_effects():
+    return {
+        "batch": sorted(HarvestBatch.objects.values_list(
+            "pk", "quality_status", "risk_score", "shipment_status"
+        )),
+        "farm": sorted(Farm.objects.values_list("pk", "risk_score")),
+        "activity": sorted(Activity.objects.values_list("batch_id", "tanggal", "jenis", "keterangan")),
+        "summary": sorted(FarmSummary.objects.values_list(
+            "farm_id", "batch_aman", "batch_pending", "batch_masalah", "risk_total", "jumlah_aktivitas"
+        )),
+    }
+
+
+def lab_queue():
+    return sorted(PendingLabTest.objects.values_list("batch_id", "city_id", "tanggal_panen"))
+
+
+class LabTestDataTestCase(ImportedDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.qc = UserProfile.objects.get(user__username="qc_andi")
+        cls.other_qc = UserProfile.objects.get(user__username="qc_budi")
+        # tambahan batch yang belum diuji (data contoh hanya punya satu)
+        batch = HarvestBatch.objects.filter(lab_test__isnull=True).first()
+        with cls.captureOnCommitCallbacks(execute=True):
+            for i in range(1, 4):
+                HarvestBatch.objects.create(
+                    farm=batch.farm,
+                    commodity=batch.commodity,
+                    tanggal_tebar=batch.tanggal_tebar,
+                    tanggal_panen=batch.tanggal_panen + timedelta(days=i),
+                    volume_kg=100 * i,
+                    tujuan="Jepang",
+                )
+
+    def untested(self):
+        return list(
+            HarvestBatch.objects.filter(lab_test__isnull=True)
+            .order_by("tanggal_panen", "pk")
+            .values_list("pk", flat=True)
+        )
+
+    def synchronous(self, write):
+        """lab_side_effects() setelah write() dengan efek samping per save, lalu rollback."""
+        with transaction.atomic():
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            result = lab_side_effects()
+            transaction.set_rollback(True)
+        return result
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(cs137_rollups(), self.rebuilt(rebuild_cs137_rollups, cs137_rollups))
+        self.assertEqual(lab_queue(), self.rebuilt(rebuild_pending_lab_tests, lab_queue))
+
+
+class Cs137RollupTests(LabTestDataTestCase):
+    def test_after_import(self):
+        self.assertEqual(sum(row.count for row in Cs137Rollup.objects.all()), LabTest.objects.count())
+        self.assertMatchesRebuild()
+
+    def test_lab_test_edits_and_deletes(self):
+        kode = self.untested()[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            lab_test = LabTest.objects.create(
+                batch_id=kode, nilai_cs137=620, tanggal_uji=date(2026, 6, 1), qc=self.qc
+            )
+        self.assertMatchesRebuild()
+
+        lab_test.nilai_cs137 = 80
+        lab_test.tanggal_uji = date(2026, 8, 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            lab_test.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.get(pk=lab_test.pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_batch_moves_farm_and_commodity(self):
+        batch = HarvestBatch.objects.filter(lab_test__isnull=False).first()
+        batch.farm = Farm.objects.exclude(pk=batch.farm_id).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save()
+        self.assertMatchesRebuild()
+
+        batch.commodity = Commodity.objects.exclude(pk=batch.commodity_id).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.delete()
+        self.assertMatchesRebuild()
+
+
+class LabTestSaveQueryCountTests(LabTestDataTestCase):
+    def test_lab_test_create(self):
+        batch = HarvestBatch.objects.select_related("farm", "commodity").get(pk=self.untested()[0])
+        qc = UserProfile.objects.select_related("user").get(pk=self.qc.pk)
+        get_active_rule_set()
+        # risk batch / farm, anomali dan activity UJI_LAB / SIAP_EKSPOR, dengan
+        # satu tulis FarmSummary dan satu tulis HarvestRollup untuk semuanya
+        with self.assertNumQueries(34), self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.create(batch=batch, nilai_cs137=50, tanggal_uji=date(2026, 6, 1), qc=qc)
+        self.assertMatchesRebuild()
+
+
+class DeferLabTestSideEffectsTests(LabTestDataTestCase):
+    def write(self):
+        # dua batch farm yang sama, lalu uji ulang batch yang sudah diuji:
+        # risk batch harus melihat risk farm sesudah save sebelumnya
+        untested = self.untested()
+        LabTest.objects.create(batch_id=untested[0], nilai_cs137=450.0, tanggal_uji=date(2026, 6, 1), qc=self.qc)
+        LabTest.objects.create(batch_id=untested[1], nilai_cs137=700.0, tanggal_uji=date(2026, 6, 2), qc=self.qc)
+        lab_test = LabTest.objects.exclude(batch_id__in=untested).first()
+        lab_test.nilai_cs137 = 650.0
+        lab_test.save()
+
+    def test_matches_per_row_save(self):
+        synchronous = self.synchronous(self.write)
+        self.assertNotEqual(synchronous, lab_side_effects())
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), defer_labtest_side_effects():
+                self.write()
+                # belum ada efek samping di dalam blok
+                self.assertFalse(Activity.objects.filter(batch_id=self.untested()[0], jenis="UJI_LAB").exists())
+        self.assertEqual(lab_side_effects(), synchronous)
+        self.assertMatchesRebuild()
+
+    def test_error_skips_side_effects(self):
+        before = lab_side_effects()
+        with self.assertRaises(ValueError), transaction.atomic(), defer_labtest_side_effects():
+            self.write()
+            raise ValueError
+        self.assertEqual(lab_side_effects(), before)
+
+
+class LabTestQueueTests(LabTestDataTestCase):
+    def create_lab_tests(self):
+        for kode, nilai in zip(self.untested(), [50.0, 620.0, 95.5]):
+            LabTest.objects.create(batch_id=kode, nilai_cs137=nilai, tanggal_uji=date(2026, 6, 1), qc=self.qc)
+
+    def test_queue_matches_synchronous_save(self):
+        before = lab_side_effects()
+        synchronous = self.synchronous(self.create_lab_tests)
+        self.assertNotEqual(synchronous, before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), queue_labtest_side_effects():
+                self.create_lab_tests()
+        self.assertEqual(LabTestSideEffect.objects.count(), 3)
+        self.assertEqual(lab_side_effects()["activity"], before["activity"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_labtest_queue(limit=2), 2)
+            self.assertEqual(process_labtest_queue(), 1)
+            self.assertEqual(process_labtest_queue(), 0)
+        self.assertFalse(LabTestSideEffect.objects.exists())
+        self.assertEqual(lab_side_effects(), synchronous)
+        self.assertMatchesRebuild()
+
+    def test_queue_entry_protects_qc(self):
+        with transaction.atomic(), queue_labtest_side_effects():
+            self.create_lab_tests()
+        LabTest.objects.filter(qc=self.qc).delete()
+        with self.assertRaises(ProtectedError):
+            self.qc.delete()
+
+
+class Cs137AnomalyTests(LabTestDataTestCase):
+    def test_ewma(self):
+        stat = SimpleNamespace(n=0, mean=0.0, var=0.0)
+        for nilai in (10, 20):
+            ewma_update(stat, nilai, alpha=0.5)
+        # 20: diff 10, mean 10 + 0.5 * 10, var 0.5 * (0 + 10 * 5)
+        self.assertEqual((stat.n, stat.mean, stat.var), (2, 15.0, 25.0))
+        self.assertIsNone(z_score(stat, 40))
+        with mock.patch("labs.anomaly.CS137_ANOMALY_MIN_SAMPLES", 2):
+            self.assertEqual(z_score(stat, 40), 5.0)
+            # std di bawah CS137_ANOMALY_MIN_STD (5) dibulatkan ke atas
+            self.assertEqual(z_score(SimpleNamespace(n=2, mean=15.0, var=1.0), 25), 2.0)
+
+    def test_after_import(self):
+        stats, _ = cs137_anomalies()
+        self.assertEqual(sum(n for farm_id, _, n, _, _ in stats if farm_id), LabTest.objects.count())
+        self.assertEqual(cs137_anomalies(), self.rebuilt(rebuild_cs137_stats, cs137_anomalies))
+
+    @mock.patch("labs.anomaly.CS137_ANOMALY_MIN_SAMPLES", 1)
+    def test_new_results_are_incremental(self):
+        # histori diputar ulang dulu dengan batas sampel yang sama
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_cs137_stats()
+        kodes = self.untested()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, kode in enumerate(kodes):
+                LabTest.objects.create(
+                    batch_id=kode, nilai_cs137=[20, 25, 900, 30][i % 4],
+                    tanggal_uji=date(2027, 1, 1) + timedelta(days=i), qc=self.qc,
+                )
+        self.assertTrue(LabTest.objects.filter(batch_id__in=kodes, is_anomali=True).exists())
+        # hasil baru urut tanggal = sama dengan memutar ulang seluruh histori,
+        # dan kolom anomali yang ditulis tidak memajukan updated_at
+        self.assertEqual(cs137_anomalies(), self.rebuilt(rebuild_cs137_stats, cs137_anomalies))
+
+        # LabTest yang disimpan ulang bukan sampel baru
+        stats = cs137_anomalies()[0]
+        lab_test = LabTest.objects.get(batch_id=kodes[0])
+        lab_test.nilai_cs137 = 40
+        with self.captureOnCommitCallbacks(execute=True):
+            lab_test.save()
+        self.assertEqual(cs137_anomalies()[0], stats)
+
+
+class LabQueueTests(LabTestDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # tanpa laboratorium: antrian QC = seluruh batch yang belum diuji
+        UserProfile.objects.filter(pk__in=[cls.qc.pk, cls.other_qc.pk]).update(laboratory=None)
+        cls.qc.laboratory = cls.other_qc.laboratory = None
+
+    def test_queue_holds_untested_batches(self):
+        self.assertEqual(sorted(PendingLabTest.objects.values_list("batch_id", flat=True)), sorted(self.untested()))
+        self.assertMatchesRebuild()
+
+    def test_claim_is_exclusive(self):
+        untested = self.untested()
+        first = claim_batches(self.qc, 2)
+        self.assertEqual(first, untested[:2])
+        self.assertEqual(claimed_by_other(first[0], self.other_qc), self.qc)
+        self.assertIsNone(claimed_by_other(first[0], self.qc))
+
+        # QC lain hanya mendapat sisa antrian
+        second = claim_batches(self.other_qc, 10)
+        self.assertEqual(second, untested[2:])
+        self.assertEqual(claim_batches(self.qc, 10), [])
+        self.assertFalse(available_for(self.qc).exists())
+        self.assertEqual(sorted(my_claims(self.qc).values_list("batch_id", flat=True)), first)
+
+        self.assertEqual(release_claims(self.qc, [first[0]]), 1)
+        self.assertEqual(claim_batches(self.other_qc, 10), [first[0]])
+
+    def test_expired_lease_can_be_claimed(self):
+        claimed = claim_batches(self.qc, 1)
+        self.assertEqual(len(claimed), 1)
+        PendingLabTest.objects.filter(batch_id__in=claimed).update(
+            lease_until=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertFalse(my_claims(self.qc).exists())
+        self.assertEqual(claim_batches(self.other_qc, 1), claimed)
+
+    def test_lab_test_dequeues_and_delete_requeues(self):
+        kode = claim_batches(self.qc, 1)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.create(batch_id=kode, nilai_cs137=120, tanggal_uji=date(2026, 6, 1), qc=self.qc)
+        self.assertFalse(PendingLabTest.objects.filter(batch_id=kode).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LabTest.objects.get(batch_id=kode).delete()
+        pending = PendingLabTest.objects.get(batch_id=kode)
+        self.assertIsNone(pending.claimed_by)
+        self.assertIn(kode, claim_batches(self.other_qc, 10))
+        self.assertMatchesRebuild()
+
+    def test_batch_edit_refreshes_queue(self):
+        batch = HarvestBatch.objects.get(pk=self.untested()[0])
+        batch.tanggal_panen = date(2024, 1, 1)
+        batch.farm = Farm.objects.exclude(pk=batch.farm_id).exclude(city=batch.farm.city).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.delete()
+        self.assertMatchesRebuild()
+
+
+class LabSchedulerTests(LabTestDataTestCase):
+    def test_min_cost_flow(self):
+        # 0 = sumber, 1-2 = kelompok, 3-4 = slot, 5 = sink. Jalur termurah
+        # pertama (1→3) harus dibatalkan lewat sisi balik: optimum = 2×3 + 1 = 7
+        capacity = np.zeros((6, 6), dtype=np.int64)
+        cost = np.zeros_like(capacity)
+        capacity[0, 1], capacity[0, 2] = 2, 1
+        capacity[1, 3], capacity[1, 4], capacity[2, 3], capacity[2, 4] = 2, 2, 1, 1
+        cost[1, 3], cost[1, 4], cost[2, 3], cost[2, 4] = 1, 3, 1, 10
+        capacity[3, 5], capacity[4, 5] = 1, 2
+
+        flow = min_cost_flow(capacity, cost, 0, 5)
+        self.assertEqual((flow[1, 3], flow[1, 4], flow[2, 3], flow[2, 4]), (0, 2, 1, 0))
+        self.assertEqual(flow[0].sum(), 3)
+        self.assertEqual(int((flow * cost).sum()), 7)
+
+    def test_plan_prefers_near_lab_then_later_day(self):
+        near, far = ((1, "Jawa Timur"), 1), ((3, "Sulawesi Selatan"), 3)
+        plan = plan_lab_assignments(
+            {near: 3, far: 1},
+            [(10, (1, "Jawa Timur")), (20, (2, "Jawa Timur"))],
+            {10: [2, 2], 20: [2, 2]},
+            days=2,
+        )
+        # kota sama hari berikutnya (1) lebih murah dari provinsi sama hari ini (2)
+        self.assertEqual(plan[near], [(10, 0, 2), (10, 1, 1)])
+        self.assertEqual(plan[far], [(20, 0, 1)])
+
+    def test_assign_lab_tests(self):
+        untested = self.untested()
+        jakarta = Laboratory.objects.get(nama="Lab Uji Radiasi Jakarta")
+        surabaya = Laboratory.objects.get(nama="Lab Uji Perikanan Surabaya")
+        # batch tertua sedang dipegang QC lab Surabaya
+        PendingLabTest.objects.filter(batch_id=untested[0]).update(
+            claimed_by=self.other_qc, lease_until=timezone.now() + timedelta(hours=1)
+        )
+        today = timezone.localdate()
+
+        with mock.patch("labs.scheduler.LAB_MIN_DAILY_CAPACITY", 1):
+            plan = assign_lab_tests(days=2, dry_run=True)
+            self.assertEqual(sum(entry.jumlah for entry in plan), len(untested))
+            self.assertFalse(PendingLabTest.objects.filter(assigned_lab__isnull=False).exists())
+
+            assign_lab_tests(days=2)
+
+        rows = dict(PendingLabTest.objects.values_list("batch_id", "rencana_uji"))
+        self.assertEqual([rows[kode] for kode in untested], [today, today] + [today + timedelta(days=1)] * 2)
+        labs = dict(PendingLabTest.objects.values_list("batch_id", "assigned_lab"))
+        # slot hari ini Surabaya sudah terpakai batch yang di-claim
+        self.assertEqual((labs[untested[0]], labs[untested[1]]), (surabaya.pk, jakarta.pk))
+
+
+class LabResultUploadTests(LabTestDataTestCase):
+    def read(self, content, filename):
+        return read_lab_results(io.BytesIO(content.encode()), filename)
+
+    def test_csv_error_rows(self):
+        tested = LabTest.objects.values_list("batch_id", flat=True).first()
+        kode, other = self.untested()[:2]
+        content = (
+            "kode_batch,nilai_cs137,tanggal_uji\n"
+            f"{kode},150,2026-06-01\n"
+            "TIDAK-ADA,150,2026-06-01\n"
+            f"{tested},150,2026-06-01\n"
+            f"{kode},160,2026-06-02\n"
+            f"{other},abc,2026-06-01\n"
+            f"{other},-5,2026-06-01\n"
+            f"{other},150,01/06/2026\n"
+            ",150,2026-06-01\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ingest_lab_results(self.read(content, "hasil.csv"), qc=self.qc)
+
+        self.assertEqual(
+            [(row.baris, row.status, row.pesan) for row in report.rows],
+            [
+                (2, OK, ""),
+                (3, GAGAL, "Batch tidak ditemukan"),
+                (4, GAGAL, "Batch sudah memiliki hasil uji lab"),
+                (5, GAGAL, "Kode batch muncul lebih dari sekali di kiriman yang sama"),
+                (6, GAGAL, "nilai_cs137 bukan angka"),
+                (7, GAGAL, "nilai_cs137 harus angka >= 0"),
+                (8, GAGAL, "tanggal_uji harus berformat YYYY-MM-DD"),
+                (9, GAGAL, "kode_batch kosong"),
+            ],
+        )
+        self.assertEqual((report.created, report.failed), (1, 7))
+        self.assertEqual(LabTest.objects.get(batch_id=kode).nilai_cs137, 150)
+        self.assertFalse(LabTest.objects.filter(batch_id=other).exists())
+        self.assertMatchesRebuild()
+
+    def test_json_rows(self):
+        kode, other = self.untested()[:2]
+        content = json.dumps({"results": [
+            {"batch_kode": kode, "nilai_cs137": 700, "tanggal_uji": "2026-06-01"},
+            {"kode_batch": other, "nilai_cs137": None, "tanggal_uji": "2026-06-01"},
+        ]})
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ingest_lab_results(self.read(content, "hasil.json"), qc=self.qc)
+
+        self.assertEqual(
+            [(row.baris, row.status, row.kesimpulan) for row in report.rows],
+            [(1, OK, "BERMASALAH"), (2, GAGAL, None)],
+        )
+        self.assertEqual(report.as_dicts()[0]["tanggal_uji"], "2026-06-01")
+        self.assertEqual(HarvestBatch.objects.get(pk=kode).quality_status, "MASALAH")
+        self.assertMatchesRebuild()
+
+    def test_claimed_by_other_qc(self):
+        kode, other = self.untested()[:2]
+        PendingLabTest.objects.filter(batch_id=kode).update(
+            claimed_by=self.other_qc, lease_until=timezone.now() + timedelta(hours=1)
+        )
+        content = f"kode_batch,nilai_cs137,tanggal_uji\n{kode},150,2026-06-01\n{other},150,2026-06-01\n"
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ingest_lab_results(self.read(content, "hasil.csv"), qc=self.qc)
+
+        nama = self.other_qc.user.get_full_name() or self.other_qc.user.username
+        self.assertEqual(
+            [(row.baris, row.status, row.pesan) for row in report.rows],
+            [(2, GAGAL, f"Batch sedang diuji oleh {nama}"), (3, OK, "")],
+        )
+        self.assertFalse(LabTest.objects.filter(batch_id=kode).exists())
+        self.assertMatchesRebuild()
+
+    def test_lab_test_saved_after_validation(self):
+        kode, other = self.untested()[:2]
+        real_claims = claimed_by_others
+
+        def claims_then_race(batch_ids, qc):
+            # QC lain menyimpan hasil uji tepat setelah validasi
+            if not LabTest.objects.filter(batch_id=kode).exists():
+                LabTest.objects.create(batch_id=kode, nilai_cs137=90, tanggal_uji=date(2026, 5, 30), qc=self.other_qc)
+            return real_claims(batch_ids, qc)
+
+        content = f"kode_batch,nilai_cs137,tanggal_uji\n{kode},150,2026-06-01\n{other},150,2026-06-01\n"
+        with mock.patch("labs.ingest.claimed_by_others", claims_then_race), self.captureOnCommitCallbacks(execute=True):
+            report = ingest_lab_results(self.read(content, "hasil.csv"), qc=self.qc)
+
+        self.assertEqual(
+            [(row.baris, row.status, row.pesan) for row in report.rows],
+            [(2, GAGAL, "Batch sudah memiliki hasil uji lab"), (3, OK, "")],
+        )
+        self.assertEqual(LabTest.objects.get(batch_id=kode).nilai_cs137, 90)
+        self.assertTrue(LabTest.objects.filter(batch_id=other).exists())
+        self.assertMatchesRebuild()
+
+    def test_dry_run_writes_nothing(self):
+        kode = self.untested()[0]
+        report = ingest_lab_results(
+            self.read(f"kode_batch,nilai_cs137,tanggal_uji\n{kode},150,2026-06-01\n", "hasil.csv"),
+            qc=self.qc,
+            dry_run=True,
+        )
+        self.assertEqual(report.created, 1)
+        self.assertFalse(LabTest.objects.filter(batch_id=kode).exists())
+
+    def test_unknown_format(self):
+        for content, filename in (("a,b\n", "hasil.txt"), ('{"data": []}', "hasil.json")):
+            with self.subTest(filename), self.assertRaises(ValueError):
+                self.read(content, filename)
+
+    def test_upload_view(self):
+        kode = self.untested()[0]
+        self.client.force_login(self.qc.user)
+        upload = SimpleUploadedFile(
+            "hasil.csv", f"kode_batch,nilai_cs137,tanggal_uji\n{kode},150,2026-06-01\nTIDAK-ADA,1,2026-06-01\n".encode()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("labs:labtest_upload"), {"file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context["report"].created, response.context["report"].failed), (1, 1))
+        self.assertContains(response, "Batch tidak ditemukan")
+        self.assertTrue(LabTest.objects.filter(batch_id=kode).exists())
+
+
+def fake_ingest(records):
+    return [{"kode_batch": record["kode_batch"], "status": OK, "pesan": ""} for record in records]
+
+
+class LabFeedListenerTests(SimpleTestCase):
+    """Antrian dan micro-batch listener; penyimpanan (_ingest) diganti, tanpa database."""
+
+    def listener(self, ingest=fake_ingest, **kwargs):
+        listener = LabFeedListener(qc=None, **kwargs)
+        listener._ingest = ingest
+        self.addCleanup(listener.executor.shutdown)
+        return listener
+
+    def run_listener(self, listener, scenario):
+        async def main():
+            listener.queue = asyncio.Queue(maxsize=listener.queue_size)
+            worker = asyncio.create_task(listener.run_batches())
+            try:
+                # future yang tidak pernah selesai = test gagal, bukan menggantung
+                return await asyncio.wait_for(scenario(), 5)
+            finally:
+                worker.cancel()
+
+        return asyncio.run(main())
+
+    def test_micro_batches(self):
+        sizes = []
+
+        def ingest(records):
+            sizes.append(len(records))
+            return fake_ingest(records)
+
+        listener = self.listener(ingest, batch_size=2, max_wait=0.05)
+
+        async def scenario():
+            futures = [await listener.submit(f"B-{i},150,2026-06-01") for i in range(5)]
+            futures.append(await listener.submit("baris,tidak,lengkap,sekali"))
+            return [await future for future in futures]
+
+        results = self.run_listener(listener, scenario)
+        self.assertEqual([result["kode_batch"] for result in results[:5]], [f"B-{i}" for i in range(5)])
+        self.assertEqual(results[5]["status"], GAGAL)
+        self.assertEqual(sizes, [2, 2, 1])
+        self.assertEqual(
+            (listener.stats.diterima, listener.stats.disimpan, listener.stats.gagal, listener.stats.batch_terbesar),
+            (6, 5, 1, 2),
+        )
+
+    def test_backpressure(self):
+        release = threading.Event()
+
+        def ingest(records):
+            release.wait(5)
+            return fake_ingest(records)
+
+        listener = self.listener(ingest, batch_size=1, max_wait=0, queue_size=2)
+
+        async def scenario():
+            # batch pertama tertahan di thread database, dua berikutnya mengisi antrian
+            futures = [await listener.submit(f"B-{i},150,2026-06-01") for i in range(3)]
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(listener.submit("B-3,150,2026-06-01"), 0.2)
+            release.set()
+            return [await future for future in futures]
+
+        self.assertEqual(len(self.run_listener(listener, scenario)), 3)
+
+    def test_failed_micro_batch(self):
+        calls = []
+
+        def ingest(records):
+            calls.append(len(records))
+            if len(calls) == 1:
+                raise RuntimeError("thread database mati")
+            return fake_ingest(records)
+
+        listener = self.listener(ingest, batch_size=1, max_wait=0)
+
+        async def scenario():
+            first = await (await listener.submit("B-1,150,2026-06-01"))
+            second = await (await listener.submit("B-2,150,2026-06-01"))
+            return first, second
+
+        first, second = self.run_listener(listener, scenario)
+        self.assertEqual((first["status"], first["pesan"]), (GAGAL, "Gagal menyimpan: thread database mati"))
+        self.assertEqual(second["status"], OK)
+
+    def test_ingest_error_fails_batch(self):
+        listener = LabFeedListener(qc=None)
+        self.addCleanup(listener.executor.shutdown)
+        with mock.patch("labs.feed.ingest_lab_results", side_effect=KeyError("kode_batch")), \
+                mock.patch("labs.feed.close_old_connections"):
+            results = listener._ingest([{"kode_batch": "B-1"}, {"kode_batch": "B-2"}])
+        self.assertEqual([(result["kode_batch"], result["status"]) for result in results], [("B-1", GAGAL), ("B-2", GAGAL)])
+
+    def test_http_bad_sizes(self):
+        listener = self.listener()
+        requests = [
+            b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n",
+            b"POST / HTTP/1.1\r\nContent-Length: banyak\r\n\r\n",
+            b"POST / HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+        ]
+
+        async def scenario():
+            server = await asyncio.start_server(listener.handle_connection, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            responses = []
+            async with server:
+                for request in requests:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    writer.write(request)
+                    await writer.drain()
+                    responses.append(await reader.read())
+                    writer.close()
+            return responses
+
+        for response in self.run_listener(listener, scenario):
+            self.assertTrue(response.startswith(b"HTTP/1.1 400 Bad Request"), response)
@@ -10,4 +10,5 @@ urlpatterns = [
     path('<int:pk>/', views.laboratory_detail, name='laboratory_detail'),
     path('<int:pk>/delete/', views.laboratory_delete, name='laboratory_delete'),
     path('tests/add/<str:kode_batch>/', views.labtest_create, name='labtest_create'),
+    path('tests/upload/', views.labtest_upload, name='labtest_upload'),
 ]
\ No newline at end of file
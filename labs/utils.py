@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import date
+
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+
+from batches.models import Activity, HarvestBatch
+from batches.rollup import apply_harvest_rollup_deltas, harvest_test_deltas
+from batches.rules import get_active_rule_set
+from batches.state import apply_batch_side_effects, batch_state
+from batches.trace import invalidate_trace
+from batches.utils import get_batas_aman_cs137, score_batch
+from farms.models import Farm
+from farms.summary import activity_summary_deltas, apply_farm_summary_deltas, lab_test_summary_deltas
+from farms.utils import farm_risk_window_start, score_farm, window_risk_counts
+from profiles.models import UserProfile
+from labs.anomaly import detect_cs137_anomalies
+from labs.rollup import apply_rollup_deltas, lab_test_rollup_deltas
+from labs.workqueue import dequeue_batches, enqueue_batches
+
+
+def hitung_kesimpulan(nilai_cs137, batas) -> str:
+    """Kesimpulan LabTest: BERMASALAH kalau nilai di atas batas, batas None → AMAN."""
+    if batas is not None and nilai_cs137 > batas:
+        return "BERMASALAH"
+    return "AMAN"
+
+
+def siap_ekspor_keterangan(rules) -> str:
+    return f"Batch dinyatakan siap ekspor (risk score < {rules.shipment_risk_cutoff})"
+
+
+@dataclass(frozen=True)
+class LabTestEvent:
+    """
+    Snapshot satu LabTest.save() yang efek sampingnya ditunda.
+    Disalin saat save, supaya instance yang diubah lagi sesudahnya
+    (misal update_or_create berulang untuk batch yang sama) tidak ikut berubah.
+    """
+
+    batch_id: str
+    nilai_cs137: float
+    kesimpulan: str
+    tanggal_uji: date
+    qc_id: object
+    lab_id: int | None
+    batas: float | None  # batas komoditas saat save, untuk keterangan UJI_LAB
+    is_new: bool = True  # False kalau LabTest lama disimpan ulang: bukan sampel anomali baru
+
+    @classmethod
+    def from_lab_test(cls, lab_test, is_new: bool = True):
+        return cls(
+            batch_id=lab_test.batch_id,
+            nilai_cs137=lab_test.nilai_cs137,
+            kesimpulan=lab_test.kesimpulan,
+            tanggal_uji=lab_test.tanggal_uji,
+            qc_id=lab_test.qc_id,
+            lab_id=lab_test.lab_id,
+            batas=lab_test.batas_aman_cs137,
+            is_new=is_new,
+        )
+
+    @classmethod
+    def from_queue_entry(cls, entry):
+        return cls(
+            batch_id=entry.batch_id,
+            nilai_cs137=entry.nilai_cs137,
+            kesimpulan=entry.kesimpulan,
+            tanggal_uji=entry.tanggal_uji,
+            qc_id=entry.qc_id,
+            lab_id=entry.lab_id,
+            batas=entry.batas,
+            is_new=entry.is_new,
+        )
+
+
+_deferred_events: ContextVar[list | None] = ContextVar("deferred_labtest_events", default=None)
+_queue_events: ContextVar[bool] = ContextVar("queue_labtest_events", default=False)
+
+
+def defer_labtest_event(lab_test, is_new: bool = True) -> bool:
+    """
+    Dipanggil LabTest.save(). Return True kalau efek samping jangan
+    dijalankan sekarang:
+    - di dalam defer_labtest_side_effects(): event dicatat di memori
+    - di dalam queue_labtest_side_effects(): event masuk antrian LabTestSideEffect
+    """
+    events = _deferred_events.get()
+    if events is not None:
+        events.append(LabTestEvent.from_lab_test(lab_test, is_new))
+        return True
+
+    if _queue_events.get():
+        LabTestSideEffect = apps.get_model("labs", "LabTestSideEffect")
+        LabTestSideEffect.objects.create(**asdict(LabTestEvent.from_lab_test(lab_test, is_new)))
+        return True
+
+    return False
+
+
+@contextmanager
+def queue_labtest_side_effects():
+    """
+    Efek samping LabTest.save() di dalam blok ini tidak dijalankan,
+    tapi dimasukkan ke antrian LabTestSideEffect (dalam transaksi yang
+    sama dengan LabTest-nya) dan dikerjakan worker process_labtest_queue.
+    Dipakai di form QC supaya request tidak menunggu hitung ulang risk.
+    """
+    token = _queue_events.set(True)
+    try:
+        yield
+    finally:
+        _queue_events.reset(token)
+
+
+def process_labtest_queue(limit: int = 500) -> int:
+    """
+    Kerjakan sampai `limit` entri antrian tertua sekaligus lewat
+    apply_labtest_events: hitung ulang batch / farm yang sama cukup sekali
+    per putaran. Entri yang sedang dikerjakan worker lain dilewati
+    (skip_locked). Return jumlah entri yang dikerjakan.
+    """
+    LabTestSideEffect = apps.get_model("labs", "LabTestSideEffect")
+
+    with transaction.atomic():
+        entries = list(
+            LabTestSideEffect.objects.select_for_update(skip_locked=True).order_by("pk")[:limit]
+        )
+        if not entries:
+            return 0
+        apply_labtest_events([LabTestEvent.from_queue_entry(entry) for entry in entries])
+        LabTestSideEffect.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+    return len(entries)
+
+
+@contextmanager
+def defer_labtest_side_effects():
+    """
+    Tunda efek samping LabTest.save() (risk batch, risk farm, activity
+    UJI_LAB / SIAP_EKSPOR) sampai blok selesai, lalu kerjakan sekali
+    untuk semua batch/farm yang tersentuh.
+
+        with transaction.atomic(), defer_labtest_side_effects():
+            for row in rows:
+                LabTest.objects.update_or_create(...)
+
+    Kalau blok melempar error, efek samping tidak dijalankan
+    (dan transaksi pemanggil ikut rollback). Blok bersarang ikut
+    ke blok terluar.
+    """
+    if _deferred_events.get() is not None:
+        yield
+        return
+
+    events = []
+    token = _deferred_events.set(events)
+    try:
+        yield
+    finally:
+        _deferred_events.reset(token)
+    apply_labtest_events(events)
+
+
+def apply_labtest_events(events):
+    """
+    Jalankan efek samping sekumpulan LabTest.save() secara set-based,
+    dengan hasil yang sama seperti kalau setiap save menjalankannya sendiri.
+
+    Urutan per-baris tetap diikuti di memori: risk batch memakai risk farm
+    sebelum save itu, lalu risk farm dihitung ulang dari jumlah batch
+    MASALAH di window. Yang berubah hanya jumlah query: state awal diambil
+    dengan beberapa query agregat, hasil akhir ditulis dengan bulk_update /
+    bulk_create sekali per tabel.
+
+    Farm yang tersentuh dikunci (select_for_update) sebelum state dibaca,
+    supaya beberapa worker antrian tidak menghitung farm yang sama bersamaan.
+    """
+    if not events:
+        return
+
+    with transaction.atomic():
+        _apply_labtest_events(events)
+
+
+def _apply_labtest_events(events):
+    Laboratory = apps.get_model("labs", "Laboratory")
+
+    batch_ids = {event.batch_id for event in events}
+    farm_ids = set(
+        HarvestBatch.objects.filter(pk__in=batch_ids).values_list("farm_id", flat=True)
+    )
+    farm_risk = dict(
+        Farm.objects.select_for_update()
+        .filter(pk__in=farm_ids)
+        .order_by("pk")
+        .values_list("pk", "risk_score")
+    )
+    batches = HarvestBatch.objects.select_related("commodity").in_bulk(batch_ids)
+
+    window_start = farm_risk_window_start()
+    window = {
+        farm_id: list(counts) for farm_id, counts in window_risk_counts(farm_ids).items()
+    }
+
+    sudah_siap = set(
+        Activity.objects.filter(batch_id__in=batch_ids, jenis="SIAP_EKSPOR")
+        .values_list("batch_id", flat=True)
+    )
+    qc_profiles = UserProfile.objects.select_related("user").in_bulk(
+        {event.qc_id for event in events}
+    )
+    labs = Laboratory.objects.in_bulk({event.lab_id for event in events if event.lab_id})
+
+    original = {pk: (b.quality_status, b.risk_score) for pk, b in batches.items()}
+    original_farm_risk = dict(farm_risk)
+    activities = []
+    rules = get_active_rule_set()
+
+    for event in events:
+        batch = batches[event.batch_id]
+        farm_id = batch.farm_id
+
+        # recalculate_batch_risk: pakai risk farm yang berlaku saat itu
+        old_status = batch.quality_status
+        batch.quality_status, batch.risk_score = score_batch(
+            event.kesimpulan,
+            event.nilai_cs137,
+            get_batas_aman_cs137(batch),
+            farm_risk[farm_id],
+            rules=rules,
+        )
+
+        # recalculate_farm_risk: geser hitungan MASALAH sesuai status baru
+        if batch.tanggal_panen >= window_start:
+            counts = window.setdefault(farm_id, [0, 0])
+            counts[1] += (batch.quality_status == "MASALAH") - (old_status == "MASALAH")
+        total, masalah = window.get(farm_id, (0, 0))
+        farm_risk[farm_id] = score_farm(total, masalah, rules=rules)
+
+        lokasi_lab = labs[event.lab_id].nama if event.lab_id else "Laboratorium"
+        qc_user = qc_profiles[event.qc_id].user
+        pelaku_qc = qc_user.get_full_name() or qc_user.username
+
+        activities.append(Activity(
+            batch=batch,
+            tanggal=event.tanggal_uji,
+            jenis="UJI_LAB",
+            lokasi=lokasi_lab,
+            pelaku=pelaku_qc,
+            keterangan=f"Uji Cs-137: {event.nilai_cs137} Bq/kg"
+            + (f" (batas {event.batas} Bq/kg)" if event.batas is not None else ""),
+        ))
+
+        if rules.is_layak_kirim(batch.risk_score) and batch.pk not in sudah_siap:
+            sudah_siap.add(batch.pk)
+            activities.append(Activity(
+                batch=batch,
+                tanggal=event.tanggal_uji,
+                jenis="SIAP_EKSPOR",
+                lokasi=lokasi_lab,
+                pelaku=pelaku_qc,
+                keterangan=siap_ekspor_keterangan(rules),
+            ))
+
+    changed = [b for pk, b in batches.items() if (b.quality_status, b.risk_score) != original[pk]]
+    now = timezone.now()
+    for batch in changed:
+        batch.shipment_status = batch.compute_shipment_status(rules)
+        batch.updated_at = now  # bulk_update tidak mengisi auto_now
+    HarvestBatch.objects.bulk_update(
+        changed, ["quality_status", "risk_score", "shipment_status", "updated_at"]
+    )
+    Farm.objects.bulk_update(
+        [
+            Farm(pk=farm_id, risk_score=score)
+            for farm_id, score in farm_risk.items()
+            if score != original_farm_risk[farm_id]
+        ],
+        ["risk_score"],
+    )
+    Activity.objects.bulk_create(activities)
+    apply_farm_summary_deltas(activity_summary_deltas(
+        activities, farms={pk: batch.farm_id for pk, batch in batches.items()}
+    ))
+    # batch yang tidak berubah tetap masuk: activity baru → trace diinvalidasi
+    apply_batch_side_effects([(pk, b._batch_state, batch_state(b)) for pk, b in batches.items()])
+    detect_cs137_anomalies([event for event in events if event.is_new], batches)
+
+
+def apply_lab_test_side_effects(changes):
+    """
+    Terapkan tulis sekumpulan LabTest ke tabel turunannya: FarmSummary
+    (sudah diuji), HarvestRollup (diuji), Cs137Rollup, antrian QC dan cache
+    trace. Dipakai signal LabTest (labs/signals.py) dan jalur bulk_create
+    (labs.ingest). Risk batch / farm dan activity UJI_LAB ada di
+    apply_labtest_events.
+
+    changes: list (old, new) dengan state dari labs.rollup.rollup_state;
+    old None = LabTest baru, new None = LabTest dihapus.
+    """
+    added, removed = [], []
+    for old, new in changes:
+        if old is not None and (new is None or old[0] != new[0]):
+            removed.append(old[0])
+        if new is not None and (old is None or old[0] != new[0]):
+            added.append(new[0])
+
+    for batch_ids, sign in ((added, 1), (removed, -1)):
+        if batch_ids:
+            apply_farm_summary_deltas(lab_test_summary_deltas(batch_ids, sign))
+            apply_harvest_rollup_deltas(harvest_test_deltas(batch_ids, sign))
+    apply_rollup_deltas(lab_test_rollup_deltas(
+        [(state, sign) for old, new in changes if old != new for state, sign in ((old, -1), (new, 1))]
+    ))
+
+    dequeue_batches(added)
+    if removed:
+        # setelah commit: batch yang ikut terhapus (cascade) masih ada saat
+        # signal dikirim, tapi sudah hilang saat commit dan diabaikan enqueue_batches
+        transaction.on_commit(lambda: enqueue_batches(removed))
+    invalidate_trace({state[0] for change in changes for state in change if state is not None})
@@ -1,16 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import ObjectDoesNotExist
 from .models import Laboratory, LabTest
-from .forms import LaboratoryForm, LabTestForm
+from .forms import LaboratoryForm, LabTestForm, LabResultUploadForm
+from .ingest import ingest_lab_results, read_lab_results
+from .utils import queue_labtest_side_effects
+from .workqueue import claimed_by_other
 from batches.models import HarvestBatch
 
 def is_admin(user):
-    return user.is_authenticated and hasattr(user, 'userprofile') and user.userprofile.role == 'admin'
+    return user.is_authenticated and user.role == 'admin'
 
 def is_lab_assistant(user):
-    return user.is_authenticated and hasattr(user, 'userprofile') and user.userprofile.role == 'labAssistant'
+    return user.is_authenticated and user.role == 'labAssistant' and hasattr(user, 'profile')
 
 @login_required
 @user_passes_test(is_admin)
@@ -55,30 +59,69 @@ def labtest_create(request, kode_batch):
 
     if hasattr(batch, 'lab_test'):
         messages.warning(request, f"Batch {kode_batch} sudah memiliki hasil uji lab.")
-        return redirect('batches:detail', kode_batch=kode_batch)
+        return redirect('batches:batch_detail', pk=kode_batch)
+
+    # batch yang sedang dipegang QC lain (labs.workqueue) jangan diuji dua kali
+    pemegang = claimed_by_other(kode_batch, request.user.profile)
+    if pemegang is not None:
+        nama = pemegang.user.get_full_name() or pemegang.user.username
+        messages.warning(request, f"Batch {kode_batch} sedang diuji oleh {nama}.")
+        return redirect('main:dashboard_qc')
 
     if request.method == 'POST':
-        form = LabTestForm(request.POST, initial={'qc': request.user.userprofile})
+        form = LabTestForm(request.POST, initial={'qc': request.user.profile})
         
         if 'qc' in form.fields:
-             form.instance.qc = request.user.userprofile
+             form.instance.qc = request.user.profile
         
         if form.is_valid():
             lab_test = form.save(commit=False)
             lab_test.batch = batch
             
             if not lab_test.qc_id:
-                lab_test.qc = request.user.userprofile
+                lab_test.qc = request.user.profile
                 
-            lab_test.save()
-            messages.success(request, f"Hasil uji lab untuk batch {kode_batch} berhasil ditambahkan. Risk score batch diperbarui.")
-            return redirect('batches:detail', kode_batch=kode_batch)
+            # risk batch / farm + activity dikerjakan worker process_labtest_queue
+            with transaction.atomic(), queue_labtest_side_effects():
+                lab_test.save()
+            messages.success(request, f"Hasil uji lab untuk batch {kode_batch} berhasil ditambahkan. Risk score batch akan diperbarui sebentar lagi.")
+            return redirect('batches:batch_detail', pk=kode_batch)
     else:
-        form = LabTestForm(initial={'qc': request.user.userprofile})
+        form = LabTestForm(initial={'qc': request.user.profile})
 
     context = {
         'form': form,
         'batch': batch,
         'title': f'Tambah Hasil Uji Lab untuk Batch {kode_batch}'
     }
-    return render(request, 'labs/labtest_form.html', context)
\ No newline at end of file
+    return render(request, 'labs/labtest_form.html', context)
+@login_required
+@user_passes_test(is_lab_assistant)
+def labtest_upload(request):
+    profile = request.user.profile
+    report = None
+
+    if request.method == 'POST':
+        form = LabResultUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            lab = form.cleaned_data['lab'] or profile.laboratory
+            try:
+                records = read_lab_results(upload, upload.name)
+            except ValueError as e:
+                form.add_error('file', str(e))
+            else:
+                report = ingest_lab_results(records, qc=profile, lab=lab, dry_run=form.cleaned_data['dry_run'])
+                if report.dry_run:
+                    messages.info(request, f"{report.created} baris valid, {report.failed} baris gagal. Belum ada yang disimpan.")
+                else:
+                    messages.success(request, f"{report.created} hasil uji lab disimpan, {report.failed} baris gagal.")
+    else:
+        form = LabResultUploadForm(initial={'lab': profile.laboratory})
+
+    context = {
+        'form': form,
+        'report': report,
+        'title': 'Upload Hasil Uji Lab',
+    }
+    return render(request, 'labtest_upload.html', context)
@@ -0,0 +1,191 @@
+"""
+Antrian kerja QC untuk batch yang belum diuji (PendingLabTest).
+
+    batches = claim_batches(profile, 10)      # 10 batch tertua untuk lab QC
+    my_claims(profile)                        # batch yang sedang dipegang
+    release_claims(profile, ["IDM-..."])      # kembalikan ke antrian
+
+Claim atomik: kandidat dibaca dengan select_for_update(skip_locked=True)
+(PostgreSQL / MySQL: QC lain langsung melompati baris yang sedang di-claim)
+lalu di-UPDATE hanya kalau masih bebas, jadi dua QC yang claim bersamaan
+tidak pernah mendapat batch yang sama. Lease yang habis (hasil tidak
+pernah diinput) otomatis bisa di-claim QC lain.
+
+Antrian diisi saat batch dibuat dan dikosongkan saat LabTest disimpan
+(labs/signals.py, plus jalur bulk_create di import_data / labs.ingest).
+Batch dibagi ke laboratorium oleh labs.scheduler; batch yang belum
+dijadwalkan jatuh ke lab di kota farm-nya.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+LAB_CLAIM_LEASE_MINUTES = getattr(settings, "LAB_CLAIM_LEASE_MINUTES", 120)
+# batas satu kali claim, supaya satu QC tidak mengunci seluruh antrian
+LAB_CLAIM_MAX = getattr(settings, "LAB_CLAIM_MAX", 50)
+
+
+def enqueue_batches(batch_ids):
+    """Masukkan batch (yang belum punya LabTest) ke antrian; yang sudah ada diabaikan."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    rows = HarvestBatch.objects.filter(pk__in=batch_ids, lab_test__isnull=True).values_list(
+        "pk", "farm__city_id", "tanggal_panen"
+    )
+    PendingLabTest.objects.bulk_create(
+        [
+            PendingLabTest(batch_id=pk, city_id=city_id, tanggal_panen=tanggal_panen)
+            for pk, city_id, tanggal_panen in rows
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def refresh_pending_lab_tests(batch_ids):
+    """Salin ulang kota / tanggal panen batch yang diubah ke baris antriannya."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    batch = HarvestBatch.objects.filter(pk=OuterRef("batch_id"))
+    PendingLabTest.objects.filter(batch_id__in=batch_ids).update(
+        city_id=Subquery(batch.values("farm__city_id")[:1]),
+        tanggal_panen=Subquery(batch.values("tanggal_panen")[:1]),
+    )
+
+
+def dequeue_batches(batch_ids):
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+    PendingLabTest.objects.filter(batch_id__in=batch_ids).delete()
+
+
+def rebuild_pending_lab_tests() -> int:
+    """Isi ulang antrian dari seluruh batch tanpa LabTest. Return jumlah batch di antrian."""
+    HarvestBatch = apps.get_model("batches", "HarvestBatch")
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    with transaction.atomic():
+        # claim yang masih berjalan dan jadwal lab dipertahankan
+        kept = {
+            batch_id: rest
+            for batch_id, *rest in PendingLabTest.objects.filter(
+                Q(claimed_by__isnull=False) | Q(assigned_lab__isnull=False)
+            ).values_list("batch_id", "claimed_by_id", "lease_until", "assigned_lab_id", "rencana_uji")
+        }
+        PendingLabTest.objects.all().delete()
+        rows = HarvestBatch.objects.filter(lab_test__isnull=True).order_by().values_list(
+            "pk", "farm__city_id", "tanggal_panen"
+        )
+        pending = []
+        for pk, city_id, tanggal_panen in rows.iterator(chunk_size=5000):
+            claimed_by_id, lease_until, assigned_lab_id, rencana_uji = kept.get(pk, (None,) * 4)
+            pending.append(
+                PendingLabTest(
+                    batch_id=pk,
+                    city_id=city_id,
+                    tanggal_panen=tanggal_panen,
+                    claimed_by_id=claimed_by_id,
+                    lease_until=lease_until,
+                    assigned_lab_id=assigned_lab_id,
+                    rencana_uji=rencana_uji,
+                )
+            )
+        PendingLabTest.objects.bulk_create(pending, batch_size=1000)
+    return len(pending)
+
+
+def pending_for(qc):
+    """
+    Antrian untuk QC: batch yang dijadwalkan ke laboratoriumnya, plus batch
+    belum terjadwal di kota lab itu (semua batch kalau QC belum punya lab).
+    """
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    queue = PendingLabTest.objects.all()
+    lab = qc.laboratory
+    if lab is not None:
+        queue = queue.filter(
+            Q(assigned_lab_id=lab.pk) | Q(assigned_lab__isnull=True, city_id=lab.city_id)
+        )
+    return queue
+
+
+def _unclaimed(now) -> Q:
+    return Q(lease_until__isnull=True) | Q(lease_until__lt=now)
+
+
+def available_for(qc):
+    """Bagian antrian QC yang belum dipegang siapa pun (atau lease-nya habis)."""
+    return pending_for(qc).filter(_unclaimed(timezone.now()))
+
+
+def claim_batches(qc, count: int = 10, lease_minutes: int = LAB_CLAIM_LEASE_MINUTES) -> list:
+    """
+    Ambil sampai `count` batch tertua (tanggal panen) dari antrian QC dan
+    pegang selama lease_minutes. Return list kode batch yang didapat.
+    """
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    count = max(0, min(count, LAB_CLAIM_MAX))
+    now = timezone.now()
+    lease_until = now + timedelta(minutes=lease_minutes)
+
+    with transaction.atomic():
+        candidates = list(
+            pending_for(qc)
+            .filter(_unclaimed(now))
+            .select_for_update(skip_locked=True)
+            .order_by("tanggal_panen", "batch")
+            .values_list("batch_id", flat=True)[:count]
+        )
+        if not candidates:
+            return []
+        # tetap dicek ulang di UPDATE: database tanpa row lock (SQLite)
+        # tidak pernah memberi batch yang sama ke dua QC
+        PendingLabTest.objects.filter(_unclaimed(now), batch_id__in=candidates).update(
+            claimed_by=qc, lease_until=lease_until
+        )
+        return list(
+            PendingLabTest.objects.filter(
+                batch_id__in=candidates, claimed_by=qc, lease_until=lease_until
+            ).values_list("batch_id", flat=True)
+        )
+
+
+def my_claims(qc):
+    """Batch yang sedang dipegang QC (lease masih berlaku), tertua dulu."""
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+    return PendingLabTest.objects.filter(claimed_by=qc, lease_until__gte=timezone.now())
+
+
+def release_claims(qc, batch_ids=None) -> int:
+    """Kembalikan claim QC (semua, atau hanya batch_ids) ke antrian."""
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    claims = PendingLabTest.objects.filter(claimed_by=qc)
+    if batch_ids is not None:
+        claims = claims.filter(batch_id__in=batch_ids)
+    return claims.update(claimed_by=None, lease_until=None)
+
+
+def claimed_by_other(batch_id, qc):
+    """UserProfile QC lain yang sedang memegang batch ini, atau None."""
+    return claimed_by_others([batch_id], qc).get(batch_id)
+
+
+def claimed_by_others(batch_ids, qc) -> dict:
+    """{batch_id: UserProfile QC lain yang sedang memegangnya} dengan satu query."""
+    PendingLabTest = apps.get_model("labs", "PendingLabTest")
+
+    pending = (
+        PendingLabTest.objects.select_related("claimed_by__user")
+        .filter(batch_id__in=batch_ids, lease_until__gte=timezone.now())
+        .exclude(claimed_by=qc)
+        .exclude(claimed_by__isnull=True)
+    )
+    return {row.batch_id: row.claimed_by for row in pending}
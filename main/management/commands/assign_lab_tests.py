@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from labs.scheduler import LAB_SCHEDULE_DAYS, assign_lab_tests
+
+
+class Command(BaseCommand):
+    help = (
+        "Bagi batch yang belum diuji ke laboratorium menurut throughput lab, jarak "
+        "kota farm ke lab dan umur panen (min-cost flow). Jalankan berkala (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=LAB_SCHEDULE_DAYS,
+            help=f"Jumlah hari yang dijadwalkan (default: {LAB_SCHEDULE_DAYS})",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Hitung dan tampilkan jadwal saja, tanpa menyimpan",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        plan = assign_lab_tests(days=options["days"], dry_run=options["dry_run"])
+        elapsed = time.monotonic() - started
+
+        for entry in plan:
+            selesai = entry.selesai.isoformat() if entry.selesai else "-"
+            self.stdout.write(
+                f"{entry.nama}: {entry.jumlah} batch, {entry.kapasitas}/hari, selesai {selesai}"
+            )
+        verb = "akan dijadwalkan" if options["dry_run"] else "dijadwalkan"
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(entry.jumlah for entry in plan)} batch {verb} ke {len(plan)} lab ({elapsed:.1f} detik)."
+        ))
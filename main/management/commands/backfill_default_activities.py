@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from batches.models import HarvestBatch
+from batches.trace import invalidate_trace
+from batches.utils import create_default_activities
+
+
+class Command(BaseCommand):
+    help = (
+        "Isi timeline default (PENEBARAN / PANEN / DARI_TAMBAK) untuk batch yang "
+        "belum punya activity sama sekali, mis. data lama dari sebelum batch baru "
+        "mendapatkannya otomatis. Halaman detail batch tidak menulis apa pun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Batch per transaksi")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        while True:
+            with transaction.atomic():
+                batches = list(
+                    HarvestBatch.objects.filter(activities__isnull=True)
+                    .order_by("pk")[:options["chunk_size"]]
+                )
+                if not batches:
+                    break
+                create_default_activities(batches)
+                invalidate_trace([batch.pk for batch in batches])
+            total += len(batches)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} batch mendapat timeline default ({elapsed:.1f} detik)."
+        ))
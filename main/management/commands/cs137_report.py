@@ -0,0 +1,75 @@
+import csv
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from labs.rollup import ROLLUP_GROUPS, cs137_summary
+
+SUMMARY_FIELDS = ["count", "mean", "std", "min", "max", "p50", "p95"]
+
+
+def parse_month(value, label):
+    """'2025-03' → date(2025, 3, 1)."""
+    try:
+        return date.fromisoformat(f"{value}-01")
+    except ValueError:
+        raise CommandError(f"{label} harus berformat YYYY-MM, bukan '{value}'")
+
+
+class Command(BaseCommand):
+    help = (
+        "Ringkasan nilai Cs-137 (jumlah, rata-rata, std, min, max, p50, p95) per "
+        "provinsi / kota / farm / komoditas / bulan, dibaca dari rollup Cs137Rollup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--by",
+            default="province,month",
+            help=f"Dimensi, dipisah koma, dari {', '.join(ROLLUP_GROUPS)} (default: province,month)",
+        )
+        parser.add_argument("--from", dest="start", metavar="YYYY-MM", help="Bulan uji pertama")
+        parser.add_argument("--to", dest="end", metavar="YYYY-MM", help="Bulan uji terakhir")
+        parser.add_argument("--province", help="Hanya farm di provinsi ini")
+        parser.add_argument("--commodity", help="Hanya kode komoditas ini")
+        parser.add_argument(
+            "--format",
+            choices=["table", "csv", "json"],
+            default="table",
+            help="Format keluaran (default: table)",
+        )
+
+    def handle(self, *args, **options):
+        by = [name.strip() for name in options["by"].split(",") if name.strip()]
+        filters = {}
+        if options["start"]:
+            filters["month__gte"] = parse_month(options["start"], "--from")
+        if options["end"]:
+            filters["month__lte"] = parse_month(options["end"], "--to")
+        if options["province"]:
+            filters["farm__city__province"] = options["province"]
+        if options["commodity"]:
+            filters["commodity__code"] = options["commodity"]
+
+        try:
+            rows = cs137_summary(by=by, **filters)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options["format"] == "json":
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+            return
+        if options["format"] == "csv":
+            writer = csv.DictWriter(self.stdout, fieldnames=by + SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+            return
+
+        self.stdout.write("".join(f"{name:<24}" for name in by) + "".join(f"{name:>10}" for name in SUMMARY_FIELDS))
+        for row in rows:
+            self.stdout.write(
+                "".join(f"{str(row[name]):<24}" for name in by)
+                + "".join(f"{str(row[name]):>10}" for name in SUMMARY_FIELDS)
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} kelompok."))
@@ -1,15 +1,34 @@
 import csv
+import hashlib
+import multiprocessing
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import connection, connections, reset_queries, transaction
+from django.db.models import Max
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 
 from profiles.models import UserProfile
+from profiles.utils import bulk_provision_users, password_hasher_pool
 from farms.models import City, Farm
+from farms.summary import activity_summary_deltas, apply_farm_summary_deltas
 from batches.models import HarvestBatch, Activity, Commodity
+from batches.rollup import farm_regions, move_harvest_rollups
+from batches.rules import get_active_rule_set
+from batches.state import apply_batch_side_effects, batch_state
+from batches.trace import invalidate_trace
+from batches.utils import create_default_activities, reserve_batch_codes
+from labs.anomaly import apply_new_cs137_anomalies, suspend_cs137_anomalies
 from labs.models import Laboratory, LabTest
+from labs.utils import defer_labtest_side_effects
+from main.models import ImportCheckpoint, ImportRowFingerprint
 
 User = get_user_model()
 
@@ -25,6 +44,163 @@ def parse_bool(value):
     value = (value or "").strip().lower()
     return value in ("1", "true", "t", "yes", "y")
 
+def chunked(iterable, size):
+    """Potong iterable jadi list-list berukuran maksimal `size`."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def lookup(mapping, key, label):
+    """Ambil referensi dari dict cache, error yang jelas kalau tidak ada."""
+    try:
+        return mapping[key]
+    except KeyError:
+        raise CommandError(f"{label} '{key}' tidak ditemukan")
+
+# Urutan loader penting: tabel referensi harus sudah terisi
+# sebelum tabel yang menunjuk ke sana.
+LOADERS = [
+    "load_cities",
+    "load_laboratories",
+    "load_users",
+    "load_user_profiles",
+    "load_commodities",
+    "load_farms",
+    "load_batches",
+    "load_activities",
+    "load_lab_tests",
+]
+
+# detik minimal antar laporan progress
+PROGRESS_INTERVAL = 5
+
+# Kolom natural key per file untuk mode --incremental.
+# None = seluruh isi baris adalah kuncinya (baris berubah = baris baru).
+ROW_KEYS = {
+    "cities.csv": ["code"],
+    "laboratories.csv": ["nama"],
+    "users.csv": ["username"],
+    "user_profiles.csv": ["username"],
+    "commodities.csv": ["code"],
+    "farms.csv": ["name"],
+    # batch belum punya kode di CSV, jadi baris dengan kunci yang sama
+    # dibedakan lewat urutan kemunculannya di file
+    "batches.csv": ["farm_name", "commodity", "tanggal_tebar", "tanggal_panen", "tujuan"],
+    "activities.csv": None,
+    "lab_tests.csv": ["batch_kode"],
+}
+
+# kunci internal di dict baris: pk objek yang dihasilkan baris itu
+# (diisi dari fingerprint sebelum apply, di-update loader setelah save)
+OBJECT_PK = "_object_pk"
+
+def digest(values):
+    return hashlib.sha256("\x1f".join(values).encode("utf-8")).hexdigest()
+
+def file_digest(path: Path):
+    sha = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class RowFingerprinter:
+    """Hitung (row_key, row_hash) untuk setiap baris dari satu file CSV."""
+
+    def __init__(self, source):
+        self.columns = ROW_KEYS.get(source)
+        self.occurrences = Counter() if source == "batches.csv" else None
+
+    def __call__(self, row):
+        row_hash = digest(f"{k}={(v or '').strip()}" for k, v in sorted(row.items()))
+        if self.columns is None:
+            return row_hash, row_hash
+
+        key_values = [(row.get(column) or "").strip() for column in self.columns]
+        if self.occurrences is not None:
+            base = hashlib.sha256("\x1f".join(key_values).encode("utf-8")).digest()[:8]
+            self.occurrences[base] += 1
+            key_values.append(str(self.occurrences[base]))
+        return digest(key_values), row_hash
+
+# State untuk proses worker --workers. Di-set sebelum fork, jadi setiap
+# worker mewarisi `apply` (beserta cache referensinya) milik file yang
+# sedang diproses tanpa perlu di-pickle.
+_shard_command = None
+_shard_apply = None
+
+class PartialChunkError(Exception):
+    """Satu shard chunk --workers gagal setelah shard lain di chunk yang sama commit."""
+
+    def __init__(self, error, committed):
+        super().__init__(str(error))
+        self.committed = committed
+
+
+def _run_shard(source, rows, prints):
+    # dijalankan di proses worker: satu shard = satu transaksi
+    with transaction.atomic(), suspend_cs137_anomalies():
+        return _shard_command.apply_rows(source, rows, prints, _shard_apply)
+
+class ShardPool:
+    """
+    Pool proses untuk --workers, dengan afinitas shard → proses.
+
+    Baris dibagi per farm dan shard ke-i selalu dikerjakan proses ke-i,
+    jadi semua baris satu farm diproses berurutan oleh proses yang sama
+    (urutan kode_batch dan state risk farm di memori tetap konsisten).
+    """
+
+    def __init__(self, command, apply, size):
+        global _shard_command, _shard_apply
+        _shard_command, _shard_apply = command, apply
+        self.size = size
+
+        # koneksi DB tidak boleh diwariskan ke child lewat fork
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        self.executors = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(size)
+        ]
+        # paksa fork sekarang, selagi belum ada koneksi yang terbuka lagi
+        for executor in self.executors:
+            executor.submit(int).result()
+
+    def run(self, source, rows, prints, keys):
+        """
+        Jalankan satu chunk; return setelah semua shard ter-commit. Setiap
+        shard commit di prosesnya sendiri, jadi kalau satu shard gagal shard
+        lain tetap tersimpan: PartialChunkError menyebut jumlah barisnya.
+        """
+        shards = [([], [] if prints is not None else None) for _ in range(self.size)]
+        for i, (row, key) in enumerate(zip(rows, keys)):
+            shard_rows, shard_prints = shards[zlib.crc32(str(key).encode("utf-8")) % self.size]
+            shard_rows.append(row)
+            if prints is not None:
+                shard_prints.append(prints[i])
+
+        futures = [
+            (executor.submit(_run_shard, source, shard_rows, shard_prints), len(shard_rows))
+            for executor, (shard_rows, shard_prints) in zip(self.executors, shards)
+            if shard_rows
+        ]
+        # tunggu semua shard selesai dulu, baru lempar error pertama (kalau ada)
+        results = [(future.exception() or future.result(), size) for future, size in futures]
+        errors = [result for result, _ in results if isinstance(result, BaseException)]
+        if errors:
+            committed = sum(size for result, size in results if not isinstance(result, BaseException))
+            if committed:
+                raise PartialChunkError(errors[0], committed) from errors[0]
+            raise errors[0]
+        return sum(result for result, _ in results)
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown()
+
 class Command(BaseCommand):
     help = "Import initial CSV data for aquaculture traceability app"
 
@@ -35,32 +211,308 @@ class Command(BaseCommand):
             default="data",
             help="Folder berisi file CSV (default: ./data)",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help=(
+                "Mode bulk: tabel referensi di-preload ke dict sekali, "
+                "lalu City/Laboratory/Farm/HarvestBatch/Activity ditulis "
+                "pakai bulk_create/bulk_update per chunk"
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help=(
+                "Jumlah baris CSV per chunk; setiap chunk di-commit dalam "
+                "transaksinya sendiri (default: 1000)"
+            ),
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Hanya proses baris yang baru/berubah (berdasarkan fingerprint per baris) "
+                "dan lanjutkan dari chunk terakhir yang sudah di-commit kalau import "
+                "sebelumnya terputus. Pakai mode ini sejak import pertama ke database "
+                "kosong, karena baris batch tanpa fingerprint dianggap batch baru."
+            ),
+        )
+        parser.add_argument(
+            "--hash-workers",
+            type=int,
+            default=1,
+            help=(
+                "Mode bulk: jumlah proses untuk hashing password user baru. "
+                "Kolom password yang sudah berupa hash Django dipakai apa adanya (default: 1)"
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Jumlah proses paralel untuk batches/activities/lab_tests. Baris "
+                "dibagi per farm dan setiap chunk selesai di semua worker sebelum "
+                "chunk berikutnya, jadi hasilnya sama dengan run serial (default: 1)"
+            ),
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         base_dir = Path(options["data_dir"])
+        self.bulk = options["bulk"]
+        self.chunk_size = options["chunk_size"]
+        self.incremental = options["incremental"]
+        self.workers = options["workers"]
+        self.hash_workers = options["hash_workers"]
+        if self.workers < 1:
+            raise CommandError("--workers minimal 1")
+        if self.chunk_size < 1:
+            raise CommandError("--chunk-size minimal 1")
+
         self.stdout.write(self.style.NOTICE(f"Memakai folder data: {base_dir.resolve()}"))
+        if self.bulk:
+            self.stdout.write(self.style.NOTICE(f"Mode bulk aktif (chunk {self.chunk_size} baris)"))
+        if self.incremental:
+            self.stdout.write(self.style.NOTICE("Mode incremental aktif"))
+        reason = self.workers > 1 and self._workers_unsupported()
+        if reason:
+            self.stderr.write(self.style.WARNING(f"{reason}, --workers {self.workers} diabaikan."))
+            self.workers = 1
+        if self.workers > 1:
+            self.stdout.write(self.style.NOTICE(f"Memakai {self.workers} worker paralel"))
 
-        self.load_cities(base_dir)
-        self.load_laboratories(base_dir)
-        self.load_users(base_dir)
-        self.load_user_profiles(base_dir)
-        self.load_commodities(base_dir)
-        self.load_farms(base_dir)
-        self.load_batches(base_dir)
-        self.load_activities(base_dir)
-        self.load_lab_tests(base_dir)
+        self.lab_tests_imported = 0
+        # statistik EWMA Cs-137 bergantung urutan hasil masuk, yang berbeda
+        # antara mode serial / --bulk / --workers → tunda, lalu putar hanya
+        # LabTest baru (pk di atas penanda ini) urut tanggal uji supaya hasil
+        # semua mode sama
+        last_lab_test = LabTest.objects.aggregate(last=Max("pk"))["last"] or 0
+        with suspend_cs137_anomalies():
+            for name in LOADERS:
+                loader = getattr(self, f"bulk_{name}", None) if self.bulk else None
+                (loader or getattr(self, name))(base_dir)
+        if self.lab_tests_imported:
+            total = apply_new_cs137_anomalies(LabTest.objects.filter(pk__gt=last_lab_test))
+            self.stdout.write(f"  → {total} hasil uji baru masuk statistik anomali Cs-137")
 
         self.stdout.write(self.style.SUCCESS("Import selesai tanpa error."))
 
+    def _workers_unsupported(self):
+        """Alasan database ini tidak bisa ditulis beberapa proses, atau None."""
+        if connection.vendor != "sqlite":
+            return None
+        if connection.is_in_memory_db():
+            # setiap proses worker akan membuka database kosong sendiri
+            return "Database SQLite in-memory tidak bisa dibagi antar proses"
+        if connection.settings_dict["OPTIONS"].get("transaction_mode") != "IMMEDIATE":
+            # transaksi DEFERRED di SQLite langsung gagal "database is locked"
+            # kalau dua proses menulis bersamaan
+            return "SQLite tanpa OPTIONS transaction_mode=IMMEDIATE tidak aman untuk banyak penulis"
+        return None
+
+    # === STREAMING ===
+
+    def _read_chunks(self, path: Path):
+        with path.open(newline="", encoding="utf-8") as f:
+            yield from chunked(csv.DictReader(f), self.chunk_size)
+
+    def import_chunks(self, path: Path, label: str, apply, partition=None):
+        """
+        Baca CSV secara streaming per chunk dan commit setiap chunk
+        dalam transaksi sendiri.
+
+        - memori hanya menampung satu chunk, berapapun ukuran file
+        - kalau satu chunk gagal, chunk sebelumnya tetap tersimpan
+          dan error menyebut rentang baris yang gagal
+        - progress (baris/detik) ditulis paling sering tiap
+          PROGRESS_INTERVAL detik, plus ringkasan di akhir file
+        - mode --incremental: baris yang sudah ter-commit di run sebelumnya
+          dilewati lewat checkpoint, baris yang fingerprint-nya sama dilewati,
+          dan checkpoint maju di transaksi yang sama dengan chunk-nya
+        - --workers > 1 dan loader memberi `partition` (kunci farm per baris):
+          chunk dibagi ke beberapa proses, masing-masing commit shard-nya
+          sendiri, dan checkpoint baru maju setelah semua shard selesai
+        """
+        checkpoint = None
+        if self.incremental:
+            checkpoint = self._open_checkpoint(path)
+            if checkpoint is None:
+                return 0
+            fingerprint = RowFingerprinter(path.name)
+            resume_from = checkpoint.rows_committed
+            if resume_from:
+                self.stdout.write(f"  → lanjut dari baris {resume_from + 2} (checkpoint)")
+
+        pool = None
+        if self.workers > 1 and partition is not None:
+            pool = ShardPool(self, apply, self.workers)
+
+        started = last_report = time.monotonic()
+        done = unchanged = 0
+
+        try:
+            for rows in self._read_chunks(path):
+                prints, skip = None, 0
+                if checkpoint is not None:
+                    # fingerprint tetap dihitung untuk baris yang dilewati,
+                    # supaya nomor kemunculan kunci batch tetap konsisten
+                    prints = [fingerprint(row) for row in rows]
+                    skip = min(len(rows), max(0, resume_from - done))
+                    if skip == len(rows):
+                        done += len(rows)
+                        continue
+                    prints = prints[skip:]
+
+                try:
+                    if pool is None:
+                        with transaction.atomic():
+                            unchanged += self.apply_rows(path.name, rows[skip:], prints, apply)
+                            if checkpoint is not None:
+                                checkpoint.rows_committed = done + len(rows)
+                                checkpoint.save(update_fields=["rows_committed", "updated_at"])
+                    else:
+                        todo = rows[skip:]
+                        unchanged += pool.run(path.name, todo, prints, partition(todo))
+                        if checkpoint is not None:
+                            # shard yang sudah commit tapi belum tercatat di checkpoint
+                            # akan tersaring fingerprint-nya saat resume
+                            checkpoint.rows_committed = done + len(rows)
+                            checkpoint.save(update_fields=["rows_committed", "updated_at"])
+                except Exception as exc:
+                    # baris 1 = header CSV
+                    message = (
+                        f"{label}: gagal di baris {done + 2}-{done + len(rows) + 1} "
+                        f"dari {path.name} ({exc}). {done} baris sebelumnya sudah tersimpan."
+                    )
+                    if isinstance(exc, PartialChunkError):
+                        # shard lain chunk ini sudah commit: tanpa fingerprint,
+                        # run ulang biasa akan mengimport baris itu dua kali
+                        message += (
+                            f" Chunk ini tersimpan sebagian: {exc.committed} baris dari worker "
+                            f"lain sudah commit. Jalankan ulang dengan --incremental supaya "
+                            f"baris yang sudah tersimpan dilewati."
+                        )
+                    raise CommandError(message) from exc
+
+                done += len(rows)
+                # kalau DEBUG=True, Django menyimpan semua query → buang per chunk
+                reset_queries()
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    self._report(label, done, now - started)
+                    last_report = now
+        finally:
+            if pool is not None:
+                pool.close()
+
+        if checkpoint is not None:
+            checkpoint.completed = True
+            checkpoint.save(update_fields=["completed", "updated_at"])
+            if unchanged:
+                self.stdout.write(f"  → {label}: {unchanged} baris tidak berubah, dilewati")
+
+        self._report(label, done, time.monotonic() - started, final=True)
+        return done
+
+    def _open_checkpoint(self, path: Path):
+        """
+        Ambil checkpoint file ini. Return None kalau isi file sama persis
+        dengan import terakhir yang sudah selesai (tidak ada yang perlu diproses).
+        """
+        file_hash = file_digest(path)
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            source=path.name,
+            defaults={"file_hash": file_hash},
+        )
+        if checkpoint.file_hash != file_hash:
+            # file berubah → mulai dari awal, fingerprint yang menyaring baris lama
+            checkpoint.file_hash = file_hash
+            checkpoint.rows_committed = 0
+            checkpoint.completed = False
+            checkpoint.save()
+        elif checkpoint.completed:
+            self.stdout.write(f"  → {path.name} tidak berubah sejak import terakhir, dilewati")
+            return None
+        return checkpoint
+
+    def apply_rows(self, source, rows, prints, apply):
+        """Proses satu chunk; return jumlah baris yang dilewati karena tidak berubah."""
+        if prints is None:
+            apply(rows)
+            return 0
+        return self._apply_changed(source, rows, prints, apply)
+
+    def _apply_changed(self, source, rows, prints, apply):
+        """Jalankan `apply` hanya untuk baris baru/berubah, lalu simpan fingerprint-nya."""
+        existing = {
+            fp.row_key: fp
+            for fp in ImportRowFingerprint.objects.filter(
+                source=source,
+                row_key__in={row_key for row_key, _ in prints},
+            )
+        }
+
+        pending = []
+        for row, (row_key, row_hash) in zip(rows, prints):
+            fp = existing.get(row_key)
+            if fp is not None and fp.row_hash == row_hash:
+                continue
+            row[OBJECT_PK] = fp.object_pk if fp is not None else ""
+            pending.append((row, row_key, row_hash))
+
+        if pending:
+            apply([row for row, _, _ in pending])
+
+        # kunci dobel dalam satu chunk → yang terakhir menang
+        fingerprints = {
+            row_key: ImportRowFingerprint(
+                source=source,
+                row_key=row_key,
+                row_hash=row_hash,
+                object_pk=str(row.get(OBJECT_PK) or ""),
+            )
+            for row, row_key, row_hash in pending
+        }
+        ImportRowFingerprint.objects.bulk_create(
+            fingerprints.values(),
+            batch_size=self.chunk_size,
+            update_conflicts=True,
+            unique_fields=["source", "row_key"],
+            update_fields=["row_hash", "object_pk", "updated_at"],
+        )
+        return len(rows) - len(pending)
+
+    def _report(self, label, done, elapsed, final=False):
+        rate = done / elapsed if elapsed > 0 else 0
+        message = f"  → {label}: {done} baris ({rate:,.0f} baris/detik)"
+        self.stdout.write(self.style.SUCCESS(message) if final else message)
+
+    # kunci partisi --workers: farm dari setiap baris
+
+    @staticmethod
+    def _farm_names(rows):
+        return [row["farm_name"].strip() for row in rows]
+
+    @staticmethod
+    def _batch_farms(rows):
+        kodes = [row["batch_kode"].strip() for row in rows]
+        farm_ids = dict(
+            HarvestBatch.objects.filter(pk__in=kodes).values_list("pk", "farm_id")
+        )
+        # kode yang tidak dikenal tetap dikirim ke satu shard supaya error-nya muncul
+        return [farm_ids.get(kode) for kode in kodes]
+
     # === LOADERS ===
 
     def load_cities(self, base_dir: Path):
         path = base_dir / "cities.csv"
         self.stdout.write(f"Import City dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 code = row["code"].strip()
                 name = row["name"].strip()
                 province = row["province"].strip()
@@ -76,12 +528,14 @@ class Command(BaseCommand):
                 #     city.province = row["province"].strip()
                 #     city.save(update_fields=["province"])
 
+        self.import_chunks(path, "City", apply)
+
     def load_laboratories(self, base_dir: Path):
         path = base_dir / "laboratories.csv"
         self.stdout.write(f"Import Laboratory dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 city = City.objects.get(name=row["city_name"].strip())
                 lab, created = Laboratory.objects.get_or_create(
                     nama=row["nama"].strip(),
@@ -91,12 +545,14 @@ class Command(BaseCommand):
                     lab.city = city
                     lab.save(update_fields=["city"])
 
+        self.import_chunks(path, "Laboratory", apply)
+
     def load_users(self, base_dir: Path):
         path = base_dir / "users.csv"
         self.stdout.write(f"Import User dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 username = row["username"].strip()
                 email = row["email"].strip()
                 role = row["role"].strip()
@@ -124,12 +580,14 @@ class Command(BaseCommand):
                         last_name=last_name,
                     )
 
+        self.import_chunks(path, "User", apply)
+
     def load_user_profiles(self, base_dir: Path):
         path = base_dir / "user_profiles.csv"
         self.stdout.write(f"Import UserProfile dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 username = row["username"].strip()
                 phone = (row.get("number_phone") or "").strip()
                 lab_name = (row.get("laboratory_name") or "").strip() or None
@@ -152,6 +610,8 @@ class Command(BaseCommand):
                     profile.laboratory = laboratory
                     profile.save()
 
+        self.import_chunks(path, "UserProfile", apply)
+
     def load_commodities(self, base_dir: Path):
         path = base_dir / "commodities.csv"
         self.stdout.write(f"Import Commodity dari {path} ...")
@@ -160,9 +620,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("  → File commodities.csv tidak ditemukan, lewati."))
             return
 
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+        def apply(rows):
+            for row in rows:
                 code = row["code"].strip()
                 name = row["name"].strip()
                 batas = parse_float(row.get("default_batas_aman_cs137"))
@@ -175,13 +634,14 @@ class Command(BaseCommand):
                     },
                 )
 
+        self.import_chunks(path, "Commodity", apply)
 
     def load_farms(self, base_dir: Path):
         path = base_dir / "farms.csv"
         self.stdout.write(f"Import Farm dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 city = City.objects.get(name=row["city_name"].strip())
 
                 owner_username = row["owner_username"].strip()
@@ -203,12 +663,14 @@ class Command(BaseCommand):
                     farm.owner = owner
                     farm.save()
 
+        self.import_chunks(path, "Farm", apply)
+
     def load_batches(self, base_dir: Path):
         path = base_dir / "batches.csv"
         self.stdout.write(f"Import HarvestBatch dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 farm = Farm.objects.get(name=row["farm_name"].strip())
                 is_shipped = parse_bool(row["is_shipped"])
 
@@ -222,25 +684,39 @@ class Command(BaseCommand):
                 tanggal_tebar = parse_date(tanggal_tebar_raw) if tanggal_tebar_raw else None
                 tanggal_panen = parse_date(tanggal_panen_raw)
 
-                # TIDAK mengisi kode_batch → akan di-generate otomatis di HarvestBatch.save()
-                batch = HarvestBatch(
-                    farm=farm,
-                    commodity=commodity,
-                    tanggal_tebar=tanggal_tebar,
-                    tanggal_panen=tanggal_panen,
-                    volume_kg=float(row["volume_kg"]),
-                    tujuan=row["tujuan"].strip(),
-                    is_shipped=is_shipped,
+                fields = {
+                    "farm": farm,
+                    "commodity": commodity,
+                    "tanggal_tebar": tanggal_tebar,
+                    "tanggal_panen": tanggal_panen,
+                    "volume_kg": float(row["volume_kg"]),
+                    "tujuan": row["tujuan"].strip(),
+                    "is_shipped": is_shipped,
                     # risk_score biarkan None, nanti dihitung setelah LabTest
-                )
+                }
+
+                # mode --incremental: baris yang berubah meng-update batch lamanya
+                batch = None
+                if row.get(OBJECT_PK):
+                    batch = HarvestBatch.objects.filter(pk=row[OBJECT_PK]).first()
+
+                if batch is None:
+                    # TIDAK mengisi kode_batch → akan di-generate otomatis di HarvestBatch.save()
+                    batch = HarvestBatch(**fields)
+                else:
+                    for name, value in fields.items():
+                        setattr(batch, name, value)
                 batch.save()
+                row[OBJECT_PK] = batch.pk
+
+        self.import_chunks(path, "HarvestBatch", apply, partition=self._farm_names)
 
     def load_activities(self, base_dir: Path):
         path = base_dir / "activities.csv"
         self.stdout.write(f"Import Activity (LAINNYA) dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 jenis = row["jenis"].strip()
                 if jenis != "LAINNYA":
                     # Abaikan jenis lain, supaya tidak bentrok
@@ -257,12 +733,14 @@ class Command(BaseCommand):
                     keterangan=(row.get("keterangan") or "").strip(),
                 )
 
+        self.import_chunks(path, "Activity", apply, partition=self._batch_farms)
+
     def load_lab_tests(self, base_dir: Path):
         path = base_dir / "lab_tests.csv"
         self.stdout.write(f"Import LabTest dari {path} ...")
-        with path.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+
+        def apply(rows):
+            for row in rows:
                 batch = HarvestBatch.objects.get(kode_batch=row["batch_kode"].strip())
                 qc_username = row["qc_username"].strip()
 
@@ -279,3 +757,341 @@ class Command(BaseCommand):
                     },
                 )
 
+        self.lab_tests_imported = self.import_chunks(path, "LabTest", apply, partition=self._batch_farms)
+
+    # === BULK LOADERS ===
+    # Dipakai kalau --bulk aktif. Lookup referensi dari dict
+    # (bukan .get() per baris), lalu setiap chunk ditulis sekaligus
+    # dengan bulk_create / bulk_update.
+
+    def bulk_load_cities(self, base_dir: Path):
+        path = base_dir / "cities.csv"
+        self.stdout.write(f"Import City (bulk) dari {path} ...")
+
+        def apply(rows):
+            # baris terakhir menang kalau ada kode dobel, sama seperti update_or_create berurutan
+            data = {
+                row["code"].strip(): (row["name"].strip(), row["province"].strip())
+                for row in rows
+            }
+            existing = City.objects.in_bulk(list(data), field_name="code")
+
+            to_create, to_update = [], []
+            moves = {}
+            for code, (name, province) in data.items():
+                city = existing.get(code)
+                if city is None:
+                    to_create.append(City(code=code, name=name, province=province))
+                elif (city.name, city.province) != (name, province):
+                    if city.province != province:
+                        moves[city.pk] = ((city.province, city.pk), (province, city.pk))
+                    city.name = name
+                    city.province = province
+                    to_update.append(city)
+
+            City.objects.bulk_create(to_create, batch_size=self.chunk_size)
+            City.objects.bulk_update(to_update, ["name", "province"], batch_size=self.chunk_size)
+            # bulk_update tidak mengirim post_save: nama kota ikut tampil di trace,
+            # dan batch kota yang pindah provinsi pindah wilayah di HarvestRollup
+            if to_update:
+                invalidate_trace(
+                    HarvestBatch.objects.filter(farm__city__in=to_update).values_list("pk", flat=True)
+                )
+            move_harvest_rollups("farm__city_id", moves)
+
+        self.import_chunks(path, "City", apply)
+
+    def bulk_load_laboratories(self, base_dir: Path):
+        path = base_dir / "laboratories.csv"
+        self.stdout.write(f"Import Laboratory (bulk) dari {path} ...")
+        cities = {c.name: c for c in City.objects.all()}
+
+        def apply(rows):
+            data = {
+                row["nama"].strip(): lookup(cities, row["city_name"].strip(), "City")
+                for row in rows
+            }
+            existing = {
+                lab.nama: lab for lab in Laboratory.objects.filter(nama__in=list(data))
+            }
+
+            to_create, to_update = [], []
+            for nama, city in data.items():
+                lab = existing.get(nama)
+                if lab is None:
+                    to_create.append(Laboratory(nama=nama, city=city))
+                elif lab.city_id != city.id:
+                    lab.city = city
+                    to_update.append(lab)
+
+            Laboratory.objects.bulk_create(to_create, batch_size=self.chunk_size)
+            Laboratory.objects.bulk_update(to_update, ["city"], batch_size=self.chunk_size)
+
+        self.import_chunks(path, "Laboratory", apply)
+
+    def bulk_load_users(self, base_dir: Path):
+        path = base_dir / "users.csv"
+        self.stdout.write(f"Import User (bulk) dari {path} ...")
+        created = updated = 0
+
+        def apply(rows):
+            nonlocal created, updated
+            c, u = bulk_provision_users(
+                [
+                    {key: (row[key] or "").strip() for key in (
+                        "username", "email", "role", "first_name", "last_name", "password",
+                    )}
+                    for row in rows
+                ],
+                executor=executor,
+                batch_size=self.chunk_size,
+            )
+            created += c
+            updated += u
+
+        # pool dibuka di luar transaksi chunk (lihat password_hasher_pool)
+        with password_hasher_pool(self.hash_workers) as executor:
+            self.import_chunks(path, "User", apply)
+        self.stdout.write(f"  → {created} user baru, {updated} user di-update")
+
+    def bulk_load_user_profiles(self, base_dir: Path):
+        # UserProfile.save punya logika sendiri (reset laboratory, set has_profile),
+        # jadi tetap disimpan per baris; yang dihemat adalah lookup User/Laboratory.
+        path = base_dir / "user_profiles.csv"
+        self.stdout.write(f"Import UserProfile (bulk lookup) dari {path} ...")
+        laboratories = {lab.nama: lab for lab in Laboratory.objects.all()}
+
+        def apply(rows):
+            usernames = [row["username"].strip() for row in rows]
+            users = User.objects.in_bulk(usernames, field_name="username")
+            profiles = {
+                p.user_id: p for p in UserProfile.objects.filter(user__in=users.values())
+            }
+
+            for row, username in zip(rows, usernames):
+                user = lookup(users, username, "User")
+                phone = (row.get("number_phone") or "").strip()
+                lab_name = (row.get("laboratory_name") or "").strip() or None
+                laboratory = lookup(laboratories, lab_name, "Laboratory") if lab_name else None
+
+                profile = profiles.get(user.pk) or UserProfile(user=user)
+                profile.user = user
+                profile.number_phone = phone or None
+                profile.laboratory = laboratory
+                profile.save()
+                profiles[user.pk] = profile
+
+        self.import_chunks(path, "UserProfile", apply)
+
+    def bulk_load_farms(self, base_dir: Path):
+        path = base_dir / "farms.csv"
+        self.stdout.write(f"Import Farm (bulk) dari {path} ...")
+        cities = {c.name: c for c in City.objects.all()}
+        owners = {
+            p.user.username: p for p in UserProfile.objects.select_related("user")
+        }
+
+        def apply(rows):
+            data = {}
+            for row in rows:
+                data[row["name"].strip()] = (
+                    lookup(cities, row["city_name"].strip(), "City"),
+                    row["location"].strip(),
+                    lookup(owners, row["owner_username"].strip(), "UserProfile"),
+                )
+            existing = {f.name: f for f in Farm.objects.filter(name__in=list(data))}
+            old_regions = farm_regions([farm.pk for farm in existing.values()])
+
+            to_create, to_update = [], []
+            for name, (city, location, owner) in data.items():
+                farm = existing.get(name)
+                if farm is None:
+                    to_create.append(Farm(name=name, city=city, location=location, owner=owner))
+                else:
+                    farm.city = city
+                    farm.location = location
+                    farm.owner = owner
+                    to_update.append(farm)
+
+            Farm.objects.bulk_create(to_create, batch_size=self.chunk_size)
+            Farm.objects.bulk_update(
+                to_update, ["city", "location", "owner"], batch_size=self.chunk_size
+            )
+            # bulk_update tidak mengirim post_save; lokasi farm ikut tampil di trace
+            if to_update:
+                invalidate_trace(
+                    HarvestBatch.objects.filter(farm__in=to_update).values_list("pk", flat=True)
+                )
+            # dan batch farm yang pindah kota pindah wilayah di HarvestRollup
+            new_regions = farm_regions(old_regions)
+            move_harvest_rollups(
+                "farm_id",
+                {farm_id: (old_regions[farm_id], new_regions[farm_id]) for farm_id in old_regions},
+            )
+
+        self.import_chunks(path, "Farm", apply)
+
+    def _farm_map(self):
+        """Farm per nama (pelaku timeline diambil create_default_activities)."""
+        return {farm.name: farm for farm in Farm.objects.all()}
+
+    @staticmethod
+    def _reserve_codes(items):
+        """
+        Pesan kode_batch untuk semua batch baru di chunk ini: satu
+        increment BatchCodeSequence per kombinasi farm + tanggal panen.
+        """
+        counts = Counter((farm, tanggal_panen) for _, farm, _, _, tanggal_panen in items)
+        return {
+            key: iter(reserve_batch_codes(key[0], key[1], count))
+            for key, count in counts.items()
+        }
+
+    def bulk_load_batches(self, base_dir: Path):
+        path = base_dir / "batches.csv"
+        self.stdout.write(f"Import HarvestBatch (bulk) dari {path} ...")
+        farms = self._farm_map()
+        commodities = {c.code: c for c in Commodity.objects.all()}
+        rules = get_active_rule_set()
+
+        def apply(rows):
+            parsed = []
+            for row in rows:
+                tanggal_tebar_raw = (row.get("tanggal_tebar") or "").strip()
+                parsed.append((
+                    row,
+                    lookup(farms, row["farm_name"].strip(), "Farm"),
+                    lookup(commodities, row["commodity"].strip(), "Commodity"),
+                    parse_date(tanggal_tebar_raw) if tanggal_tebar_raw else None,
+                    parse_date(row["tanggal_panen"].strip()),
+                ))
+
+            # mode --incremental: baris yang berubah meng-update batch lamanya
+            existing = HarvestBatch.objects.in_bulk(
+                [row[OBJECT_PK] for row, *_ in parsed if row.get(OBJECT_PK)]
+            )
+            new_rows = [item for item in parsed if item[0].get(OBJECT_PK) not in existing]
+
+            codes = self._reserve_codes(new_rows)
+
+            batches, to_update = [], []
+            for row, farm, commodity, tanggal_tebar, tanggal_panen in parsed:
+                batch = existing.get(row.get(OBJECT_PK))
+                if batch is None:
+                    batch = HarvestBatch(kode_batch=next(codes[farm, tanggal_panen]))
+                    batches.append(batch)
+                else:
+                    # bulk_update tidak mengisi auto_now
+                    batch.updated_at = timezone.now()
+                    to_update.append(batch)
+
+                batch.farm = farm
+                batch.commodity = commodity
+                batch.tanggal_tebar = tanggal_tebar
+                batch.tanggal_panen = tanggal_panen
+                batch.volume_kg = float(row["volume_kg"])
+                batch.tujuan = row["tujuan"].strip()
+                batch.is_shipped = parse_bool(row["is_shipped"])
+                # bulk_create / bulk_update tidak memanggil HarvestBatch.save()
+                batch.shipment_status = batch.compute_shipment_status(rules)
+                row[OBJECT_PK] = batch.kode_batch
+
+            HarvestBatch.objects.bulk_update(
+                to_update,
+                [
+                    "farm", "commodity", "tanggal_tebar", "tanggal_panen",
+                    "volume_kg", "tujuan", "is_shipped", "shipment_status", "updated_at",
+                ],
+                batch_size=self.chunk_size,
+            )
+            # bulk_create tidak memanggil HarvestBatch.save(), jadi timeline
+            # default diisi di sini juga
+            HarvestBatch.objects.bulk_create(batches, batch_size=self.chunk_size)
+            create_default_activities(batches, batch_size=self.chunk_size)
+            # begitu juga signal-nya: FarmRiskBucket, FarmSummary, HarvestRollup,
+            # Cs137Rollup, antrian uji lab dan trace lewat satu pintu
+            apply_batch_side_effects(
+                [
+                    (batch.pk, batch._batch_state, batch_state(batch))
+                    for batch in {batch.pk: batch for batch in to_update}.values()
+                ]
+                + [(batch.pk, None, batch_state(batch)) for batch in batches]
+            )
+
+        self.import_chunks(path, "HarvestBatch", apply, partition=self._farm_names)
+
+    def bulk_load_activities(self, base_dir: Path):
+        path = base_dir / "activities.csv"
+        self.stdout.write(f"Import Activity (LAINNYA, bulk) dari {path} ...")
+
+        def apply(rows):
+            rows = [row for row in rows if row["jenis"].strip() == "LAINNYA"]
+            kodes = {row["batch_kode"].strip() for row in rows}
+            known = set(
+                HarvestBatch.objects.filter(pk__in=kodes).values_list("pk", flat=True)
+            )
+            # pengganti get_or_create: kunci activity yang sudah ada diambil sekali
+            seen = set(
+                Activity.objects.filter(batch_id__in=known, jenis="LAINNYA")
+                .values_list("batch_id", "tanggal", "lokasi", "pelaku", "keterangan")
+            )
+
+            to_create = []
+            for row in rows:
+                kode = row["batch_kode"].strip()
+                if kode not in known:
+                    raise CommandError(f"HarvestBatch '{kode}' tidak ditemukan")
+                key = (
+                    kode,
+                    parse_date(row["tanggal"].strip()),
+                    row["lokasi"].strip(),
+                    row["pelaku"].strip(),
+                    (row.get("keterangan") or "").strip(),
+                )
+                if key in seen:
+                    continue
+                seen.add(key)
+                to_create.append(Activity(
+                    batch_id=kode,
+                    tanggal=key[1],
+                    jenis="LAINNYA",
+                    lokasi=key[2],
+                    pelaku=key[3],
+                    keterangan=key[4],
+                ))
+
+            Activity.objects.bulk_create(to_create, batch_size=self.chunk_size)
+            apply_farm_summary_deltas(activity_summary_deltas(to_create))
+            invalidate_trace({activity.batch_id for activity in to_create})
+
+        self.import_chunks(path, "Activity", apply, partition=self._batch_farms)
+
+    def bulk_load_lab_tests(self, base_dir: Path):
+        # LabTest tetap di-save per baris (kesimpulan dihitung di save), tapi
+        # efek sampingnya (risk batch/farm, UJI_LAB, SIAP_EKSPOR) ditunda dan
+        # dikerjakan sekali per batch/farm di akhir setiap chunk.
+        path = base_dir / "lab_tests.csv"
+        self.stdout.write(f"Import LabTest (bulk lookup, efek samping ditunda) dari {path} ...")
+        qc_profiles = {
+            p.user.username: p for p in UserProfile.objects.select_related("user")
+        }
+
+        def apply(rows):
+            kodes = [row["batch_kode"].strip() for row in rows]
+            batches = HarvestBatch.objects.select_related("commodity").in_bulk(kodes)
+            lab_tests = LabTest.objects.in_bulk(kodes, field_name="batch_id")
+
+            with defer_labtest_side_effects():
+                for row, kode in zip(rows, kodes):
+                    batch = lookup(batches, kode, "HarvestBatch")
+
+                    lab_test = lab_tests.get(kode) or LabTest(batch=batch)
+                    lab_test.batch = batch
+                    lab_test.qc = lookup(qc_profiles, row["qc_username"].strip(), "UserProfile")
+                    lab_test.nilai_cs137 = parse_float(row["nilai_cs137"])
+                    lab_test.tanggal_uji = row["tanggal_uji"].strip()
+                    lab_test.save()
+                    lab_tests[kode] = lab_test
+
+        self.lab_tests_imported = self.import_chunks(path, "LabTest", apply, partition=self._batch_farms)
+
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from labs.ingest import GAGAL, ingest_lab_results, read_lab_results
+from labs.models import Laboratory
+from profiles.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Import hasil uji lab dari file ekspor instrumen (CSV / JSON): "
+        "kolom kode_batch, nilai_cs137, tanggal_uji."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str, help="File .csv atau .json")
+        parser.add_argument(
+            "--qc",
+            required=True,
+            help="Username lab assistant yang menguji",
+        )
+        parser.add_argument(
+            "--lab",
+            help="Nama laboratorium (default: laboratorium lab assistant)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validasi saja, tidak ada yang disimpan",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Cetak laporan per baris sebagai JSON",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"File {path} tidak ditemukan")
+
+        qc = (
+            UserProfile.objects.select_related("user", "laboratory")
+            .filter(user__username=options["qc"], user__role="labAssistant")
+            .first()
+        )
+        if qc is None:
+            raise CommandError(f"Lab assistant '{options['qc']}' tidak ditemukan")
+
+        lab = qc.laboratory
+        if options["lab"]:
+            lab = Laboratory.objects.filter(nama=options["lab"]).first()
+            if lab is None:
+                raise CommandError(f"Laboratory '{options['lab']}' tidak ditemukan")
+
+        try:
+            with path.open(encoding="utf-8-sig") as f:
+                records = read_lab_results(f, path.name)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = ingest_lab_results(records, qc=qc, lab=lab, dry_run=options["dry_run"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report.as_dicts(), indent=2, ensure_ascii=False))
+            return
+
+        for row in report.rows:
+            if row.status == GAGAL:
+                self.stdout.write(f"Baris {row.baris} ({row.kode_batch or '-'}): {row.pesan}")
+
+        verb = "valid" if report.dry_run else "disimpan"
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.created} hasil uji {verb}, {report.failed} baris gagal."
+        ))
@@ -0,0 +1,84 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from labs.feed import LabFeedListener
+from labs.models import Laboratory
+from profiles.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Jalankan listener hasil uji Cs-137 dari detektor (TCP per baris atau "
+        "HTTP POST chunked). Hasil disimpan per micro-batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--qc",
+            required=True,
+            help="Username lab assistant pemilik detektor",
+        )
+        parser.add_argument(
+            "--lab",
+            help="Nama laboratorium (default: laboratorium lab assistant)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Maksimal pembacaan per micro-batch (default 200)",
+        )
+        parser.add_argument(
+            "--max-wait",
+            type=float,
+            default=0.5,
+            help="Maksimal detik menunggu micro-batch penuh (default 0.5)",
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=2000,
+            help="Maksimal pembacaan yang menunggu disimpan sebelum koneksi ditahan (default 2000)",
+        )
+
+    def handle(self, *args, **options):
+        qc = (
+            UserProfile.objects.select_related("user", "laboratory")
+            .filter(user__username=options["qc"], user__role="labAssistant")
+            .first()
+        )
+        if qc is None:
+            raise CommandError(f"Lab assistant '{options['qc']}' tidak ditemukan")
+
+        lab = qc.laboratory
+        if options["lab"]:
+            lab = Laboratory.objects.filter(nama=options["lab"]).first()
+            if lab is None:
+                raise CommandError(f"Laboratory '{options['lab']}' tidak ditemukan")
+
+        listener = LabFeedListener(
+            qc=qc,
+            lab=lab,
+            batch_size=options["batch_size"],
+            max_wait=options["max_wait"],
+            queue_size=options["queue_size"],
+        )
+
+        def ready(server):
+            address = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+            self.stdout.write(f"Listener hasil uji lab berjalan di {address} (Ctrl+C untuk berhenti).")
+
+        try:
+            asyncio.run(listener.serve(options["host"], options["port"], ready=ready))
+        except KeyboardInterrupt:
+            pass
+
+        stats = listener.stats
+        self.stdout.write(
+            f"{stats.diterima} pembacaan diterima dari {stats.koneksi} koneksi: "
+            f"{stats.disimpan} disimpan, {stats.gagal} gagal, "
+            f"{stats.batches} micro-batch (terbesar {stats.batch_terbesar})."
+        )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from labs.utils import process_labtest_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker antrian efek samping uji lab (LabTestSideEffect): hitung ulang "
+        "risk batch / farm dan buat activity, digabung per putaran."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Maksimal entri antrian per putaran (default 500)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Jeda (detik) saat antrian kosong (default 1)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Kosongkan antrian lalu berhenti, tanpa menunggu entri baru",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = process_labtest_queue(limit=options["batch_size"])
+                total += processed
+                if processed:
+                    self.stdout.write(f"{processed} entri antrian dikerjakan.")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Selesai, {total} entri dikerjakan."))
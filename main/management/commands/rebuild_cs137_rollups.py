@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from labs.rollup import rebuild_cs137_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Bangun ulang rollup Cs-137 per farm / komoditas / bulan uji (Cs137Rollup) "
+        "dari seluruh hasil uji lab."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_cs137_rollups()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} hasil uji dirangkum ({elapsed:.1f} detik)."
+        ))
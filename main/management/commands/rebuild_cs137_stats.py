@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from labs.anomaly import rebuild_cs137_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Bangun ulang statistik Cs-137 per farm / komoditas (Cs137Stat) dan "
+        "tanda anomali LabTest dari seluruh histori uji lab."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_cs137_stats()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} hasil uji diputar ulang ({elapsed:.1f} detik)."
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from farms.summary import refresh_farm_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Bangun ulang FarmSummary (ringkasan dashboard owner) dari tabel batch, "
+        "uji lab dan activity. Untuk perbaikan manual; biasanya dijaga otomatis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--farm",
+            type=int,
+            action="append",
+            dest="farms",
+            help="Hanya farm dengan id ini (boleh diulang)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = refresh_farm_summaries(options["farms"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} FarmSummary dibangun ulang ({elapsed:.1f} detik)."
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from batches.rollup import rebuild_harvest_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Bangun ulang rollup nasional batch per provinsi / kota / komoditas / bulan "
+        "panen (HarvestRollup) untuk dashboard admin. Jalankan sekali setelah migrate; "
+        "selanjutnya dijaga otomatis."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_harvest_rollups()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} baris HarvestRollup dibangun ulang ({elapsed:.1f} detik)."
+        ))
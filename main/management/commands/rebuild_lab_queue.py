@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from labs.workqueue import rebuild_pending_lab_tests
+
+
+class Command(BaseCommand):
+    help = (
+        "Bangun ulang antrian uji lab QC (PendingLabTest) dari semua batch yang "
+        "belum punya LabTest. Claim yang masih berjalan dipertahankan."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_pending_lab_tests()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} batch di antrian uji lab ({elapsed:.1f} detik)."
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from batches.risk import recompute_risk, recompute_risk_sql
+
+
+class Command(BaseCommand):
+    help = (
+        "Hitung ulang kesimpulan LabTest, quality_status/risk_score batch dan "
+        "risk_score farm untuk semua data sekaligus (misal setelah batas Cs-137 "
+        "komoditas diubah). Hanya baris yang berubah yang ditulis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Jumlah baris per query bulk_update (default: 5000)",
+        )
+        parser.add_argument(
+            "--sql",
+            action="store_true",
+            help="Hitung di database (UPDATE dengan CASE dari rule set aktif), tanpa memuat baris ke memori",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Hanya hitung berapa yang akan berubah, tanpa menulis ke database",
+        )
+
+    def handle(self, *args, **options):
+        if options["sql"] and options["dry_run"]:
+            raise CommandError("--dry-run belum didukung bersama --sql")
+
+        started = time.monotonic()
+        if options["sql"]:
+            result = recompute_risk_sql()
+        else:
+            result = recompute_risk(
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+        elapsed = time.monotonic() - started
+
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(
+            f"{prefix}{result.total_batches} batch dihitung ulang dalam {elapsed:.1f} detik: "
+            f"{result.batches} batch, {result.lab_tests} lab test, "
+            f"{result.farms} farm berubah."
+        )
+        self.stdout.write(self.style.SUCCESS("Recompute risk selesai."))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from batches.risk import recompute_risk
+from farms.utils import rebuild_risk_buckets, refresh_farm_risk
+
+
+class Command(BaseCommand):
+    help = (
+        "Hitung ulang Farm Risk Score dari FarmRiskBucket. Jalankan harian "
+        "(cron) supaya window 180 hari ikut bergeser walau tidak ada uji lab baru."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild-buckets",
+            action="store_true",
+            help="Bangun ulang FarmRiskBucket dari tabel batch sebelum menghitung",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        if options["rebuild_buckets"]:
+            rebuild_risk_buckets()
+            self.stdout.write("FarmRiskBucket dibangun ulang dari tabel batch.")
+
+        changed = refresh_farm_risk()
+        if changed:
+            # risk batch memakai risk farm sebagai penalti, dan shipment_status
+            # mengikuti risk batch: hitung ulang batch farm yang berubah saja,
+            # kecuali yang sudah dikirim (risk-nya tetap risk saat dikirim)
+            result = recompute_risk(farm_ids=changed, skip_shipped=True)
+            self.stdout.write(f"{result.batches} batch ikut berubah risk / status kirim-nya.")
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{len(changed)} farm berubah risk score-nya ({elapsed:.1f} detik).")
+        self.stdout.write(self.style.SUCCESS("Refresh farm risk selesai."))
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from batches.models import HarvestBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulasi detektor: kirim pembacaan Cs-137 untuk batch yang belum diuji "
+        "ke lab_feed_listener dengan laju tertentu, lalu ukur throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=1000,
+            help="Jumlah pembacaan (maksimal sebanyak batch yang belum diuji)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Pembacaan per detik untuk semua koneksi (0 = secepatnya)",
+        )
+        parser.add_argument(
+            "--connections",
+            type=int,
+            default=1,
+            help="Jumlah detektor (koneksi) paralel",
+        )
+        parser.add_argument(
+            "--http",
+            action="store_true",
+            help="Kirim lewat HTTP POST chunked, bukan TCP per baris",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        kodes = list(
+            HarvestBatch.objects.filter(lab_test__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: options["count"]]
+        )
+        if not kodes:
+            raise CommandError("Tidak ada batch yang belum diuji")
+
+        rng = random.Random(options["seed"])
+        today = date.today().isoformat()
+        lines = [
+            json.dumps({
+                "kode_batch": kode,
+                # sebagian besar jauh di bawah batas, sebagian kecil di atasnya
+                "nilai_cs137": round(rng.lognormvariate(4.5, 0.8), 1),
+                "tanggal_uji": today,
+            })
+            for kode in kodes
+        ]
+
+        n = max(1, options["connections"])
+        shares = [lines[i::n] for i in range(n)]
+        rate = options["rate"] / n if options["rate"] else 0
+        send = self._send_http if options["http"] else self._send_stream
+
+        async def run():
+            return await asyncio.gather(
+                *(send(options["host"], options["port"], share, rate) for share in shares if share)
+            )
+
+        started = time.monotonic()
+        try:
+            results = asyncio.run(run())
+        except ConnectionError as e:
+            raise CommandError(f"Tidak bisa terhubung ke listener: {e}")
+        elapsed = time.monotonic() - started
+
+        replies = [reply for replies, _ in results for reply in replies]
+        latencies = sorted(latency for _, latencies in results for latency in latencies)
+        ok = sum(reply.get("status") == "OK" for reply in replies)
+
+        self.stdout.write(
+            f"{len(replies)} pembacaan dalam {elapsed:.2f} detik "
+            f"({len(replies) / elapsed:.0f}/detik): {ok} OK, {len(replies) - ok} gagal."
+        )
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f"Latensi kirim → balasan: p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms.")
+
+    @staticmethod
+    async def _pace(started, i, rate):
+        if rate:
+            await asyncio.sleep(max(0, started + i / rate - time.monotonic()))
+
+    async def _send_stream(self, host, port, lines, rate):
+        reader, writer = await asyncio.open_connection(host, port)
+        sent_at = deque()
+        replies, latencies = [], []
+
+        async def receive():
+            while len(replies) < len(lines):
+                line = await reader.readline()
+                if not line:
+                    break
+                replies.append(json.loads(line))
+                latencies.append(time.monotonic() - sent_at.popleft())
+
+        receiver = asyncio.create_task(receive())
+        started = time.monotonic()
+        for i, line in enumerate(lines):
+            await self._pace(started, i, rate)
+            sent_at.append(time.monotonic())
+            writer.write(line.encode() + b"\n")
+            await writer.drain()
+        writer.write_eof()
+        await receiver
+        writer.close()
+        return replies, latencies
+
+    async def _send_http(self, host, port, lines, rate):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            b"POST /readings HTTP/1.1\r\n"
+            + f"Host: {host}:{port}\r\n".encode()
+            + b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        started = time.monotonic()
+        sent_at = []
+        for i, line in enumerate(lines):
+            await self._pace(started, i, rate)
+            chunk = line.encode() + b"\n"
+            sent_at.append(time.monotonic())
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+        response = await reader.read()
+        finished = time.monotonic()
+        writer.close()
+        _, _, body = response.partition(b"\r\n\r\n")
+        replies = [json.loads(line) for line in body.splitlines() if line]
+        return replies, [finished - t for t in sent_at]
@@ -1,3 +1,45 @@
 from django.db import models
 
 # Create your models here.
+
+class ImportCheckpoint(models.Model):
+    """
+    Posisi terakhir yang sudah di-commit `import_data --incremental`
+    untuk satu file CSV. Dipakai untuk melanjutkan import yang
+    terputus dan melewati file yang isinya tidak berubah.
+    """
+
+    source = models.CharField(max_length=100, unique=True)  # nama file, misal "batches.csv"
+    file_hash = models.CharField(max_length=64)  # sha256 isi file
+    rows_committed = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.rows_committed} baris)"
+
+
+class ImportRowFingerprint(models.Model):
+    """
+    Hash isi satu baris CSV per natural key-nya, supaya re-run hanya
+    memproses baris yang baru atau berubah.
+    """
+
+    source = models.CharField(max_length=100)
+    row_key = models.CharField(max_length=64)  # sha256 dari kolom kunci baris
+    row_hash = models.CharField(max_length=64)  # sha256 dari seluruh isi baris
+    # pk objek hasil baris ini (misal kode_batch), supaya baris yang berubah
+    # meng-update objek lama dan tidak membuat objek baru
+    object_pk = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "row_key"],
+                name="unique_import_row_fingerprint",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.source}:{self.row_key[:12]}"
@@ -1,3 +1,99 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase
+
+from batches.models import Activity, HarvestBatch, HarvestRollup
+from farms.models import Farm, FarmRiskBucket, FarmSummary
+from labs.models import Cs137Rollup, Cs137Stat, LabTest, PendingLabTest
+from main.management.commands.import_data import Command as ImportDataCommand
+
+DATA_DIR = str(settings.BASE_DIR / "data")
+
+
+def _workers_supported():
+    # --workers butuh database file yang bisa dibuka beberapa proses;
+    # SQLite juga harus memakai transaction_mode IMMEDIATE (lihat settings)
+    return ImportDataCommand()._workers_unsupported() is None
+
+
+class ImportDataModeTests(TransactionTestCase):
+    """Semua mode import_data harus menghasilkan isi database yang sama."""
+
+    def import_data(self, *args):
+        call_command("flush", interactive=False, verbosity=0)
+        call_command(
+            "import_data", "--data-dir", DATA_DIR, "--chunk-size", "2", *args, stdout=StringIO()
+        )
+        return self.snapshot()
+
+    def snapshot(self):
+        # pakai natural key, bukan pk autoincrement yang bisa berbeda antar run
+        return {
+            "farm": sorted(Farm.objects.values_list("name", "city__code", "owner__user__username", "risk_score")),
+            "batch": sorted(HarvestBatch.objects.values_list(
+                "kode_batch", "farm__name", "commodity__code", "tanggal_panen", "volume_kg",
+                "quality_status", "risk_score", "shipment_status", "is_shipped",
+            )),
+            "activity": sorted(Activity.objects.values_list("batch_id", "tanggal", "jenis", "lokasi", "pelaku")),
+            "lab_test": sorted(LabTest.objects.values_list(
+                "batch_id", "nilai_cs137", "kesimpulan", "tanggal_uji",
+                "anomali_z_farm", "anomali_z_komoditas", "is_anomali",
+            )),
+            "summary": sorted(FarmSummary.objects.values_list(
+                "farm__name", "total_batch", "batch_aman", "batch_pending", "batch_masalah",
+                "volume_kg", "risk_total", "risk_count", "sudah_diuji", "jumlah_aktivitas",
+                "aktivitas_terakhir",
+            )),
+            "bucket": sorted(FarmRiskBucket.objects.filter(total__gt=0).values_list(
+                "farm__name", "day", "total", "masalah"
+            )),
+            "harvest_rollup": sorted(HarvestRollup.objects.values_list(
+                "province", "city__code", "commodity__code", "month",
+                "jumlah_batch", "volume_kg", "ditahan", "dikirim", "diuji",
+            ), key=str),
+            "cs137_rollup": sorted(Cs137Rollup.objects.values_list(
+                "farm__name", "commodity__code", "month", "count", "total", "min_nilai", "max_nilai"
+            )),
+            "cs137_stat": sorted(Cs137Stat.objects.values_list("farm__name", "commodity__code", "n", "mean"), key=str),
+            "queue": sorted(PendingLabTest.objects.values_list("batch_id", "city__code", "tanggal_panen")),
+        }
+
+    def test_bulk_matches_serial(self):
+        serial = self.import_data()
+        self.assertEqual(len(serial["batch"]), 5)
+        self.assertEqual(self.import_data("--bulk"), serial)
+
+    def test_incremental_matches_serial(self):
+        serial = self.import_data()
+        self.assertEqual(self.import_data("--incremental"), serial)
+
+        # run kedua tanpa perubahan file tidak menulis apa pun
+        call_command("import_data", "--data-dir", DATA_DIR, "--incremental", stdout=StringIO())
+        self.assertEqual(self.snapshot(), serial)
+
+    def test_workers_matches_serial(self):
+        if not _workers_supported():
+            self.skipTest("--workers butuh database file yang bisa ditulis beberapa proses")
+        serial = self.import_data()
+        self.assertEqual(self.import_data("--workers", "2"), serial)
+        self.assertEqual(self.import_data("--bulk", "--workers", "2"), serial)
+
+    def test_workers_partial_chunk_fails_loudly(self):
+        if not _workers_supported():
+            self.skipTest("--workers butuh database file yang bisa ditulis beberapa proses")
+        with tempfile.TemporaryDirectory() as data_dir:
+            shutil.copytree(DATA_DIR, data_dir, dirs_exist_ok=True)
+            path = Path(data_dir) / "batches.csv"
+            # farm Makassar jatuh di shard lain dari Indramayu / Pacitan
+            path.write_text(path.read_text().replace("Makassar Jaya,UDANG", "Makassar Jaya,TIDAK-ADA"))
+            with self.assertRaisesMessage(CommandError, "Chunk ini tersimpan sebagian: 4 baris"):
+                call_command(
+                    "import_data", "--data-dir", data_dir, "--workers", "2",
+                    stdout=StringIO(), stderr=StringIO(),
+                )
+        self.assertEqual(HarvestBatch.objects.count(), 4)
@@ -7,5 +7,9 @@ app_name = 'main'
 urlpatterns = [
     path('', landing_page, name='landing'),
     path('dashboard/', views.dashboard_switcher, name='dashboard_switcher'), 
+    path('dashboard/owner/', views.dashboard_owner, name='dashboard_owner'),
+    path('dashboard/admin/', views.dashboard_admin, name='dashboard_admin'),
     path('dashboard/qc/', views.dashboard_qc, name='dashboard_qc'),
+    path('dashboard/qc/claim/', views.qc_claim, name='qc_claim'),
+    path('dashboard/qc/release/', views.qc_release, name='qc_release'),
 ]
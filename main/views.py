@@ -6,8 +6,15 @@ from django.shortcuts import redirect, render
 
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from batches.models import HarvestBatch # Asumsi model Batch ada di app 'batches'
+from django.views.decorators.http import require_POST
+from django.utils import timezone
+from batches.models import Commodity, HarvestBatch, HarvestRollup # Asumsi model Batch ada di app 'batches'
+from batches.rollup import harvest_rollup, harvest_rollups
+from batches.trace import get_trace_snapshot
+from farms.models import Farm, FarmSummary
+from farms.summary import SUMMARY_COUNTERS
 from labs.models import LabTest # Asumsi model LabTest ada di app 'labs'
+from labs.workqueue import LAB_CLAIM_MAX, available_for, claim_batches, my_claims, release_claims
 from profiles.models import UserProfile # Asumsi model UserProfile ada di app 'profiles'
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -16,36 +23,143 @@ def home(request):
 
 def is_lab_assistant(user):
     # Pastikan user sudah login dan memiliki role 'labAssistant'
-    return user.is_authenticated and hasattr(user, 'userprofile') and user.userprofile.role == 'labAssistant'
+    return user.is_authenticated and user.role == 'labAssistant' and hasattr(user, 'profile')
+
+def is_farm_owner(user):
+    return user.is_authenticated and user.role == 'farmOwner' and hasattr(user, 'profile')
+
+@login_required
+def dashboard_owner(request):
+    if not is_farm_owner(request.user):
+        return redirect('main:landing')
+
+    user_profile = request.user.profile
+
+    # Satu query: farm milik owner + baris FarmSummary-nya (farms.summary),
+    # tanpa agregat ke tabel batch / uji lab / activity
+    farms = Farm.objects.filter(owner=user_profile).select_related('city', 'summary').order_by('name')
+    ringkasan_farm = []
+    total = FarmSummary()
+    for farm in farms:
+        summary = getattr(farm, 'summary', None) or FarmSummary(farm=farm)  # farm tanpa batch
+        ringkasan_farm.append(summary)
+        for name in SUMMARY_COUNTERS:
+            setattr(total, name, getattr(total, name) + getattr(summary, name))
+
+    context = {
+        'ringkasan_farm': ringkasan_farm,
+        'total': total,
+        'user_profile': user_profile,
+    }
+    return render(request, 'dashboard/owner_dashboard.html', context)
+
+def is_admin(user):
+    return user.is_authenticated and user.role == 'admin'
+
+# jumlah bulan di tren dashboard admin
+ADMIN_TREND_MONTHS = 12
+
+@login_required
+def dashboard_admin(request):
+    if not is_admin(request.user):
+        return redirect('main:landing')
+
+    province = request.GET.get('province') or None
+    commodity_id = request.GET.get('commodity', '')
+    commodity = Commodity.objects.filter(pk=commodity_id).first() if commodity_id.isdigit() else None
+
+    # bulan pertama tren: ADMIN_TREND_MONTHS - 1 bulan sebelum bulan ini
+    bulan_ini = timezone.localdate().replace(day=1)
+    index = bulan_ini.year * 12 + bulan_ini.month - ADMIN_TREND_MONTHS
+    awal = bulan_ini.replace(year=index // 12, month=index % 12 + 1)
+
+    # Semua angka dibaca dari HarvestRollup (batches.rollup): satu baris
+    # per total / wilayah / komoditas / bulan, tanpa join ke tabel batch
+    tren = {row.month: row for row in harvest_rollups(
+        'month', province=province, commodity=commodity, since=awal, until=bulan_ini
+    )}
+    bulan = []
+    for i in range(ADMIN_TREND_MONTHS):
+        index = awal.year * 12 + awal.month - 1 + i
+        month = awal.replace(year=index // 12, month=index % 12 + 1)
+        bulan.append(tren.get(month) or HarvestRollup(month=month))  # bulan tanpa panen
+
+    context = {
+        'total': harvest_rollup(province=province, commodity=commodity),
+        'per_wilayah': harvest_rollups('city' if province else 'province', province=province, commodity=commodity),
+        'per_komoditas': harvest_rollups('commodity', province=province),
+        'tren': bulan,
+        'tren_max': max(row.volume_kg for row in bulan) or 1,
+        'province': province,
+        'commodity': commodity,
+        'commodities': Commodity.objects.order_by('name'),
+    }
+    return render(request, 'dashboard/admin_dashboard.html', context)
 
 @login_required
 def dashboard_qc(request):
     if not is_lab_assistant(request.user):
         # Handle jika role bukan QC, misalnya redirect ke dashboard yang sesuai atau ke home
-        return redirect('home') 
+        return redirect('main:landing') 
 
-    user_profile = request.user.userprofile
+    user_profile = request.user.profile
     
-    # 1. Batch yang Belum Diuji Lab (Membutuhkan Aksi)
-    # Filter Batch yang is_deleted=False DAN lab_test__isnull=True
-    batches_pending_test = HarvestBatch.objects.filter(
-        is_deleted=False
-    ).exclude(
-        lab_test__isnull=False # Exclude batch yang sudah memiliki LabTest
-    ).order_by('tanggal_panen')
+    # 1. Batch yang sedang dipegang QC ini + sisa antrian di kota labnya (labs.workqueue)
+    klaim_saya = my_claims(user_profile).select_related('batch__farm')
+    antrian = available_for(user_profile)
+    jumlah_antrian = antrian.count()
+    antrian_teratas = antrian.select_related('batch__farm')[:10]
     
     # 2. Histori Batch yang Pernah Diuji (Oleh QC yang sedang login)
     histori_lab_test = LabTest.objects.filter(
         qc=user_profile
     ).select_related('batch', 'lab').order_by('-tanggal_uji') # Optimasi query
     
+    # 3. Hasil uji yang ditandai anomali (labs.anomaly), terbaru dulu
+    anomali_lab_test = LabTest.objects.filter(
+        is_anomali=True
+    ).select_related('batch__farm', 'batch__commodity').order_by('-tanggal_uji')[:20]
+    
     context = {
-        'batches_pending_test': batches_pending_test,
+        'klaim_saya': klaim_saya,
+        'antrian_teratas': antrian_teratas,
+        'jumlah_antrian': jumlah_antrian,
+        'claim_max': LAB_CLAIM_MAX,
         'histori_lab_test': histori_lab_test,
+        'anomali_lab_test': anomali_lab_test,
         'user_profile': user_profile,
     }
     return render(request, 'dashboard_qc.html', context)
 
+@login_required
+@require_POST
+def qc_claim(request):
+    """Ambil N batch berikutnya dari antrian uji lab kota QC."""
+    if not is_lab_assistant(request.user):
+        return redirect('main:landing')
+
+    try:
+        jumlah = int(request.POST.get('jumlah', 10))
+    except ValueError:
+        jumlah = 10
+    kode = claim_batches(request.user.profile, jumlah)
+    if kode:
+        messages.success(request, f"{len(kode)} batch diambil dari antrian uji lab.")
+    else:
+        messages.info(request, "Antrian uji lab kosong, tidak ada batch yang bisa diambil.")
+    return redirect('main:dashboard_qc')
+
+@login_required
+@require_POST
+def qc_release(request):
+    """Kembalikan batch yang dipegang (semua, atau satu kode_batch) ke antrian."""
+    if not is_lab_assistant(request.user):
+        return redirect('main:landing')
+
+    kode_batch = request.POST.get('kode_batch')
+    release_claims(request.user.profile, [kode_batch] if kode_batch else None)
+    return redirect('main:dashboard_qc')
+
 @login_required
 def dashboard_switcher(request):
     user = request.user
@@ -60,7 +174,7 @@ def dashboard_switcher(request):
         # Tangani kasus jika userprofile tidak ada
         messages.error(request, "Profil pengguna tidak ditemukan. Silakan hubungi admin.")
         # Lakukan redirect ke home (atau view login/profile setup)
-        return redirect('home') 
+        return redirect('main:landing') 
 
     role = user_profile.role # Akses role setelah yakin user_profile ada
     
@@ -72,15 +186,15 @@ def dashboard_switcher(request):
         return redirect('main:dashboard_admin')
     else:
         messages.warning(request, "Role pengguna tidak dikenal.")
-        return redirect('home')
+        return redirect('main:landing')
     
 def landing_page(request):
     kode_batch = (request.GET.get("kode_batch") or "").strip()
 
     if kode_batch:
-        # Coba cari batch, kalau ada langsung redirect
-        if HarvestBatch.objects.filter(pk=kode_batch).exists():
-            return redirect("batches:batch_detail", pk=kode_batch)
+        # Coba cari batch (lewat snapshot trace), kalau ada langsung redirect
+        if get_trace_snapshot(kode_batch) is not None:
+            return redirect("batches:batch_trace", pk=kode_batch)
         else:
             messages.error(request, "Batch dengan kode tersebut tidak ditemukan.")
 
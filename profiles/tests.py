@@ -1,3 +1,76 @@
-from django.test import TestCase
+from django.contrib.auth.hashers import check_password, make_password
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from authentication.models import User
+from profiles.models import UserProfile
+from profiles.utils import bulk_provision_users, hash_passwords, is_password_hash, password_hasher_pool
+
+
+def user_row(username, password="rahasia123", **extra):
+    return {
+        "username": username,
+        "email": f"{username}@example.com",
+        "role": "farmOwner",
+        "first_name": username.title(),
+        "last_name": "Tambak",
+        "password": password,
+        **extra,
+    }
+
+
+class HashPasswordsTests(SimpleTestCase):
+    def test_pre_hashed_passwords_are_kept(self):
+        hashed = make_password("sudah-di-hash")
+        self.assertTrue(is_password_hash(hashed))
+        self.assertFalse(is_password_hash("rahasia123"))
+        self.assertFalse(is_password_hash("tidak-dikenal$rahasia"))
+
+        result = hash_passwords(["rahasia123", hashed, "lain456"])
+        self.assertEqual(result[1], hashed)
+        self.assertTrue(check_password("rahasia123", result[0]))
+        self.assertTrue(check_password("lain456", result[2]))
+
+    def test_pool_matches_in_process(self):
+        hashed = make_password("sudah-di-hash")
+        passwords = ["rahasia123", hashed, "lain456"]
+        with password_hasher_pool(2) as executor:
+            self.assertIsNotNone(executor)
+            result = hash_passwords(passwords, executor=executor)
+        self.assertEqual(result[1], hashed)
+        self.assertTrue(check_password("rahasia123", result[0]))
+        self.assertTrue(check_password("lain456", result[2]))
+
+        with password_hasher_pool(1) as executor:
+            self.assertIsNone(executor)
+
+
+class BulkProvisionUsersTests(TestCase):
+    def test_create_and_update(self):
+        existing = User.objects.create_user(
+            username="lama", email="lama@example.com", password="tetap789", role="farmOwner"
+        )
+        # user lama tanpa profile ikut dibuatkan
+        UserProfile.objects.filter(user=existing).delete()
+        hashed = make_password("sudah-di-hash")
+
+        created, updated = bulk_provision_users([
+            user_row("baru"),
+            user_row("hash", password=hashed),
+            user_row("lama", role="labAssistant", password="diabaikan"),
+            user_row("baru", first_name="Terakhir"),
+        ])
+        self.assertEqual((created, updated), (2, 1))
+
+        baru = User.objects.get(username="baru")
+        self.assertEqual(baru.first_name, "Terakhir")
+        self.assertTrue(baru.check_password("rahasia123"))
+        self.assertEqual(User.objects.get(username="hash").password, hashed)
+
+        # password user lama tidak disentuh
+        lama = User.objects.get(username="lama")
+        self.assertEqual(lama.role, "labAssistant")
+        self.assertTrue(lama.check_password("tetap789"))
+
+        for user in User.objects.all():
+            self.assertTrue(user.has_profile)
+            self.assertTrue(UserProfile.objects.filter(user=user).exists())
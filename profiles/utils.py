@@ -0,0 +1,131 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import connections
+
+from authentication.models import User
+from .models import UserProfile
+
+
+def is_password_hash(value: str) -> bool:
+    """True kalau value sudah berupa hash Django (misal 'pbkdf2_sha256$...')."""
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+@contextmanager
+def password_hasher_pool(workers: int):
+    """
+    Pool proses untuk hashing password (PBKDF2 berat di CPU).
+    workers <= 1 → None, hashing dilakukan di proses ini.
+
+    Buka pool ini di luar transaksi: koneksi DB ditutup dulu
+    supaya tidak ikut diwariskan ke proses anak lewat fork.
+    """
+    if workers <= 1:
+        yield None
+        return
+
+    connections.close_all()
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+    )
+    try:
+        # paksa semua proses di-fork sekarang, sebelum ada koneksi baru
+        list(executor.map(int, range(workers)))
+        yield executor
+    finally:
+        executor.shutdown()
+
+
+def hash_passwords(passwords, executor=None):
+    """Hash daftar password; yang sudah berupa hash Django dipakai apa adanya."""
+    todo = [i for i, password in enumerate(passwords) if not is_password_hash(password)]
+    raw = [passwords[i] for i in todo]
+
+    if executor is None:
+        hashed = [make_password(password) for password in raw]
+    else:
+        # satu hash PBKDF2 sudah ratusan milidetik, chunk kecil cukup
+        hashed = list(executor.map(make_password, raw, chunksize=8))
+
+    result = list(passwords)
+    for i, value in zip(todo, hashed):
+        result[i] = value
+    return result
+
+
+def bulk_provision_users(rows, executor=None, batch_size=1000):
+    """
+    Buat / update banyak User sekaligus beserta UserProfile-nya.
+
+    rows: list dict dengan key username, email, role, first_name,
+    last_name, password (plain atau hash Django).
+
+    - User baru dibuat dengan bulk_create, password di-hash di `executor`
+      (lihat password_hasher_pool) atau dipakai langsung kalau sudah hash
+    - UserProfile kosong dibuat dengan bulk_create, pengganti signal
+      post_save yang tidak jalan di bulk_create
+    - has_profile langsung True, sama seperti efek UserProfile.save()
+    - User lama hanya di-update email/role/nama (password tidak disentuh,
+      sama seperti import per baris); yang belum punya profile dibuatkan
+
+    Return (jumlah dibuat, jumlah di-update).
+    """
+    # baris terakhir menang kalau username dobel
+    data = {User.normalize_username(row["username"]): row for row in rows}
+    existing = User.objects.in_bulk(list(data), field_name="username")
+
+    new_usernames = [username for username in data if username not in existing]
+    passwords = hash_passwords(
+        [data[username]["password"] for username in new_usernames],
+        executor=executor,
+    )
+
+    to_create = []
+    for username, password in zip(new_usernames, passwords):
+        row = data[username]
+        to_create.append(User(
+            username=username,
+            email=User.objects.normalize_email(row["email"]),
+            role=row["role"],
+            first_name=row["first_name"],
+            last_name=row["last_name"],
+            password=password,
+            has_profile=True,
+        ))
+
+    to_update = []
+    for username, user in existing.items():
+        row = data[username]
+        user.email = row["email"]
+        user.role = row["role"]
+        user.first_name = row["first_name"]
+        user.last_name = row["last_name"]
+        to_update.append(user)
+
+    User.objects.bulk_create(to_create, batch_size=batch_size)
+    User.objects.bulk_update(
+        to_update, ["email", "role", "first_name", "last_name"], batch_size=batch_size
+    )
+
+    # profile untuk user baru + user lama yang (karena sebab apa pun) belum punya
+    with_profile = set(
+        UserProfile.objects.filter(user__in=to_update).values_list("user_id", flat=True)
+    )
+    missing = [user for user in to_update if user.pk not in with_profile]
+    UserProfile.objects.bulk_create(
+        [UserProfile(user=user) for user in to_create + missing],
+        batch_size=batch_size,
+    )
+    User.objects.filter(pk__in=[user.pk for user in missing], has_profile=False).update(
+        has_profile=True
+    )
+
+    return len(to_create), len(to_update)